@@ -0,0 +1,127 @@
+"""
+Build the conversations collection (the inbox) from direct_messages and message_groups.
+
+send_direct_message / send_group_message keep conversations up to date from now on; run
+this once after deploying so existing threads show up in the inbox. Every message is
+stamped with its seq in the conversation, and DM read cursors are derived from the old
+per-message is_read flags (group members start caught up). Everything is recomputed and
+overwritten, so re-running is safe (stop the app first so live updates are not lost).
+
+Usage: python backfill_conversations.py
+"""
+import argparse
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+
+BATCH_SIZE = 1000
+
+async def stamp_sequence_numbers(collection, thread_key, on_message):
+    """Number each thread's messages 1..n in (created_at, id) order, calling on_message for each"""
+    counts = {}
+    batch = []
+    async for msg in collection.find({}).sort([("created_at", 1), ("id", 1)]):
+        key = thread_key(msg)
+        counts[key] = counts.get(key, 0) + 1
+        on_message(key, counts[key], msg)
+        batch.append(UpdateOne({"_id": msg['_id']}, {"$set": {"seq": counts[key]}}))
+        if len(batch) >= BATCH_SIZE:
+            await collection.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.bulk_write(batch, ordered=False)
+    return counts
+
+async def backfill_conversations():
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('DB_NAME', 'test_database')]
+
+    # A DM participant has read up to the first message they received unread, until a later
+    # message they received is marked read; a sender who was caught up stays caught up past
+    # their own message (as send_direct_message does)
+    threads = {}
+
+    def track_direct_message(key, seq, msg):
+        thread = threads.setdefault(key, {"cursors": {}, "blocked": set(), "first": msg, "last": msg})
+        thread['last'] = msg
+        if msg.get('is_read', True) is False:
+            thread['blocked'].add(msg['receiver_id'])
+        else:
+            thread['blocked'].discard(msg['receiver_id'])
+        for participant in key:
+            if participant not in thread['blocked']:
+                thread['cursors'][participant] = {"seq": seq, "last_read_at": msg['created_at']}
+
+    counts = await stamp_sequence_numbers(
+        db.direct_messages,
+        lambda msg: tuple(sorted([msg['sender_id'], msg['receiver_id']])),
+        track_direct_message
+    )
+
+    batch = []
+    for key, thread in threads.items():
+        last = thread['last']
+        batch.append(UpdateOne(
+            {"id": "dm:" + ":".join(key)},
+            {
+                "$set": {
+                    "type": "direct",
+                    "participant_ids": list(key),
+                    "last_message": {k: last[k] for k in ("id", "sender_id", "receiver_id", "content", "created_at")},
+                    "last_activity_at": last['created_at'],
+                    "message_count": counts[key],
+                    "read_cursors": thread['cursors']
+                },
+                "$setOnInsert": {"created_at": thread['first']['created_at']}
+            },
+            upsert=True
+        ))
+        if len(batch) >= BATCH_SIZE:
+            await db.conversations.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        await db.conversations.bulk_write(batch, ordered=False)
+    print(f"✅ Wrote {len(threads)} direct conversations")
+
+    group_counts = await stamp_sequence_numbers(db.group_messages, lambda msg: msg['group_id'], lambda *args: None)
+
+    groups = 0
+    async for group in db.message_groups.find({}, {"_id": 0, "id": 1, "member_ids": 1, "created_at": 1}):
+        last_message = await db.group_messages.find_one(
+            {"group_id": group['id']},
+            {"_id": 0, "id": 1, "group_id": 1, "sender_id": 1, "content": 1, "created_at": 1},
+            sort=[("created_at", -1), ("id", -1)]
+        )
+        if last_message:
+            sender = await db.users.find_one({"id": last_message['sender_id']}, {"_id": 0, "name": 1})
+            last_message['sender_name'] = sender['name'] if sender else None
+        last_activity_at = last_message['created_at'] if last_message else group['created_at']
+        message_count = group_counts.get(group['id'], 0)
+        await db.conversations.update_one(
+            {"id": f"group:{group['id']}"},
+            {
+                "$set": {
+                    "type": "group",
+                    "group_id": group['id'],
+                    "participant_ids": group.get('member_ids', []),
+                    "last_message": last_message,
+                    "last_activity_at": last_activity_at,
+                    "message_count": message_count,
+                    "read_cursors": {
+                        member_id: {"seq": message_count, "last_read_at": last_activity_at}
+                        for member_id in group.get('member_ids', [])
+                    }
+                },
+                "$setOnInsert": {"created_at": group['created_at']}
+            },
+            upsert=True
+        )
+        groups += 1
+    print(f"✅ Wrote {groups} group conversations")
+
+    client.close()
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description=__doc__).parse_args()
+    asyncio.run(backfill_conversations())
@@ -0,0 +1,60 @@
+"""
+Rebuild per-user daily point buckets from point_transactions.
+
+award_points keeps point_buckets up to date from now on; run this once after deploying
+so week/month leaderboards include earlier activity. Bucket totals are recomputed and
+overwritten, so re-running is safe (stop the app first so live increments are not lost).
+
+Usage: python backfill_point_buckets.py [--days 30]
+"""
+import argparse
+import asyncio
+from datetime import datetime, timezone, timedelta
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+
+BATCH_SIZE = 1000
+
+async def backfill_point_buckets(days: int):
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('DB_NAME', 'test_database')]
+
+    match = {}
+    if days:
+        start_day = (datetime.now(timezone.utc).date() - timedelta(days=days - 1)).isoformat()
+        match = {"created_at": {"$gte": start_day}}
+
+    # created_at is stored as an ISO string; its first 10 characters are the UTC day
+    totals = db.point_transactions.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "day": {"$substr": ["$created_at", 0, 10]}},
+            "points": {"$sum": "$points"}
+        }}
+    ])
+
+    batch = []
+    written = 0
+    async for total in totals:
+        batch.append(UpdateOne(
+            {"user_id": total['_id']['user_id'], "day": total['_id']['day']},
+            {"$set": {"points": total['points']}},
+            upsert=True
+        ))
+        if len(batch) >= BATCH_SIZE:
+            await db.point_buckets.bulk_write(batch, ordered=False)
+            written += len(batch)
+            batch = []
+    if batch:
+        await db.point_buckets.bulk_write(batch, ordered=False)
+        written += len(batch)
+
+    print(f"✅ Wrote {written} point buckets")
+    client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=0, help="Only rebuild the last N days (default: all history)")
+    args = parser.parse_args()
+    asyncio.run(backfill_point_buckets(args.days))
@@ -0,0 +1,53 @@
+"""
+Set is_pinned: false on posts that lack a boolean is_pinned.
+
+GET /spaces/{space_id}/feed matches unpinned posts with an equality on is_pinned so the
+space_pinned_desc_created_id index returns them already in (created_at, id) order; posts
+written before the field was always stored would otherwise drop out of the feed. Re-running
+is safe. The superseded space_pinned_created_id index (is_pinned ascending) is dropped,
+and afterwards the feed query's winning plan is printed for one space so you can
+confirm it has no in-memory SORT stage.
+
+Usage: python backfill_post_pinned.py
+"""
+import argparse
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+
+def plan_stages(plan):
+    """Flatten an explain() plan tree into its stage names"""
+    stages = [plan['stage']]
+    for child in [plan.get('inputStage')] + plan.get('inputStages', []):
+        if child:
+            stages.extend(plan_stages(child))
+    return stages
+
+async def backfill_post_pinned():
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('DB_NAME', 'test_database')]
+
+    result = await db.posts.update_many(
+        {"is_pinned": {"$nin": [True, False]}},
+        {"$set": {"is_pinned": False}}
+    )
+    print(f"✅ Set is_pinned on {result.modified_count} posts")
+
+    if "space_pinned_created_id" in await db.posts.index_information():
+        await db.posts.drop_index("space_pinned_created_id")
+        print("✅ Dropped superseded index space_pinned_created_id")
+
+    post = await db.posts.find_one({}, {"_id": 0, "space_id": 1})
+    if post:
+        explain = await db.posts.find(
+            {"space_id": post['space_id'], "is_pinned": False}, {"_id": 0}
+        ).sort([("created_at", -1), ("id", -1)]).limit(20).explain()
+        stages = plan_stages(explain['queryPlanner']['winningPlan'])
+        verdict = "⚠️ in-memory SORT" if "SORT" in stages else "✅ no SORT stage"
+        print(f"Feed plan: {' <- '.join(stages)} ({verdict})")
+
+    client.close()
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description=__doc__).parse_args()
+    asyncio.run(backfill_post_pinned())
@@ -0,0 +1,107 @@
+"""
+Benchmark email delivery inline in the request vs. through the email outbox worker pool.
+
+Uses the file transport (or the SMTP sink with --transport smtp) wrapped with a simulated
+provider round-trip, so it runs offline against the MongoDB in MONGO_URL / DB_NAME.
+Reports how long a handler spends on email in both modes and the outbox drain throughput.
+Only the benchmark's own outbox documents are touched and they are removed afterwards.
+
+Usage: python benchmark_email_outbox.py [--emails 200] [--workers 4] [--latency-ms 150] [--rate 50]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+import server
+
+
+class SimulatedLatencyTransport(server.EmailTransport):
+    """Adds a fixed provider round-trip in front of a real local transport"""
+    name = "simulated"
+
+    def __init__(self, inner: server.EmailTransport, latency_seconds: float):
+        self.inner = inner
+        self.latency_seconds = latency_seconds
+
+    async def send(self, to_email: str, subject: str, html_content: str) -> None:
+        await asyncio.sleep(self.latency_seconds)
+        await self.inner.send(to_email, subject, html_content)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_inline(transport, emails: int, run_id: str):
+    handler_latencies = []
+    started = time.perf_counter()
+    for i in range(emails):
+        request_started = time.perf_counter()
+        await transport.send(f"bench-{i}@example.com", f"[{run_id}] inline {i}", "<p>benchmark</p>")
+        handler_latencies.append((time.perf_counter() - request_started) * 1000)
+    return handler_latencies, emails / (time.perf_counter() - started)
+
+
+async def run_outbox(transport, emails: int, workers: int, rate: float, run_id: str):
+    queue = asyncio.Queue(maxsize=server.EMAIL_OUTBOX_BATCH_SIZE)
+    rate_limiter = server.EmailRateLimiter(rate)
+    tasks = [asyncio.create_task(server.email_outbox_worker(queue, transport, rate_limiter)) for _ in range(workers)]
+    tasks.append(asyncio.create_task(server.email_outbox_dispatcher(queue)))
+
+    handler_latencies = []
+    started = time.perf_counter()
+    for i in range(emails):
+        request_started = time.perf_counter()
+        await server.enqueue_email(f"bench-{i}@example.com", f"[{run_id}] outbox {i}", "<p>benchmark</p>")
+        handler_latencies.append((time.perf_counter() - request_started) * 1000)
+
+    while await server.db.email_outbox.count_documents({"subject": {"$regex": f"^\\[{run_id}\\]"}, "status": "sent"}) < emails:
+        await asyncio.sleep(0.05)
+    throughput = emails / (time.perf_counter() - started)
+
+    for task in tasks:
+        task.cancel()
+    return handler_latencies, throughput
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--emails", type=int, default=200, help="Emails to send in each mode")
+    parser.add_argument("--workers", type=int, default=4, help="Outbox workers (EMAIL_OUTBOX_WORKERS)")
+    parser.add_argument("--latency-ms", type=float, default=150, help="Simulated provider round-trip")
+    parser.add_argument("--rate", type=float, default=50, help="Send rate limit (EMAIL_RATE_LIMIT_PER_SECOND)")
+    parser.add_argument("--transport", choices=["file", "smtp"], default="file")
+    args = parser.parse_args()
+
+    if args.transport == "smtp":
+        inner = server.build_email_transport("smtp")
+    else:
+        inner = server.FileEmailTransport(os.path.join(tempfile.mkdtemp(), "outbox.jsonl"))
+    transport = SimulatedLatencyTransport(inner, args.latency_ms / 1000)
+    run_id = uuid.uuid4().hex[:8]
+
+    print(f"📧 {args.emails} emails, {args.latency_ms:.0f} ms provider latency, "
+          f"{args.workers} workers, {args.rate:.0f}/s rate limit, {args.transport} transport\n")
+
+    try:
+        for mode in ("inline", "outbox"):
+            if mode == "inline":
+                latencies, throughput = await run_inline(transport, args.emails, run_id)
+            else:
+                latencies, throughput = await run_outbox(transport, args.emails, args.workers, args.rate, run_id)
+            print(f"[{mode:>6}] handler p50 {statistics.median(latencies):8.2f} ms | "
+                  f"handler p99 {percentile(latencies, 99):8.2f} ms | "
+                  f"delivered {throughput:.1f} emails/s")
+    finally:
+        await server.db.email_outbox.delete_many({"subject": {"$regex": f"^\\[{run_id}\\]"}})
+        server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+"""
+Benchmark end-to-end delivery latency of the real-time message bus.
+
+Runs two MongoMessageBus instances in one process as stand-ins for two uvicorn workers
+sharing the MongoDB in MONGO_URL: "worker A" publishes, "worker B" tails the capped
+collection and delivers. The in-memory bus (single worker) is measured for comparison.
+Uses a scratch database (<DB_NAME>_bus_bench) that is dropped afterwards.
+
+Usage: python benchmark_realtime_bus.py [--messages 1000] [--rate 200]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import server
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(publisher: server.MessageBus, subscriber: server.MessageBus, messages: int, rate: float):
+    latencies = []
+    done = asyncio.Event()
+
+    def receive(user_ids, message):
+        latencies.append((time.perf_counter() - message['sent_at']) * 1000)
+        if len(latencies) == messages:
+            done.set()
+
+    subscriber.subscribe(receive)
+    if publisher is not subscriber:
+        publisher.subscribe(lambda user_ids, message: None)
+    started = time.perf_counter()
+    for i in range(messages):
+        await publisher.publish(["bench-user"], {"type": "new_message", "n": i, "sent_at": time.perf_counter()})
+        await asyncio.sleep(1 / rate)
+    await asyncio.wait_for(done.wait(), timeout=30)
+    return latencies, messages / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=1000, help="Messages to publish per backend")
+    parser.add_argument("--rate", type=float, default=200, help="Publish rate (messages/s)")
+    args = parser.parse_args()
+
+    bench_db_name = f"{server.db.name}_bus_bench"
+    server.db = server.client[bench_db_name]
+    await server.client.drop_database(bench_db_name)
+
+    print(f"📡 {args.messages} messages at {args.rate:.0f}/s per backend\n")
+    try:
+        memory = server.InMemoryMessageBus()
+        worker_a = server.MongoMessageBus("realtime_bus", 16 * 1024 * 1024)
+        worker_b = server.MongoMessageBus("realtime_bus", 16 * 1024 * 1024)
+        await worker_a.start()
+        await worker_b.start()
+        await asyncio.sleep(0.5)
+
+        for backend, publisher, subscriber in (("memory", memory, memory), ("mongo", worker_a, worker_b)):
+            latencies, throughput = await run(publisher, subscriber, args.messages, args.rate)
+            print(f"[{backend:>6}] delivery p50 {statistics.median(latencies):8.2f} ms | "
+                  f"p99 {percentile(latencies, 99):8.2f} ms | "
+                  f"max {max(latencies):8.2f} ms | {throughput:.0f} messages/s")
+
+        await worker_a.stop()
+        await worker_b.stop()
+    finally:
+        await server.client.drop_database(bench_db_name)
+        server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,160 @@
+"""
+Benchmark the spaces directory (GET /api/spaces) with per-space membership/join-request
+lookups vs. the batched version in server.get_spaces.
+
+Seeds a scratch database (<DB_NAME>_spaces_bench on MONGO_URL) with 100 spaces and 100k
+users, then reports per-call latency and MongoDB round-trips for both versions. The
+scratch database is dropped afterwards.
+
+Usage: python benchmark_spaces_directory.py [--spaces 100] [--users 100000] [--iterations 50]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from datetime import datetime, timezone
+
+import server
+
+INSERT_BATCH_SIZE = 5000
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def legacy_get_spaces(user: server.User):
+    """The directory as it was: count all users, then two lookups per space"""
+    db = server.db
+    spaces = await db.spaces.find({}, {"_id": 0}).sort("order", 1).to_list(100)
+    total_members = await db.users.count_documents({"archived": {"$ne": True}})
+
+    visible_spaces = []
+    for space in spaces:
+        is_admin = user.role == 'admin'
+        membership = await db.space_memberships.find_one({"space_id": space['id'], "user_id": user.id}, {"_id": 0})
+        is_member = is_admin or bool(membership)
+        if space.get('visibility') == 'secret' and not is_member:
+            continue
+        space['is_member'] = is_member
+        space['membership_status'] = membership.get('status') if membership else None
+        space['membership_role'] = membership.get('role') if membership else None
+        if not is_member:
+            pending_request = await db.join_requests.find_one({
+                "user_id": user.id,
+                "space_id": space['id'],
+                "status": "pending"
+            }, {"_id": 0})
+            space['has_pending_request'] = bool(pending_request)
+            space['pending_request_id'] = pending_request.get('id') if pending_request else None
+        else:
+            space['has_pending_request'] = False
+            space['pending_request_id'] = None
+        if space.get('auto_join'):
+            space['member_count'] = total_members
+        visible_spaces.append(space)
+    return visible_spaces
+
+
+async def seed(spaces: int, users: int) -> server.User:
+    db = server.db
+    now = datetime.now(timezone.utc).isoformat()
+
+    space_docs = [{
+        "id": str(uuid.uuid4()),
+        "name": f"Space {i}",
+        "order": i,
+        "visibility": "secret" if i % 10 == 9 else ("private" if i % 4 == 3 else "public"),
+        "auto_join": i % 5 == 0,
+        "member_count": 0,
+        "created_at": now,
+    } for i in range(spaces)]
+    await db.spaces.insert_many(space_docs)
+
+    for start in range(0, users, INSERT_BATCH_SIZE):
+        await db.users.insert_many([{
+            "id": str(uuid.uuid4()),
+            "email": f"bench-{i}@example.com",
+            "name": f"Member {i}",
+            "role": "learner",
+            "archived": i % 50 == 0,
+            "total_points": 0,
+            "created_at": now,
+        } for i in range(start, min(start + INSERT_BATCH_SIZE, users))])
+
+    caller = server.User(id=str(uuid.uuid4()), email="caller@example.com", name="Caller", role="learner")
+    await db.space_memberships.insert_many([{
+        "id": str(uuid.uuid4()),
+        "space_id": space['id'],
+        "user_id": caller.id,
+        "role": "member",
+        "status": "member",
+        "joined_at": now,
+    } for space in space_docs[::3]])
+    await db.join_requests.insert_many([{
+        "id": str(uuid.uuid4()),
+        "space_id": space['id'],
+        "user_id": caller.id,
+        "status": "pending",
+        "requested_at": now,
+    } for space in space_docs[1::6]])
+
+    for collection_name, indexes in server.INDEX_CATALOG.items():
+        if collection_name in ("users", "spaces", "space_memberships", "join_requests", "counters"):
+            await db[collection_name].create_indexes(indexes)
+    await server.reconcile_community_member_count()
+    return caller
+
+
+async def measure(fn, user: server.User, iterations: int):
+    latencies = []
+    db_calls = []
+    result = None
+    for _ in range(iterations):
+        ctx = server.RequestContext()
+        token = server.request_context.set(ctx)
+        started = time.perf_counter()
+        try:
+            result = await fn(user=user)
+        finally:
+            server.request_context.reset(token)
+        latencies.append((time.perf_counter() - started) * 1000)
+        db_calls.append(ctx.db_calls)
+    return latencies, db_calls, result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--spaces", type=int, default=100, help="Spaces in the directory")
+    parser.add_argument("--users", type=int, default=100000, help="Community members")
+    parser.add_argument("--iterations", type=int, default=50, help="Directory loads per version")
+    args = parser.parse_args()
+
+    bench_db_name = f"{server.db.name}_spaces_bench"
+    server.db = server.client[bench_db_name]
+    await server.client.drop_database(bench_db_name)
+
+    print(f"🗂️  {args.spaces} spaces, {args.users} users, {args.iterations} loads per version\n")
+    try:
+        caller = await seed(args.spaces, args.users)
+        results = {}
+        for version, fn in (("per-space", legacy_get_spaces), ("batched", server.get_spaces)):
+            latencies, db_calls, results[version] = await measure(fn, caller, args.iterations)
+            print(f"[{version:>9}] p50 {statistics.median(latencies):8.2f} ms | "
+                  f"p99 {percentile(latencies, 99):8.2f} ms | "
+                  f"{statistics.median(db_calls):.0f} MongoDB round-trips per load")
+
+        if results["per-space"] != results["batched"]:
+            print("⚠️ Versions returned different directories")
+        else:
+            print(f"\n✅ Both versions returned the same {len(results['batched'])} spaces")
+    finally:
+        await server.client.drop_database(bench_db_name)
+        server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""
+Move embedded reaction maps ({emoji: [user_ids]}) on posts and comments into the
+reactions collection and replace them with per-emoji reaction_counts.
+
+Safe to re-run: reactions already migrated are skipped, and counts are recomputed
+from the reactions collection.
+"""
+import asyncio
+from datetime import datetime, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import os
+
+TARGETS = {"post": "posts", "comment": "comments"}
+
+async def migrate_reactions():
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('DB_NAME', 'test_database')]
+
+    await db.reactions.create_index(
+        [("target_type", 1), ("target_id", 1), ("user_id", 1), ("emoji", 1)],
+        name="target_user_emoji_unique",
+        unique=True
+    )
+
+    for target_type, collection_name in TARGETS.items():
+        collection = db[collection_name]
+        migrated = 0
+        async for doc in collection.find({"reactions": {"$exists": True}}, {"_id": 0, "id": 1, "reactions": 1}):
+            now = datetime.now(timezone.utc).isoformat()
+            upserts = [
+                UpdateOne(
+                    {"target_type": target_type, "target_id": doc['id'], "user_id": user_id, "emoji": emoji},
+                    {"$setOnInsert": {"created_at": now}},
+                    upsert=True
+                )
+                for emoji, user_ids in (doc.get('reactions') or {}).items()
+                for user_id in set(user_ids)
+            ]
+            if upserts:
+                try:
+                    await db.reactions.bulk_write(upserts, ordered=False)
+                except BulkWriteError as e:
+                    print(f"⚠️ {collection_name} {doc['id']}: {len(e.details.get('writeErrors', []))} reactions not migrated")
+                    continue
+
+            counts = await db.reactions.aggregate([
+                {"$match": {"target_type": target_type, "target_id": doc['id']}},
+                {"$group": {"_id": "$emoji", "count": {"$sum": 1}}}
+            ]).to_list(None)
+            await collection.update_one(
+                {"id": doc['id']},
+                {
+                    "$set": {"reaction_counts": {c['_id']: c['count'] for c in counts}},
+                    "$unset": {"reactions": ""}
+                }
+            )
+            migrated += 1
+
+        print(f"✅ Migrated reactions on {migrated} {collection_name}")
+
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate_reactions())
@@ -1,10 +1,29 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Depends, Header, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.websockets import WebSocketState
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, CursorType, IndexModel, InsertOne, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, OperationFailure
+from cachetools import TTLCache
+from sortedcontainers import SortedList
+from abc import ABC, abstractmethod
+import asyncio
+import heapq
+import math
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
 import os
+import base64
+import json
+import random
+import smtplib
+import socket
+import time
 import logging
+from email.message import EmailMessage
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
 from typing import List, Optional, Dict, Any
@@ -21,9 +40,30 @@ from google.auth.transport import requests as google_requests
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Request-scoped state: DB call counter and batch loaders (set by the request context middleware)
+class RequestContext:
+    def __init__(self):
+        self.db_calls = 0
+        self.user_loaders = {}
+
+request_context: ContextVar[Optional[RequestContext]] = ContextVar('request_context', default=None)
+
+class DBCallCounter(monitoring.CommandListener):
+    """Counts MongoDB commands issued on behalf of the current request (Motor propagates contextvars)"""
+    def started(self, event):
+        ctx = request_context.get()
+        if ctx is not None:
+            ctx.db_calls += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[DBCallCounter()])
 db = client[os.environ['DB_NAME']]
 
 # Payment gateway clients
@@ -343,7 +383,7 @@ class Post(BaseModel):
     links: List[str] = []
     tags: List[str] = []
     is_pinned: bool = False
-    reactions: Dict[str, List[str]] = {}  # {emoji: [user_ids]}
+    reaction_counts: Dict[str, int] = {}  # {emoji: count}; who reacted lives in db.reactions
     comment_count: int = 0
     view_count: int = 0
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -357,7 +397,7 @@ class Comment(BaseModel):
     author_id: str
     content: str
     parent_comment_id: Optional[str] = None
-    reactions: Dict[str, List[str]] = {}
+    reaction_counts: Dict[str, int] = {}
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 # Event Models
@@ -387,7 +427,7 @@ class DirectMessage(BaseModel):
     sender_id: str
     receiver_id: str
     content: str
-    is_read: bool = False
+    seq: int = 0  # position in the conversation, see read_cursors
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
@@ -408,6 +448,7 @@ class GroupMessage(BaseModel):
     group_id: str
     sender_id: str
     content: str
+    seq: int = 0  # position in the conversation, see read_cursors
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 # Message Settings Models
@@ -453,8 +494,292 @@ class InviteToken(BaseModel):
     expires_at: datetime
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+# ==================== DATABASE INDEXES ====================
+
+def _index(name: str, keys: list, **options) -> IndexModel:
+    """Build a named index model. Every index is built in the background so startup never blocks writes."""
+    return IndexModel(keys, name=name, background=True, **options)
+
+# Declared index catalog: collection -> indexes required by the API's query shapes.
+# Index names are stable so the catalog can be diffed against the live database.
+INDEX_CATALOG: Dict[str, List[IndexModel]] = {
+    "users": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+        _index("email_unique", [("email", ASCENDING)], unique=True),
+        # Users without a code have referral_code=None, so only index real codes
+        _index("referral_code_unique", [("referral_code", ASCENDING)], unique=True,
+               partialFilterExpression={"referral_code": {"$type": "string"}}),
+        _index("role", [("role", ASCENDING)]),
+        _index("referred_by", [("referred_by", ASCENDING)]),
+        _index("archived_total_points", [("archived", ASCENDING), ("total_points", DESCENDING)]),
+    ],
+    "user_sessions": [
+        _index("session_token_unique", [("session_token", ASCENDING)], unique=True),
+        _index("user_id", [("user_id", ASCENDING)]),
+        _index("expires_at", [("expires_at", ASCENDING)]),
+    ],
+    "spaces": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+        _index("space_group_order", [("space_group_id", ASCENDING), ("order", ASCENDING)]),
+        _index("auto_join", [("auto_join", ASCENDING)]),
+    ],
+    "space_groups": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+    ],
+    "space_memberships": [
+        _index("user_space", [("user_id", ASCENDING), ("space_id", ASCENDING)]),
+        _index("space_role", [("space_id", ASCENDING), ("role", ASCENDING)]),
+        _index("space_status", [("space_id", ASCENDING), ("status", ASCENDING)]),
+        _index("status_block_expires", [("status", ASCENDING), ("block_expires_at", ASCENDING)]),
+    ],
+    "join_requests": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+        _index("user_space_status", [("user_id", ASCENDING), ("space_id", ASCENDING), ("status", ASCENDING)]),
+        _index("space_id", [("space_id", ASCENDING)]),
+    ],
+    "space_invites": [
+        _index("invite_code_unique", [("invite_code", ASCENDING)], unique=True),
+        _index("space_active", [("space_id", ASCENDING), ("is_active", ASCENDING)]),
+    ],
+    "invite_tokens": [
+        _index("token_unique", [("token", ASCENDING)], unique=True),
+        _index("created_by_created_at", [("created_by", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "posts": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+        # Serves the /feed equality on is_pinned and the legacy /posts pinned-first sort
+        _index("space_pinned_desc_created_id", [("space_id", ASCENDING), ("is_pinned", DESCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        _index("author_space", [("author_id", ASCENDING), ("space_id", ASCENDING)]),
+    ],
+    "reactions": [
+        _index("target_user_emoji_unique", [("target_type", ASCENDING), ("target_id", ASCENDING), ("user_id", ASCENDING), ("emoji", ASCENDING)], unique=True),
+        _index("user_target", [("user_id", ASCENDING), ("target_type", ASCENDING), ("target_id", ASCENDING)]),
+    ],
+    "comments": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+        _index("post_created", [("post_id", ASCENDING), ("created_at", ASCENDING)]),
+        _index("lesson_parent", [("lesson_id", ASCENDING), ("parent_comment_id", ASCENDING)]),
+        _index("parent_comment_id", [("parent_comment_id", ASCENDING)]),
+        _index("author_id", [("author_id", ASCENDING)]),
+    ],
+    "notification_counters": [
+        _index("user_id_unique", [("user_id", ASCENDING)], unique=True),
+    ],
+    "notifications": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+        _index("user_read_created", [("user_id", ASCENDING), ("is_read", ASCENDING), ("created_at", DESCENDING)]),
+        _index("user_created", [("user_id", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "direct_messages": [
+        _index("sender_receiver_created_id", [("sender_id", ASCENDING), ("receiver_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "message_groups": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+        _index("member_ids", [("member_ids", ASCENDING)]),
+    ],
+    "group_messages": [
+        _index("group_created_id", [("group_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "conversations": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+        _index("participant_activity", [("participant_ids", ASCENDING), ("last_activity_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "point_buckets": [
+        _index("user_day_unique", [("user_id", ASCENDING), ("day", ASCENDING)], unique=True),
+        _index("day_user", [("day", ASCENDING), ("user_id", ASCENDING)]),
+    ],
+    "leaderboards": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+    ],
+    "leaderboard_totals": [
+        _index("window_user_unique", [("window", ASCENDING), ("user_id", ASCENDING)], unique=True),
+        _index("window_points", [("window", ASCENDING), ("points", DESCENDING)]),
+    ],
+    "background_jobs": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+        _index("type_started", [("type", ASCENDING), ("started_at", DESCENDING)]),
+    ],
+    "counters": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+    ],
+    "job_locks": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+    ],
+    "point_transactions": [
+        _index("user_created", [("user_id", ASCENDING), ("created_at", DESCENDING)]),
+        _index("user_action", [("user_id", ASCENDING), ("action_type", ASCENDING)]),
+        _index("created_at", [("created_at", DESCENDING)]),
+    ],
+    "levels": [
+        _index("level_number_unique", [("level_number", ASCENDING)], unique=True),
+        _index("points_required", [("points_required", DESCENDING)]),
+    ],
+    "sections": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+        _index("space_order", [("space_id", ASCENDING), ("order", ASCENDING)]),
+    ],
+    "lessons": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+        _index("space_order", [("space_id", ASCENDING), ("order", ASCENDING)]),
+        _index("section_id", [("section_id", ASCENDING)]),
+    ],
+    "lesson_progress": [
+        _index("user_lesson_unique", [("user_id", ASCENDING), ("lesson_id", ASCENDING)], unique=True),
+        _index("lesson_id", [("lesson_id", ASCENDING)]),
+    ],
+    "space_progress": [
+        _index("user_space_unique", [("user_id", ASCENDING), ("space_id", ASCENDING)], unique=True),
+        _index("space_id", [("space_id", ASCENDING)]),
+    ],
+    "lesson_notes": [
+        _index("user_lesson", [("user_id", ASCENDING), ("lesson_id", ASCENDING)]),
+    ],
+    "events": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+        _index("start_time", [("start_time", ASCENDING)]),
+    ],
+    "feature_requests": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+        _index("vote_count", [("vote_count", DESCENDING)]),
+        _index("created_at", [("created_at", DESCENDING)]),
+    ],
+    "subscriptions": [
+        _index("user_status_ends", [("user_id", ASCENDING), ("status", ASCENDING), ("ends_at", ASCENDING)]),
+        _index("status_ends", [("status", ASCENDING), ("ends_at", ASCENDING)]),
+    ],
+    "subscription_tiers": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+    ],
+    "payment_transactions": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+        _index("order_user", [("gateway_order_id", ASCENDING), ("user_id", ASCENDING)]),
+        _index("session_user", [("session_id", ASCENDING), ("user_id", ASCENDING)]),
+    ],
+    "user_messaging_preferences": [
+        _index("user_id_unique", [("user_id", ASCENDING)], unique=True),
+    ],
+    "email_outbox": [
+        _index("id_unique", [("id", ASCENDING)], unique=True),
+        _index("status_next_attempt", [("status", ASCENDING), ("next_attempt_at", ASCENDING)]),
+    ],
+}
+
+async def ensure_indexes():
+    """
+    Build every index in INDEX_CATALOG. Safe to run on every startup: existing
+    indexes with identical specs are a no-op. A failure on one index (e.g. duplicate
+    data blocking a unique index) is logged and does not stop the others.
+    """
+    created = 0
+    for collection_name, indexes in INDEX_CATALOG.items():
+        collection = db[collection_name]
+        for index in indexes:
+            try:
+                await collection.create_indexes([index])
+                created += 1
+            except OperationFailure as e:
+                logger.error(f"Index {collection_name}.{index.document['name']} could not be built: {e}")
+    logger.info(f"Index bootstrap complete: {created} indexes ensured across {len(INDEX_CATALOG)} collections")
+
+async def get_index_report() -> dict:
+    """Compare INDEX_CATALOG with the live database using $indexStats"""
+    report = {}
+    for collection_name, indexes in INDEX_CATALOG.items():
+        declared = [index.document['name'] for index in indexes]
+        stats = {}
+        try:
+            async for stat in db[collection_name].aggregate([{"$indexStats": {}}]):
+                stats[stat['name']] = stat
+        except OperationFailure as e:
+            logger.warning(f"$indexStats unavailable for {collection_name}: {e}")
+
+        missing = [name for name in declared if name not in stats]
+        building = [name for name, stat in stats.items() if stat.get('building')]
+        unused = [
+            {
+                "name": name,
+                "since": stat.get('accesses', {}).get('since')
+            }
+            for name, stat in stats.items()
+            if name != '_id_' and not stat.get('building') and stat.get('accesses', {}).get('ops', 0) == 0
+        ]
+        undeclared = [name for name in stats if name != '_id_' and name not in declared]
+
+        report[collection_name] = {
+            "declared": declared,
+            "missing": missing,
+            "building": building,
+            "unused": unused,
+            "undeclared": undeclared
+        }
+    return report
+
+# ==================== USER HYDRATION ====================
+
+# Fixed projections for attaching user info to rows (authors, senders, members)
+USER_PROJECTIONS = {
+    "public": {"_id": 0, "id": 1, "name": 1, "picture": 1, "badges": 1, "role": 1},
+    "admin": {"_id": 0, "id": 1, "name": 1, "email": 1, "picture": 1, "role": 1, "badges": 1},
+}
+
+class UserLoader:
+    """
+    Batches user lookups into one `$in` query per call and caches results for the
+    rest of the request, so enriching a page of N rows costs one round-trip, not N.
+    """
+    def __init__(self, projection: str = "public"):
+        self.projection = USER_PROJECTIONS[projection]
+        self.cache: Dict[str, Optional[dict]] = {}
+
+    async def load_many(self, user_ids) -> Dict[str, Optional[dict]]:
+        user_ids = [uid for uid in user_ids if uid]
+        missing = list({uid for uid in user_ids if uid not in self.cache})
+        if missing:
+            docs = await db.users.find({"id": {"$in": missing}}, self.projection).to_list(len(missing))
+            found = {doc['id']: doc for doc in docs}
+            for uid in missing:
+                self.cache[uid] = found.get(uid)
+        return {uid: self.cache[uid] for uid in user_ids}
+
+    async def load(self, user_id: str) -> Optional[dict]:
+        return (await self.load_many([user_id])).get(user_id)
+
+def get_user_loader(projection: str = "public") -> UserLoader:
+    """The current request's loader for this projection (a fresh one outside a request)"""
+    ctx = request_context.get()
+    if ctx is None:
+        return UserLoader(projection)
+    if projection not in ctx.user_loaders:
+        ctx.user_loaders[projection] = UserLoader(projection)
+    return ctx.user_loaders[projection]
+
+async def attach_users(rows: List[dict], id_field: str, target_field: str, projection: str = "public") -> List[dict]:
+    """Set row[target_field] to the user referenced by row[id_field], resolved in one batch"""
+    users = await get_user_loader(projection).load_many([row.get(id_field) for row in rows])
+    for row in rows:
+        row[target_field] = users.get(row.get(id_field))
+    return rows
+
 # ==================== AUTH HELPER ====================
 
+# Principal cache: session_token -> (User, session expiry). Saves the session and user
+# lookups plus User model validation on every authenticated request for warm tokens.
+AUTH_CACHE_TTL_SECONDS = int(os.environ.get('AUTH_CACHE_TTL_SECONDS', '60'))
+AUTH_CACHE_MAX_SIZE = int(os.environ.get('AUTH_CACHE_MAX_SIZE', '10000'))
+principal_cache = TTLCache(maxsize=AUTH_CACHE_MAX_SIZE, ttl=AUTH_CACHE_TTL_SECONDS)
+principal_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+def invalidate_session_principal(session_token: Optional[str]):
+    """Drop a single cached session (e.g. on logout)"""
+    if session_token and principal_cache.pop(session_token, None) is not None:
+        principal_cache_stats['invalidations'] += 1
+
+def invalidate_user_principal(user_id: str):
+    """Drop every cached session belonging to a user after their profile, role or status changes"""
+    stale_tokens = [token for token, (cached_user, _) in principal_cache.items() if cached_user.id == user_id]
+    for token in stale_tokens:
+        invalidate_session_principal(token)
+
 async def get_current_user(request: Request, authorization: Optional[str] = Header(None)) -> Optional[User]:
     """Get current user from session token (cookie or Authorization header)"""
     session_token = None
@@ -469,20 +794,39 @@ async def get_current_user(request: Request, authorization: Optional[str] = Head
         else:
             session_token = authorization
     
+    return await resolve_session_user(session_token)
+
+async def resolve_session_user(session_token: Optional[str]) -> Optional[User]:
+    """The user a session token belongs to, served from the principal cache when warm"""
     if not session_token:
         return None
-    
+
+    # Serve warm tokens from the principal cache
+    cached = principal_cache.get(session_token)
+    if cached:
+        cached_user, expires_at = cached
+        if expires_at >= datetime.now(timezone.utc):
+            principal_cache_stats['hits'] += 1
+            return cached_user
+        invalidate_session_principal(session_token)
+    principal_cache_stats['misses'] += 1
+
     # Check session in database
     session = await db.user_sessions.find_one({"session_token": session_token})
-    if not session or datetime.fromisoformat(session['expires_at']) < datetime.now(timezone.utc):
+    if not session:
         return None
-    
+    expires_at = datetime.fromisoformat(session['expires_at'])
+    if expires_at < datetime.now(timezone.utc):
+        return None
+
     # Get user
     user_doc = await db.users.find_one({"id": session['user_id']})
     if not user_doc:
         return None
-    
-    return User(**user_doc)
+
+    user = User(**user_doc)
+    principal_cache[session_token] = (user, expires_at)
+    return user
 
 async def require_auth(request: Request, authorization: Optional[str] = Header(None)) -> User:
     """Require authentication, raise 401 if not authenticated"""
@@ -492,6 +836,50 @@ async def require_auth(request: Request, authorization: Optional[str] = Header(N
     return user
 
 
+# ==================== PASSWORD HASHING ====================
+
+# bcrypt is deliberately slow (~200ms) and releases the GIL, so it runs on a bounded
+# thread pool instead of blocking the event loop for every other request on the worker.
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '4'))
+PASSWORD_HASH_TIMEOUT_SECONDS = float(os.environ.get('PASSWORD_HASH_TIMEOUT_SECONDS', '5'))
+password_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+password_hash_stats = {"pending": 0, "max_queue_depth": 0, "completed": 0, "timeouts": 0}
+
+async def _run_password_job(func, *args):
+    """Run a bcrypt call on the hashing pool, shedding it with a 503 if the pool is saturated"""
+    password_hash_stats['pending'] += 1
+    queue_depth = max(0, password_hash_stats['pending'] - PASSWORD_HASH_WORKERS)
+    password_hash_stats['max_queue_depth'] = max(password_hash_stats['max_queue_depth'], queue_depth)
+    try:
+        loop = asyncio.get_running_loop()
+        result = await asyncio.wait_for(
+            loop.run_in_executor(password_hash_executor, func, *args),
+            timeout=PASSWORD_HASH_TIMEOUT_SECONDS
+        )
+        password_hash_stats['completed'] += 1
+        return result
+    except asyncio.TimeoutError:
+        password_hash_stats['timeouts'] += 1
+        logger.warning(f"Password hashing timed out after {PASSWORD_HASH_TIMEOUT_SECONDS}s (queue depth {queue_depth})")
+        raise HTTPException(status_code=503, detail="Authentication service is busy. Please try again.")
+    finally:
+        password_hash_stats['pending'] -= 1
+
+def _hash_password_sync(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+def _verify_password_sync(password: str, password_hash: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+async def hash_password(password: str) -> str:
+    """Hash a password with bcrypt off the event loop"""
+    return await _run_password_job(_hash_password_sync, password)
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    """Check a password against a bcrypt hash off the event loop"""
+    return await _run_password_job(_verify_password_sync, password, password_hash)
+
+
 async def get_platform_settings() -> dict:
     """Get global platform settings"""
     settings = await db.platform_settings.find_one({"id": "global_settings"})
@@ -510,6 +898,35 @@ async def get_platform_settings() -> dict:
         del settings['_id']
     return settings
 
+# Total community members (non-archived users), shown as member_count on auto_join spaces.
+# Kept in db.counters and adjusted on register/archive/unarchive/delete instead of counting users per request.
+COMMUNITY_MEMBERS_COUNTER = "community_members"
+
+async def adjust_community_member_count(delta: int):
+    """Increment or decrement the maintained community member count"""
+    await db.counters.update_one(
+        {"id": COMMUNITY_MEMBERS_COUNTER},
+        {"$inc": {"value": delta}},
+        upsert=True
+    )
+
+async def reconcile_community_member_count() -> int:
+    """Recount non-archived users and overwrite the counter (startup and drift repair)"""
+    count = await db.users.count_documents({"archived": {"$ne": True}})
+    await db.counters.update_one(
+        {"id": COMMUNITY_MEMBERS_COUNTER},
+        {"$set": {"value": count, "reconciled_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True
+    )
+    return count
+
+async def get_community_member_count() -> int:
+    """Read the community member count, seeding it from users the first time"""
+    counter = await db.counters.find_one({"id": COMMUNITY_MEMBERS_COUNTER}, {"_id": 0, "value": 1})
+    if counter is None:
+        return await reconcile_community_member_count()
+    return max(counter.get('value', 0), 0)
+
 async def user_has_active_subscription(user_id: str) -> bool:
     """Check if user has an active subscription"""
     subscription = await db.subscriptions.find_one({
@@ -536,6 +953,257 @@ async def check_payment_requirement(user: User) -> None:
 
 
 
+# ==================== EMAIL OUTBOX ====================
+
+# Request handlers only enqueue; a pool of workers drains email_outbox in the background
+EMAIL_TRANSPORT = os.environ.get('EMAIL_TRANSPORT', 'sendgrid')
+EMAIL_OUTBOX_WORKERS = int(os.environ.get('EMAIL_OUTBOX_WORKERS', '4'))
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE', '50'))
+EMAIL_OUTBOX_POLL_SECONDS = float(os.environ.get('EMAIL_OUTBOX_POLL_SECONDS', '5'))
+EMAIL_RATE_LIMIT_PER_SECOND = float(os.environ.get('EMAIL_RATE_LIMIT_PER_SECOND', '10'))
+EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', '6'))
+EMAIL_RETRY_BASE_SECONDS = float(os.environ.get('EMAIL_RETRY_BASE_SECONDS', '30'))
+EMAIL_RETRY_MAX_SECONDS = float(os.environ.get('EMAIL_RETRY_MAX_SECONDS', '3600'))
+EMAIL_SEND_LEASE_SECONDS = int(os.environ.get('EMAIL_SEND_LEASE_SECONDS', '300'))
+
+class EmailTransport(ABC):
+    """Delivers one outbox message. Raise on failure so the worker can retry."""
+    name = "base"
+
+    @abstractmethod
+    async def send(self, to_email: str, subject: str, html_content: str) -> None:
+        ...
+
+class SendGridTransport(EmailTransport):
+    name = "sendgrid"
+
+    async def send(self, to_email: str, subject: str, html_content: str) -> None:
+        from_email = os.environ.get('EMAIL_FROM', 'notify@abcd.ritz7.com')
+        from_name = os.environ.get('EMAIL_FROM_NAME', 'ABCD-by-Ritz7')
+        reply_to = os.environ.get('EMAIL_REPLY_TO', 'abcd@ritz7.com')
+
+        message = Mail(
+            from_email=(from_email, from_name),
+            to_emails=to_email,
+            subject=subject,
+            html_content=html_content
+        )
+        message.reply_to = reply_to
+
+        # The SendGrid client is synchronous; keep its HTTP round-trip off the event loop
+        response = await asyncio.to_thread(sendgrid_client.send, message)
+        if response.status_code != 202:
+            raise RuntimeError(f"SendGrid returned status {response.status_code}")
+
+class FileEmailTransport(EmailTransport):
+    """Appends each message as a JSON line to a local file - for development and offline benchmarks"""
+    name = "file"
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+
+    def _append(self, line: str) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open('a', encoding='utf-8') as f:
+            f.write(line + "\n")
+
+    async def send(self, to_email: str, subject: str, html_content: str) -> None:
+        line = json.dumps({
+            "to": to_email,
+            "subject": subject,
+            "html": html_content,
+            "sent_at": datetime.now(timezone.utc).isoformat()
+        })
+        await asyncio.to_thread(self._append, line)
+
+class SmtpSinkTransport(EmailTransport):
+    """Plain SMTP without auth, for a local sink such as MailHog or `python -m aiosmtpd -n`"""
+    name = "smtp"
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+
+    def _deliver(self, to_email: str, subject: str, html_content: str) -> None:
+        message = EmailMessage()
+        message['From'] = os.environ.get('EMAIL_FROM', 'notify@abcd.ritz7.com')
+        message['To'] = to_email
+        message['Subject'] = subject
+        message.set_content(html_content, subtype='html')
+        with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+            smtp.send_message(message)
+
+    async def send(self, to_email: str, subject: str, html_content: str) -> None:
+        await asyncio.to_thread(self._deliver, to_email, subject, html_content)
+
+def build_email_transport(name: str) -> EmailTransport:
+    """Select the outbox transport from EMAIL_TRANSPORT (sendgrid, file or smtp)"""
+    if name == "file":
+        return FileEmailTransport(os.environ.get('EMAIL_FILE_PATH', str(ROOT_DIR / 'outbox.jsonl')))
+    if name == "smtp":
+        return SmtpSinkTransport(
+            os.environ.get('EMAIL_SMTP_HOST', 'localhost'),
+            int(os.environ.get('EMAIL_SMTP_PORT', '1025'))
+        )
+    return SendGridTransport()
+
+email_transport: EmailTransport = build_email_transport(EMAIL_TRANSPORT)
+
+class EmailRateLimiter:
+    """Token bucket shared by all outbox workers so bursts stay under the provider's send rate"""
+    def __init__(self, rate_per_second: float):
+        self.rate = rate_per_second
+        self.tokens = rate_per_second
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+email_outbox_stats = {"enqueued": 0, "sent": 0, "retried": 0, "dead_lettered": 0}
+email_outbox_wakeup = asyncio.Event()
+email_outbox_queue: Optional[asyncio.Queue] = None
+
+def email_retry_delay(attempts: int) -> float:
+    """Exponential backoff with full jitter, capped at EMAIL_RETRY_MAX_SECONDS"""
+    delay = min(EMAIL_RETRY_MAX_SECONDS, EMAIL_RETRY_BASE_SECONDS * (2 ** (attempts - 1)))
+    return random.uniform(delay / 2, delay)
+
+async def enqueue_email(to_email: str, subject: str, html_content: str, user_id: Optional[str] = None) -> str:
+    """Persist an email to the outbox and wake the dispatcher. Returns the outbox id."""
+    now = datetime.now(timezone.utc).isoformat()
+    outbox_id = str(uuid.uuid4())
+    await db.email_outbox.insert_one({
+        "id": outbox_id,
+        "to_email": to_email,
+        "subject": subject,
+        "html_content": html_content,
+        "user_id": user_id,
+        "status": "pending",
+        "attempts": 0,
+        "last_error": None,
+        "next_attempt_at": now,
+        "created_at": now,
+        "sent_at": None
+    })
+    email_outbox_stats['enqueued'] += 1
+    email_outbox_wakeup.set()
+    return outbox_id
+
+async def claim_due_emails(limit: int) -> List[dict]:
+    """
+    Claim up to `limit` due messages. Each claim is a conditional update so several
+    app workers can share one outbox; a message stuck in 'sending' past its lease
+    (worker crashed mid-send) becomes claimable again.
+    """
+    now = datetime.now(timezone.utc)
+    now_iso = now.isoformat()
+    due = {"$or": [
+        {"status": "pending", "next_attempt_at": {"$lte": now_iso}},
+        {"status": "sending", "lease_expires_at": {"$lte": now_iso}}
+    ]}
+    candidates = await db.email_outbox.find(due, {"_id": 0, "id": 1}).sort("next_attempt_at", 1).to_list(limit)
+
+    lease_expires_at = (now + timedelta(seconds=EMAIL_SEND_LEASE_SECONDS)).isoformat()
+    claimed = []
+    for candidate in candidates:
+        # The pre-update document is returned; the claim only touches status and lease
+        message = await db.email_outbox.find_one_and_update(
+            {"id": candidate['id'], **due},
+            {"$set": {"status": "sending", "lease_expires_at": lease_expires_at}},
+            projection={"_id": 0}
+        )
+        if message:
+            claimed.append(message)
+    return claimed
+
+async def deliver_outbox_message(message: dict, transport: EmailTransport, rate_limiter: EmailRateLimiter) -> None:
+    """Send one claimed message and record the outcome: sent, retry later, or dead-lettered"""
+    await rate_limiter.acquire()
+    attempts = message.get('attempts', 0) + 1
+    try:
+        await transport.send(message['to_email'], message['subject'], message['html_content'])
+    except Exception as e:
+        if attempts >= EMAIL_MAX_ATTEMPTS:
+            await db.email_outbox.update_one(
+                {"id": message['id']},
+                {"$set": {"status": "dead", "attempts": attempts, "last_error": str(e)}}
+            )
+            email_outbox_stats['dead_lettered'] += 1
+            logger.error(f"❌ Email to {message['to_email']} dead-lettered after {attempts} attempts: {str(e)}")
+        else:
+            next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=email_retry_delay(attempts))
+            await db.email_outbox.update_one(
+                {"id": message['id']},
+                {"$set": {
+                    "status": "pending",
+                    "attempts": attempts,
+                    "last_error": str(e),
+                    "next_attempt_at": next_attempt_at.isoformat()
+                }}
+            )
+            email_outbox_stats['retried'] += 1
+            logger.warning(f"⚠️ Email send failed to {message['to_email']} (attempt {attempts}), retrying: {str(e)}")
+        return
+
+    await db.email_outbox.update_one(
+        {"id": message['id']},
+        {"$set": {
+            "status": "sent",
+            "attempts": attempts,
+            "last_error": None,
+            "sent_at": datetime.now(timezone.utc).isoformat()
+        }}
+    )
+    email_outbox_stats['sent'] += 1
+    logger.info(f"✅ Email sent to {message['to_email']}: {message['subject']}")
+
+async def email_outbox_worker(queue: asyncio.Queue, transport: EmailTransport, rate_limiter: EmailRateLimiter):
+    while True:
+        message = await queue.get()
+        try:
+            await deliver_outbox_message(message, transport, rate_limiter)
+        except Exception as e:
+            # Leave the message in 'sending'; it is reclaimed once its lease expires
+            logger.error(f"Email outbox worker error for {message.get('id')}: {e}")
+        finally:
+            queue.task_done()
+
+async def email_outbox_dispatcher(queue: asyncio.Queue):
+    """Claim due messages in batches and hand them to the worker pool"""
+    while True:
+        try:
+            email_outbox_wakeup.clear()
+            messages = await claim_due_emails(EMAIL_OUTBOX_BATCH_SIZE)
+            for message in messages:
+                await queue.put(message)
+            if len(messages) == EMAIL_OUTBOX_BATCH_SIZE:
+                continue
+        except Exception as e:
+            logger.error(f"Email outbox dispatcher error: {e}")
+        try:
+            await asyncio.wait_for(email_outbox_wakeup.wait(), timeout=EMAIL_OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+async def start_email_outbox():
+    """Start the dispatcher and EMAIL_OUTBOX_WORKERS senders on the running loop"""
+    global email_outbox_queue
+    email_outbox_queue = asyncio.Queue(maxsize=EMAIL_OUTBOX_BATCH_SIZE)
+    rate_limiter = EmailRateLimiter(EMAIL_RATE_LIMIT_PER_SECOND)
+    for _ in range(EMAIL_OUTBOX_WORKERS):
+        run_in_background(email_outbox_worker(email_outbox_queue, email_transport, rate_limiter))
+    run_in_background(email_outbox_dispatcher(email_outbox_queue))
+    logger.info(f"Email outbox started: {EMAIL_OUTBOX_WORKERS} workers, transport={email_transport.name}")
+
 # Email notification helper - Provider-agnostic interface
 async def send_email(
     to_email: str,
@@ -546,7 +1214,8 @@ async def send_email(
 ):
     """
     Generic email sending function - provider-agnostic interface.
-    Change email provider by modifying only this function.
+    The message is written to the email outbox and delivered in the background;
+    change provider with EMAIL_TRANSPORT (see build_email_transport).
     
     Args:
         to_email: Recipient email address
@@ -556,7 +1225,7 @@ async def send_email(
         check_preferences: Whether to check user's email notification preferences
     
     Returns:
-        bool: True if email sent successfully, False otherwise
+        bool: True if email was queued for delivery, False otherwise
     """
     try:
         # Check user preferences if user_id provided
@@ -566,32 +1235,14 @@ async def send_email(
                 logger.info(f"Email not sent to {to_email}: User has disabled email notifications")
                 return False
         
-        # === SENDGRID IMPLEMENTATION (Change this section to switch providers) ===
-        from_email = os.environ.get('EMAIL_FROM', 'notify@abcd.ritz7.com')
-        from_name = os.environ.get('EMAIL_FROM_NAME', 'ABCD-by-Ritz7')
-        reply_to = os.environ.get('EMAIL_REPLY_TO', 'abcd@ritz7.com')
-        
-        message = Mail(
-            from_email=(from_email, from_name),
-            to_emails=to_email,
-            subject=subject,
-            html_content=html_content
-        )
-        message.reply_to = reply_to
-        
-        response = sendgrid_client.send(message)
-        success = response.status_code == 202
-        # === END SENDGRID IMPLEMENTATION ===
+        if not to_email:
+            return False
         
-        if success:
-            logger.info(f"✅ Email sent to {to_email}: {subject}")
-        else:
-            logger.warning(f"⚠️ Email send failed to {to_email}: Status {response.status_code}")
-        
-        return success
+        await enqueue_email(to_email, subject, html_content, user_id=user_id)
+        return True
         
     except Exception as e:
-        logger.error(f"❌ Failed to send email to {to_email}: {str(e)}")
+        logger.error(f"❌ Failed to queue email to {to_email}: {str(e)}")
         return False
 
 # Legacy function name for backward compatibility
@@ -859,6 +1510,79 @@ def get_email_template(template_type: str, **kwargs) -> dict:
     })
 
 
+# Each user's unread notification count is kept in notification_counters and pushed to their
+# live connections (WebSocket or SSE) with every change, so connected clients need not poll.
+# A seed only ever inserts, so it never overwrites a concurrent $inc; a change that lands
+# between a seed's count and its insert can still be counted twice, which the
+# notification_counters job repairs.
+async def seed_unread_notifications(user_id: str) -> int:
+    """Create a user's unread counter from their notifications unless one already exists"""
+    unread = await db.notifications.count_documents({"user_id": user_id, "is_read": False})
+    try:
+        counter = await db.notification_counters.find_one_and_update(
+            {"user_id": user_id},
+            {"$setOnInsert": {"unread": unread}},
+            projection={"_id": 0, "unread": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Seeded concurrently; keep the other seed's counter
+        counter = await db.notification_counters.find_one({"user_id": user_id}, {"_id": 0, "unread": 1})
+    return max(0, counter['unread'])
+
+async def reconcile_unread_notifications() -> dict:
+    """Recount every unread counter and repair the ones that drifted from notifications"""
+    checked = repaired = 0
+    async for counter in db.notification_counters.find({}, {"_id": 0, "user_id": 1, "unread": 1}):
+        checked += 1
+        unread = await db.notifications.count_documents({"user_id": counter['user_id'], "is_read": False})
+        if unread == counter['unread']:
+            continue
+        # Compare-and-set: a change applied since the counter was read wins, the next run rechecks
+        result = await db.notification_counters.update_one(
+            {"user_id": counter['user_id'], "unread": counter['unread']},
+            {"$set": {"unread": unread}}
+        )
+        if result.modified_count:
+            repaired += 1
+            await publish_unread_notifications(counter['user_id'], unread)
+    if repaired:
+        logger.warning(f"Repaired {repaired} of {checked} unread notification counters")
+    return {"checked": checked, "repaired": repaired}
+
+async def get_unread_notification_count(user_id: str) -> int:
+    counter = await db.notification_counters.find_one({"user_id": user_id}, {"_id": 0, "unread": 1})
+    if counter is None:
+        return await seed_unread_notifications(user_id)
+    return max(0, counter['unread'])
+
+async def adjust_unread_notifications(user_id: str, delta: int) -> int:
+    """Apply a change that has already been written to notifications and return the new count"""
+    counter = await db.notification_counters.find_one_and_update(
+        {"user_id": user_id},
+        {"$inc": {"unread": delta}},
+        projection={"_id": 0, "unread": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if counter is None:
+        # First change for this user: the seeded count already includes it
+        return await seed_unread_notifications(user_id)
+    return max(0, counter['unread'])
+
+async def publish_notification(notif_dict: dict):
+    """Count a stored notification as unread and push it with the new count"""
+    unread = await adjust_unread_notifications(notif_dict['user_id'], 1)
+    await ws_manager.send_personal_message(notif_dict['user_id'], {
+        "type": "notification",
+        "notification": {k: v for k, v in notif_dict.items() if k != '_id'},
+        "unread_count": unread
+    })
+
+async def publish_unread_notifications(user_id: str, unread: int):
+    """Keep the user's other tabs/devices in sync after notifications are read or deleted"""
+    await ws_manager.send_personal_message(user_id, {"type": "unread_notifications", "unread_count": unread})
+
 # Notification creation helper
 async def create_notification(
     user_id: str,
@@ -886,6 +1610,7 @@ async def create_notification(
     notif_dict = notification.model_dump()
     notif_dict['created_at'] = notif_dict['created_at'].isoformat()
     await db.notifications.insert_one(notif_dict)
+    await publish_notification(notif_dict)
     
     # Send email if requested and email is important
     if send_email:
@@ -915,39 +1640,468 @@ async def create_notification(
 
 # ==================== WEBSOCKET CONNECTION MANAGER ====================
 
-class ConnectionManager:
-    """Manages WebSocket connections for real-time messaging"""
+# Each socket gets a bounded outgoing queue drained by its own writer task, so fan-out only
+# enqueues and one slow client never stalls delivery to others or the HTTP response.
+# When a queue is full, WS_SLOW_CONSUMER_POLICY decides: "disconnect" closes the socket
+# (the client reconnects and refetches), "drop_oldest"/"drop_newest" discard a message.
+WS_SEND_QUEUE_SIZE = int(os.environ.get('WS_SEND_QUEUE_SIZE', '256'))
+WS_SEND_TIMEOUT_SECONDS = float(os.environ.get('WS_SEND_TIMEOUT_SECONDS', '10'))
+WS_SLOW_CONSUMER_POLICY = os.environ.get('WS_SLOW_CONSUMER_POLICY', 'disconnect')
+WS_SLOW_CONSUMER_POLICIES = ("disconnect", "drop_oldest", "drop_newest")
+if WS_SLOW_CONSUMER_POLICY not in WS_SLOW_CONSUMER_POLICIES:
+    raise ValueError(f"WS_SLOW_CONSUMER_POLICY must be one of {WS_SLOW_CONSUMER_POLICIES}")
+
+# The server pings every connection each WS_PING_INTERVAL_SECONDS; clients answer with a
+# pong (any frame counts). Connections silent for WS_IDLE_TIMEOUT_SECONDS - idle or
+# half-open TCP that never errors on send - are closed and forgotten.
+WS_PING_INTERVAL_SECONDS = float(os.environ.get('WS_PING_INTERVAL_SECONDS', '25'))
+WS_IDLE_TIMEOUT_SECONDS = float(os.environ.get('WS_IDLE_TIMEOUT_SECONDS', '60'))
+# Clients without the session cookie send {"type": "auth", "token": ...} as their first frame
+WS_AUTH_TIMEOUT_SECONDS = float(os.environ.get('WS_AUTH_TIMEOUT_SECONDS', '10'))
+
+class ClientConnection:
+    """One live connection of a user (a WebSocket, or an SSE stream when websocket is None) with its outgoing queue"""
+    def __init__(self, user_id: str, websocket: Optional[WebSocket] = None):
+        self.id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.websocket = websocket
+        self.transport = "websocket" if websocket else "sse"
+        self.closed = asyncio.Event()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        self.writer: Optional[asyncio.Task] = None
+        self.connected_at = datetime.now(timezone.utc)
+        self.last_seen = time.monotonic()
+
+    async def close(self, code: int):
+        # SSE streams end on their own once `closed` is set
+        if self.websocket:
+            try:
+                await self.websocket.close(code=code)
+            except Exception as e:
+                # Usually the socket already broke (that is often why it is being closed)
+                logger.debug(f"Closing connection for {self.user_id} failed: {e}")
+
+# Real-time messages go through a bus so every app worker can deliver to the sockets
+# connected to it: "memory" for a single worker, "mongo" (a capped collection tailed by
+# every worker) when running several uvicorn workers against the same MongoDB.
+REALTIME_BUS = os.environ.get('REALTIME_BUS', 'memory')
+REALTIME_BUS_COLLECTION = os.environ.get('REALTIME_BUS_COLLECTION', 'realtime_bus')
+REALTIME_BUS_SIZE_MB = int(os.environ.get('REALTIME_BUS_SIZE_MB', '64'))
+REALTIME_BUS_RETRY_SECONDS = float(os.environ.get('REALTIME_BUS_RETRY_SECONDS', '1'))
+
+class MessageBus(ABC):
+    """Publishes real-time messages to every worker; each hands them to its local sockets"""
+    name = "base"
+
     def __init__(self):
-        self.active_connections: dict[str, WebSocket] = {}  # user_id: websocket
-    
-    async def connect(self, user_id: str, websocket: WebSocket):
-        """Connect a user's websocket"""
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
-        logger.info(f"User {user_id} connected. Total connections: {len(self.active_connections)}")
-    
-    def disconnect(self, user_id: str):
-        """Disconnect a user's websocket"""
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-            logger.info(f"User {user_id} disconnected. Total connections: {len(self.active_connections)}")
-    
-    async def send_personal_message(self, user_id: str, message: dict):
-        """Send a message to a specific user"""
-        if user_id in self.active_connections:
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.handler = None
+        self.stats = {
+            "published": 0,
+            "delivered": 0,
+            "last_latency_ms": None,
+            "max_latency_ms": 0,
+            "total_latency_ms": 0
+        }
+
+    def subscribe(self, handler):
+        """handler(user_ids, message) delivers to this worker's connections"""
+        self.handler = handler
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    @abstractmethod
+    async def publish(self, user_ids: List[str], message: dict) -> None:
+        ...
+
+    def deliver(self, user_ids: List[str], message: dict, published_at: float) -> None:
+        # End-to-end latency from publish (on any worker) to local fan-out, by wall clock
+        latency_ms = round(max(0.0, time.time() - published_at) * 1000, 2)
+        self.stats['delivered'] += 1
+        self.stats['last_latency_ms'] = latency_ms
+        self.stats['max_latency_ms'] = max(self.stats['max_latency_ms'], latency_ms)
+        self.stats['total_latency_ms'] += latency_ms
+        self.handler(user_ids, message)
+
+    def metrics(self) -> dict:
+        return {
+            **self.stats,
+            "backend": self.name,
+            "avg_latency_ms": round(self.stats['total_latency_ms'] / self.stats['delivered'], 2) if self.stats['delivered'] else None
+        }
+
+class InMemoryMessageBus(MessageBus):
+    """Single worker: publishing is local delivery"""
+    name = "memory"
+
+    async def publish(self, user_ids: List[str], message: dict) -> None:
+        self.stats['published'] += 1
+        self.deliver(user_ids, message, time.time())
+
+class MongoMessageBus(MessageBus):
+    """
+    Uses a capped collection in our MongoDB as the broker. A publish delivers locally right
+    away and inserts one document; every other worker tails the collection with a
+    tailable/await cursor and delivers it to its own sockets.
+    """
+    name = "mongo"
+
+    def __init__(self, collection_name: str, size_bytes: int):
+        super().__init__()
+        self.collection_name = collection_name
+        self.size_bytes = size_bytes
+        self.tail_task: Optional[asyncio.Task] = None
+        self.stats['tail_restarts'] = 0
+        self.stats['tail_gaps'] = 0
+        self.stats['publish_failures'] = 0
+
+    async def ensure_collection(self) -> None:
+        try:
+            await db.create_collection(self.collection_name, capped=True, size=self.size_bytes)
+            # A tailable cursor on an empty capped collection dies immediately
+            await db[self.collection_name].insert_one({"user_ids": [], "origin": self.worker_id, "published_at": time.time()})
+        except CollectionInvalid:
+            pass  # Created by another worker
+        except OperationFailure as e:
+            if e.code != 48:  # NamespaceExists: another worker created it between the check and the create
+                raise
+        # Tailable cursors only work on capped collections; tailing anything else would retry forever
+        options = await db[self.collection_name].options()
+        if not options.get('capped'):
+            raise RuntimeError(
+                f"Realtime bus collection '{self.collection_name}' exists but is not capped; "
+                f"drop it or point REALTIME_BUS_COLLECTION at another name"
+            )
+
+    async def start(self) -> None:
+        await self.ensure_collection()
+        self.tail_task = asyncio.create_task(self.tail())
+
+    async def stop(self) -> None:
+        if self.tail_task:
+            self.tail_task.cancel()
+
+    async def publish(self, user_ids: List[str], message: dict) -> None:
+        published_at = time.time()
+        self.stats['published'] += 1
+        self.deliver(user_ids, message, published_at)
+        try:
+            await db[self.collection_name].insert_one({
+                "user_ids": user_ids,
+                "message": message,
+                "origin": self.worker_id,
+                "published_at": published_at
+            })
+        except Exception as e:
+            # The message is already stored and delivered here; only other workers miss it
+            self.stats['publish_failures'] += 1
+            logger.error(f"Realtime bus publish failed: {e}")
+
+    async def tail(self) -> None:
+        collection = db[self.collection_name]
+        positioned = False
+        last_id = None
+        while True:
             try:
-                await self.active_connections[user_id].send_json(message)
+                if not positioned:
+                    # Start after the newest document so a (re)starting worker does not replay history
+                    newest = await collection.find({}, {"_id": 1}).sort("$natural", -1).limit(1).to_list(1)
+                    last_id = newest[0]['_id'] if newest else None
+                    positioned = True
+                # ObjectIds are minted by each publishing worker, so _id order is not insert order
+                # and an _id > last_id resume could skip documents. Replay in $natural (insert)
+                # order instead, skipping up to and including the last document delivered.
+                skipping = last_id is not None
+                if skipping and not await collection.find_one({"_id": last_id}, {"_id": 1}):
+                    skipping = False
+                    self.stats['tail_gaps'] += 1
+                    logger.warning("Realtime bus resume point was overwritten; messages published meanwhile were missed")
+                cursor = collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for doc in cursor:
+                        if skipping:
+                            skipping = doc['_id'] != last_id
+                            continue
+                        last_id = doc['_id']
+                        if doc.get('origin') != self.worker_id and doc.get('user_ids'):
+                            self.deliver(doc['user_ids'], doc['message'], doc['published_at'])
+                    if skipping:
+                        # Caught up without meeting last_id: it was overwritten while we scanned
+                        skipping = False
+                        self.stats['tail_gaps'] += 1
+                        logger.warning("Realtime bus resume point was overwritten during replay; skipped messages were missed")
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                logger.error(f"Error sending message to {user_id}: {e}")
-                self.disconnect(user_id)
+                logger.error(f"Realtime bus tail failed: {e}")
+            self.stats['tail_restarts'] += 1
+            await asyncio.sleep(REALTIME_BUS_RETRY_SECONDS)
+
+def build_message_bus(name: str) -> MessageBus:
+    """Select the real-time bus from REALTIME_BUS (memory or mongo)"""
+    if name == "mongo":
+        return MongoMessageBus(REALTIME_BUS_COLLECTION, REALTIME_BUS_SIZE_MB * 1024 * 1024)
+    return InMemoryMessageBus()
+
+class ConnectionManager:
+    """Manages WebSocket connections for real-time messaging (any number per user)"""
+    def __init__(self, bus: MessageBus):
+        self.bus = bus
+        self.bus.subscribe(self.deliver_local)
+        self.active_connections: Dict[str, Dict[str, ClientConnection]] = {}  # user_id: {connection_id: connection}
+        self.stats = {
+            "connects": 0,
+            "disconnects": 0,
+            "auth_failures": 0,
+            "idle_reaped": 0,
+            "peak_connections": 0,
+            "pings_sent": 0,
+            "messages_enqueued": 0,
+            "messages_sent": 0,
+            "messages_dropped": 0,
+            "slow_consumer_disconnects": 0,
+            "send_failures": 0,
+            "max_queue_depth": 0,
+            "last_send_ms": None,
+            "max_send_ms": 0,
+            "total_send_ms": 0
+        }
+        # Connects/disconnects in the current and previous clock minute
+        self.churn_minute = int(time.time() // 60)
+        self.churn = {"connects": 0, "disconnects": 0}
+        self.churn_previous_minute = {"connects": 0, "disconnects": 0}
+    
+    def _roll_churn(self):
+        minute = int(time.time() // 60)
+        if minute != self.churn_minute:
+            self.churn_previous_minute = self.churn if minute == self.churn_minute + 1 else {"connects": 0, "disconnects": 0}
+            self.churn = {"connects": 0, "disconnects": 0}
+            self.churn_minute = minute
+    
+    def _count_churn(self, event: str):
+        self._roll_churn()
+        self.churn[event] += 1
+    
+    async def connect(self, user_id: str, websocket: WebSocket) -> ClientConnection:
+        """Accept a socket (unless the handshake already did) and start its writer"""
+        if websocket.client_state == WebSocketState.CONNECTING:
+            await websocket.accept()
+        connection = ClientConnection(user_id, websocket)
+        self.active_connections.setdefault(user_id, {})[connection.id] = connection
+        connection.writer = asyncio.create_task(self._write(connection))
+        self.stats['connects'] += 1
+        self._count_churn("connects")
+        self.stats['peak_connections'] = max(self.stats['peak_connections'], self.connection_count())
+        logger.info(f"User {user_id} connected. Total connections: {self.connection_count()}")
+        return connection
+    
+    def open_stream(self, user_id: str) -> ClientConnection:
+        """Register an SSE stream; its response generator drains the queue instead of a writer task"""
+        connection = ClientConnection(user_id)
+        self.active_connections.setdefault(user_id, {})[connection.id] = connection
+        self.stats['connects'] += 1
+        self._count_churn("connects")
+        self.stats['peak_connections'] = max(self.stats['peak_connections'], self.connection_count())
+        return connection
+    
+    def disconnect(self, connection: ClientConnection):
+        """Forget a connection and stop its writer (safe to call more than once)"""
+        user_connections = self.active_connections.get(connection.user_id, {})
+        if user_connections.pop(connection.id, None) is None:
+            return
+        connection.closed.set()
+        if not user_connections:
+            del self.active_connections[connection.user_id]
+        if connection.writer and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+        self.stats['disconnects'] += 1
+        self._count_churn("disconnects")
+        logger.info(f"User {connection.user_id} disconnected. Total connections: {self.connection_count()}")
+    
+    def connection_count(self) -> int:
+        return sum(len(connections) for connections in self.active_connections.values())
+    
+    async def _write(self, connection: ClientConnection):
+        """Drain one connection's queue onto its socket"""
+        while True:
+            message, enqueued_at = await connection.queue.get()
+            try:
+                await asyncio.wait_for(connection.websocket.send_json(message), WS_SEND_TIMEOUT_SECONDS)
+            except Exception as e:
+                self.stats['send_failures'] += 1
+                logger.warning(f"Error sending message to {connection.user_id}: {e}")
+                self.disconnect(connection)
+                run_in_background(connection.close(code=1011))
+                return
+            self.record_sent(enqueued_at)
+    
+    def record_sent(self, enqueued_at: float):
+        # Latency from fan-out to the frame being written, including time spent queued
+        send_ms = round((time.perf_counter() - enqueued_at) * 1000, 2)
+        self.stats['messages_sent'] += 1
+        self.stats['last_send_ms'] = send_ms
+        self.stats['max_send_ms'] = max(self.stats['max_send_ms'], send_ms)
+        self.stats['total_send_ms'] += send_ms
+    
+    def _enqueue(self, connection: ClientConnection, message: dict):
+        item = (message, time.perf_counter())
+        try:
+            connection.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            if WS_SLOW_CONSUMER_POLICY == "disconnect":
+                self.stats['slow_consumer_disconnects'] += 1
+                logger.warning(f"Disconnecting slow consumer {connection.user_id} ({connection.queue.qsize()} messages queued)")
+                self.disconnect(connection)
+                run_in_background(connection.close(code=1013))
+                return
+            self.stats['messages_dropped'] += 1
+            if WS_SLOW_CONSUMER_POLICY == "drop_newest":
+                return
+            connection.queue.get_nowait()
+            connection.queue.put_nowait(item)
+        self.stats['messages_enqueued'] += 1
+        self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], connection.queue.qsize())
+    
+    async def heartbeat(self) -> dict:
+        """Close connections that have gone quiet and ping the rest"""
+        now = time.monotonic()
+        reaped = pinged = 0
+        for connection in [c for user_connections in self.active_connections.values() for c in user_connections.values()]:
+            if now - connection.last_seen > WS_IDLE_TIMEOUT_SECONDS:
+                self.disconnect(connection)
+                run_in_background(connection.close(code=1001))
+                reaped += 1
+            else:
+                self._enqueue(connection, {"type": "ping"})
+                pinged += 1
+        self.stats['idle_reaped'] += reaped
+        self.stats['pings_sent'] += pinged
+        return {"pinged": pinged, "reaped": reaped}
+    
+    def deliver_local(self, user_ids: List[str], message: dict):
+        """Queue a message for every connection this worker holds for these users"""
+        for user_id in user_ids:
+            for connection in list(self.active_connections.get(user_id, {}).values()):
+                self._enqueue(connection, message)
+    
+    async def send_personal_message(self, user_id: str, message: dict):
+        """Send a message to a user's connections on every worker; never waits on the sockets"""
+        await self.bus.publish([user_id], message)
     
     async def broadcast_to_group(self, user_ids: List[str], message: dict):
-        """Broadcast a message to multiple users"""
-        for user_id in user_ids:
-            await self.send_personal_message(user_id, message)
+        """Send a message to multiple users as one bus publish"""
+        if user_ids:
+            await self.bus.publish(list(user_ids), message)
+    
+    def metrics(self) -> dict:
+        self._roll_churn()
+        connections = [c for user_connections in self.active_connections.values() for c in user_connections.values()]
+        return {
+            **self.stats,
+            "avg_send_ms": round(self.stats['total_send_ms'] / self.stats['messages_sent'], 2) if self.stats['messages_sent'] else None,
+            "connections": len(connections),
+            "sse_connections": sum(1 for c in connections if c.transport == "sse"),
+            "connected_users": len(self.active_connections),
+            "queued_messages": sum(c.queue.qsize() for c in connections),
+            "largest_queue": max((c.queue.qsize() for c in connections), default=0),
+            "queue_size": WS_SEND_QUEUE_SIZE,
+            "slow_consumer_policy": WS_SLOW_CONSUMER_POLICY,
+            "churn_this_minute": self.churn,
+            "churn_last_minute": self.churn_previous_minute,
+            "ping_interval_seconds": WS_PING_INTERVAL_SECONDS,
+            "idle_timeout_seconds": WS_IDLE_TIMEOUT_SECONDS
+        }
 
 # Initialize connection manager
-ws_manager = ConnectionManager()
+ws_manager = ConnectionManager(build_message_bus(REALTIME_BUS))
+
+# ==================== RANK INDEX ====================
+
+RANK_INDEX_RESYNC_SECONDS = int(os.environ.get('RANK_INDEX_RESYNC_SECONDS', '300'))
+
+class RankIndex:
+    """
+    In-process all-time ranking of non-archived users with points, ordered by
+    total_points desc then user_id. Rank, top-K and neighbour lookups are O(log n).
+    Each app worker holds its own copy; the periodic resync corrects drift from
+    updates made by other workers.
+    """
+    def __init__(self):
+        self.entries = SortedList()  # (-points, user_id)
+        self.points: Dict[str, float] = {}
+        self.ready = False
+
+    def set(self, user_id: str, points: float) -> None:
+        old = self.points.pop(user_id, None)
+        if old is not None:
+            self.entries.discard((-old, user_id))
+        if points > 0:
+            self.points[user_id] = points
+            self.entries.add((-points, user_id))
+
+    def remove(self, user_id: str) -> None:
+        self.set(user_id, 0)
+
+    def rank(self, user_id: str) -> Optional[int]:
+        points = self.points.get(user_id)
+        if points is None:
+            return None
+        return self.entries.index((-points, user_id)) + 1
+
+    def top(self, k: int) -> List[tuple]:
+        """[(rank, user_id, points)] for the first k users"""
+        return [(i + 1, uid, -neg) for i, (neg, uid) in enumerate(self.entries.islice(0, k))]
+
+    def around(self, user_id: str, radius: int) -> List[tuple]:
+        """[(rank, user_id, points)] for up to `radius` users either side of user_id"""
+        rank = self.rank(user_id)
+        if rank is None:
+            return []
+        start = max(0, rank - 1 - radius)
+        window = self.entries.islice(start, rank + radius)
+        return [(start + i + 1, uid, -neg) for i, (neg, uid) in enumerate(window)]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+rank_index = RankIndex()
+
+async def seed_rank_index() -> None:
+    """Rebuild the rank index from users.total_points and swap it in"""
+    fresh = RankIndex()
+    async for u in db.users.find({"archived": False, "total_points": {"$gt": 0}}, {"_id": 0, "id": 1, "total_points": 1}):
+        fresh.set(u['id'], u['total_points'])
+    rank_index.entries, rank_index.points = fresh.entries, fresh.points
+    rank_index.ready = True
+
+async def adjust_total_points(user_id: str, delta: float) -> Optional[float]:
+    """
+    Atomically add `delta` to a user's total_points and return the new total. The
+    updated document comes back from the same write, so the rank index and level are
+    brought in step without re-reading the user.
+    """
+    user_doc = await db.users.find_one_and_update(
+        {"id": user_id},
+        {"$inc": {"total_points": delta}},
+        projection={"_id": 0, "total_points": 1, "current_level": 1, "archived": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not user_doc:
+        return None
+    total_points = user_doc['total_points']
+    if user_doc.get('archived'):
+        rank_index.remove(user_id)
+    else:
+        rank_index.set(user_id, total_points)
+    
+    new_level = (await get_level_table()).level_for(total_points)
+    if new_level != user_doc.get('current_level', 1):
+        await db.users.update_one({"id": user_id}, {"$set": {"current_level": new_level}})
+    return total_points
 
 # ==================== REFERRAL HELPERS ====================
 
@@ -1001,16 +2155,10 @@ async def award_referral_points(referrer_id: str, referee_id: str, referee_name:
     WELCOME_BONUS = 25   # Welcome bonus for referee
     
     # Award points to referrer
-    await db.users.update_one(
-        {"id": referrer_id},
-        {"$inc": {"total_points": REFERRAL_POINTS}}
-    )
+    await adjust_total_points(referrer_id, REFERRAL_POINTS)
     
     # Award welcome bonus to referee
-    await db.users.update_one(
-        {"id": referee_id},
-        {"$inc": {"total_points": WELCOME_BONUS}}
-    )
+    await adjust_total_points(referee_id, WELCOME_BONUS)
     
     # Create notification for referrer
     await create_notification(
@@ -1032,126 +2180,282 @@ async def award_referral_points(referrer_id: str, referee_id: str, referee_name:
 
 
 
+# ==================== SPACE PERMISSIONS ====================
+
+# Membership map cache: user_id -> {space_id: membership}. One query loads every space a user
+# belongs to, so authorizing a post/comment/reaction never needs its own membership lookups.
+# Endpoints that change memberships invalidate the affected users; the TTL bounds staleness
+# on other workers.
+MEMBERSHIP_CACHE_TTL_SECONDS = int(os.environ.get('MEMBERSHIP_CACHE_TTL_SECONDS', '60'))
+MEMBERSHIP_CACHE_MAX_SIZE = int(os.environ.get('MEMBERSHIP_CACHE_MAX_SIZE', '10000'))
+membership_cache = TTLCache(maxsize=MEMBERSHIP_CACHE_MAX_SIZE, ttl=MEMBERSHIP_CACHE_TTL_SECONDS)
+membership_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+MEMBERSHIP_MAP_PROJECTION = {"_id": 0, "space_id": 1, "role": 1, "status": 1, "block_type": 1, "block_expires_at": 1}
+
+def invalidate_membership_map(*user_ids: str):
+    """Drop cached membership maps after a join, leave, block, unblock, promote, demote or removal"""
+    for user_id in user_ids:
+        if membership_cache.pop(user_id, None) is not None:
+            membership_cache_stats['invalidations'] += 1
+
+def invalidate_space_membership_maps(space_id: str):
+    """Drop every cached map that includes a space (bulk membership changes)"""
+    stale_users = [user_id for user_id, memberships in membership_cache.items() if space_id in memberships]
+    invalidate_membership_map(*stale_users)
+
+async def get_membership_map(user_id: str) -> Dict[str, dict]:
+    """All of a user's memberships keyed by space_id, loaded in one query and cached"""
+    memberships = membership_cache.get(user_id)
+    if memberships is not None:
+        membership_cache_stats['hits'] += 1
+        return memberships
+    membership_cache_stats['misses'] += 1
+
+    memberships = {
+        m['space_id']: m
+        async for m in db.space_memberships.find({"user_id": user_id}, MEMBERSHIP_MAP_PROJECTION)
+    }
+    membership_cache[user_id] = memberships
+    return memberships
+
+def parse_block_expiry(block_expires_at: Optional[str]) -> Optional[datetime]:
+    """Parse a stored block_expires_at (ISO string, naive values are UTC)"""
+    if not block_expires_at:
+        return None
+    try:
+        expiry = datetime.fromisoformat(block_expires_at.replace('Z', '+00:00'))
+    except ValueError as e:
+        logger.error(f"Error parsing block expiry {block_expires_at!r}: {e}")
+        return None
+    return expiry if expiry.tzinfo else expiry.replace(tzinfo=timezone.utc)
+
+def block_has_expired(membership: dict, now: datetime) -> bool:
+    """True if a timed block's block_expires_at has passed"""
+    if membership.get('status') != 'blocked':
+        return False
+    expiry = parse_block_expiry(membership.get('block_expires_at'))
+    return expiry is not None and now >= expiry
+
+class SpacePermissions:
+    """What a user may do in one space, resolved from their cached membership map"""
+    def __init__(self, user: User, space_id: str, membership: Optional[dict]):
+        self.space_id = space_id
+        self.membership = membership
+        self.is_admin = user.role == 'admin'
+        status = membership.get('status') if membership else None
+        self.is_blocked = status == 'blocked'
+        self.block_type = membership.get('block_type', 'hard') if self.is_blocked else None
+        self.block_expires_at = membership.get('block_expires_at') if self.is_blocked else None
+        self.is_member = self.is_admin or status == 'member'
+        self.is_manager = self.is_admin or bool(membership and membership.get('role') == 'manager')
+
+async def resolve_space_permissions(user: User, space_id: str) -> SpacePermissions:
+    """
+    Resolve membership, manager and block status for a space. The block expiry scheduler
+    persists unblocks; a block that expired while the map was cached is lifted in memory.
+    """
+    memberships = await get_membership_map(user.id)
+    membership = memberships.get(space_id)
+    if membership and block_has_expired(membership, datetime.now(timezone.utc)):
+        membership = {**membership, "status": "member", "block_type": "hard", "block_expires_at": None}
+    return SpacePermissions(user, space_id, membership)
+
 async def is_space_manager_or_admin(user: User, space_id: str) -> bool:
     """Check if user is an admin or manager of the space"""
     if user.role == 'admin':
         return True
-    
-    membership = await db.space_memberships.find_one({
-        "user_id": user.id,
-        "space_id": space_id,
-        "role": "manager"
-    })
-    return bool(membership)
+    return (await resolve_space_permissions(user, space_id)).is_manager
 
 async def is_space_member(user: User, space_id: str) -> bool:
     """Check if user is a member of the space"""
     if user.role == 'admin':
         return True
-    
-    membership = await db.space_memberships.find_one({
-        "user_id": user.id,
-        "space_id": space_id,
-        "status": "member"
-    })
-    return bool(membership)
+    return (await resolve_space_permissions(user, space_id)).is_member
 
+# ==================== BLOCK EXPIRY SCHEDULER ====================
 
-async def check_and_unblock_expired_memberships(user_id: str, space_id: str):
-    """Check if a user's block has expired and auto-unblock them"""
-    membership = await db.space_memberships.find_one({
-        "user_id": user_id,
-        "space_id": space_id,
-        "status": "blocked"
-    })
-    
-    if not membership:
-        return None
-    
-    # Check if block has an expiry date
-    block_expires_at = membership.get('block_expires_at')
-    if block_expires_at:
+# Timed blocks are lifted on schedule instead of on the request path: a min-heap holds upcoming
+# block_expires_at deadlines and each tick unblocks everything due with one bulk write. The heap
+# is rebuilt from the status/block_expires_at index at startup and by the block_expiry_sweep job
+# every BLOCK_EXPIRY_RESYNC_SECONDS (which also picks up blocks created on other workers).
+BLOCK_EXPIRY_RESYNC_SECONDS = int(os.environ.get('BLOCK_EXPIRY_RESYNC_SECONDS', '300'))
+
+class BlockExpiryScheduler:
+    """Min-heap of (expires_at, user_id, space_id, stored block_expires_at) deadlines"""
+    def __init__(self):
+        self.heap = []
+        self.wakeup: Optional[asyncio.Event] = None
+        self.stats = {"scheduled": 0, "unblocked": 0, "ticks": 0, "last_rebuild_at": None}
+
+    def schedule(self, user_id: str, space_id: str, block_expires_at: Optional[str]):
+        """Track a timed block; wakes the loop if it is now the earliest deadline"""
+        expiry = parse_block_expiry(block_expires_at)
+        if expiry is None:
+            return
+        heapq.heappush(self.heap, (expiry, user_id, space_id, block_expires_at))
+        self.stats['scheduled'] += 1
+        if self.wakeup and self.heap[0][0] == expiry:
+            self.wakeup.set()
+
+    async def rebuild(self):
+        """Reload every timed block from the database"""
+        heap = []
+        async for m in db.space_memberships.find(
+            {"status": "blocked", "block_expires_at": {"$ne": None}},
+            {"_id": 0, "user_id": 1, "space_id": 1, "block_expires_at": 1}
+        ):
+            expiry = parse_block_expiry(m['block_expires_at'])
+            if expiry is not None:
+                heap.append((expiry, m['user_id'], m['space_id'], m['block_expires_at']))
+        heapq.heapify(heap)
+        self.heap = heap
+        self.stats['last_rebuild_at'] = datetime.now(timezone.utc).isoformat()
+        if self.wakeup:
+            self.wakeup.set()
+
+    def pop_due(self, now: datetime) -> list:
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            due.append(heapq.heappop(self.heap))
+        return due
+
+    def seconds_until_next(self, now: datetime) -> Optional[float]:
+        if not self.heap:
+            return None
+        return max(0.0, (self.heap[0][0] - now).total_seconds())
+
+    async def unblock_due(self) -> int:
+        """Unblock every membership whose deadline has passed in one bulk write"""
+        due = self.pop_due(datetime.now(timezone.utc))
+        self.stats['ticks'] += 1
+        if not due:
+            return 0
+        # Matching on the stored expiry leaves memberships that were unblocked or re-blocked since untouched
+        result = await db.space_memberships.bulk_write([
+            UpdateOne(
+                {"user_id": user_id, "space_id": space_id, "status": "blocked", "block_expires_at": stored},
+                {"$set": {
+                    "status": "member",
+                    "blocked_at": None,
+                    "blocked_by": None,
+                    "block_type": "hard",
+                    "block_expires_at": None
+                }}
+            )
+            for _, user_id, space_id, stored in due
+        ], ordered=False)
+        invalidate_membership_map(*{user_id for _, user_id, _, _ in due})
+        self.stats['unblocked'] += result.modified_count
+        if result.modified_count:
+            logger.info(f"🔓 Block expiry: unblocked {result.modified_count} memberships")
+        return result.modified_count
+
+    async def run(self):
+        self.wakeup = asyncio.Event()
         try:
-            expiry_datetime = datetime.fromisoformat(block_expires_at.replace('Z', '+00:00'))
-            now = datetime.now(timezone.utc)
-            
-            # If block has expired, auto-unblock
-            if now >= expiry_datetime:
-                await db.space_memberships.update_one(
-                    {
-                        "user_id": user_id,
-                        "space_id": space_id
-                    },
-                    {
-                        "$set": {
-                            "status": "member",
-                            "blocked_at": None,
-                            "blocked_by": None,
-                            "block_type": "hard",
-                            "block_expires_at": None
-                        }
-                    }
-                )
-                return "unblocked"
+            await self.rebuild()
         except Exception as e:
-            logger.error(f"Error checking block expiry: {e}")
-    
-    return "blocked"
+            logger.error(f"Block expiry rebuild failed: {e}")
+        while True:
+            try:
+                await self.unblock_due()
+            except Exception as e:
+                logger.error(f"Block expiry tick failed: {e}")
+
+            # Sleep until the earliest deadline, or until schedule()/rebuild() brings one forward
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.seconds_until_next(datetime.now(timezone.utc)))
+            except asyncio.TimeoutError:
+                pass
+
+block_expiry_scheduler = BlockExpiryScheduler()
+
+
+# ==================== POINTS & LEADERBOARD HELPERS ====================
+
+LEVEL_TABLE_TTL_SECONDS = int(os.environ.get('LEVEL_TABLE_TTL_SECONDS', '300'))
+
+class LevelTable:
+    """Levels sorted by points_required; level_for() is a bisect over the thresholds"""
+    def __init__(self, levels: List[dict]):
+        self.levels = sorted(levels, key=lambda l: (l['points_required'], l['level_number']))
+        self.thresholds = [l['points_required'] for l in self.levels]
+        self.by_number = {l['level_number']: l for l in self.levels}
+        self.loaded_at = time.monotonic()
+
+    def level_for(self, points: float) -> int:
+        """Highest level whose points_required the user has reached (1 if none)"""
+        idx = bisect_right(self.thresholds, points)
+        return self.levels[idx - 1]['level_number'] if idx else 1
+
+    def get(self, level_number: int) -> Optional[dict]:
+        return self.by_number.get(level_number)
+
+level_table: Optional[LevelTable] = None
+
+async def get_level_table() -> LevelTable:
+    """
+    In-process copy of db.levels. The level admin endpoints invalidate it; the TTL
+    picks up changes made through other app workers.
+    """
+    global level_table
+    if level_table is None or time.monotonic() - level_table.loaded_at > LEVEL_TABLE_TTL_SECONDS:
+        level_table = LevelTable(await db.levels.find({}, {"_id": 0}).to_list(None))
+    return level_table
+
+def invalidate_level_table():
+    global level_table
+    level_table = None
 
-async def get_effective_block_status(user_id: str, space_id: str) -> dict:
-    """Get the effective block status for a user in a space, checking for expiry"""
-    # First, check and auto-unblock if expired
-    await check_and_unblock_expired_memberships(user_id, space_id)
+async def award_points_batch(awards: List[dict]):
+    """
+    Apply every point award produced by one action. Transactions and day buckets are
+    each written with one bulk_write, and each user's total is $inc'd once with the
+    new total and level taken from the returned document.
     
-    # Re-fetch membership to get current status
-    membership = await db.space_memberships.find_one({
-        "user_id": user_id,
-        "space_id": space_id
-    })
+    Each award takes the award_points() keyword arguments.
+    """
+    if not awards:
+        return
     
-    if not membership:
-        return {"is_blocked": False, "block_type": None}
+    transaction_ops = []
+    bucket_points: Dict[tuple, float] = {}
+    user_points: Dict[str, float] = {}
+    for award in awards:
+        transaction = PointTransaction(**award)
+        transaction_dict = transaction.model_dump()
+        transaction_dict['created_at'] = transaction_dict['created_at'].isoformat()
+        transaction_ops.append(InsertOne(transaction_dict))
+        
+        # Roll the points into the user's bucket for the day (drives week/month leaderboards)
+        bucket_key = (transaction.user_id, points_bucket_day(transaction.created_at))
+        bucket_points[bucket_key] = bucket_points.get(bucket_key, 0) + transaction.points
+        user_points[transaction.user_id] = user_points.get(transaction.user_id, 0) + transaction.points
     
-    if membership.get('status') != 'blocked':
-        return {"is_blocked": False, "block_type": None}
+    await db.point_transactions.bulk_write(transaction_ops, ordered=False)
+    await db.point_buckets.bulk_write([
+        UpdateOne({"user_id": user_id, "day": day}, {"$inc": {"points": points}}, upsert=True)
+        for (user_id, day), points in bucket_points.items()
+    ], ordered=False)
     
-    block_type = membership.get('block_type', 'hard')
-    return {
-        "is_blocked": True,
-        "block_type": block_type,
-        "blocked_at": membership.get('blocked_at'),
-        "block_expires_at": membership.get('block_expires_at')
-    }
-
-
-# ==================== POINTS & LEADERBOARD HELPERS ====================
+    # Update each user's total points (and level, from the same write)
+    for user_id, points in user_points.items():
+        await adjust_total_points(user_id, points)
 
 async def award_points(user_id: str, points: float, action_type: str, related_entity_type: str = None, 
                        related_entity_id: str = None, related_user_id: str = None, description: str = None):
     """Award points to a user and create a transaction record"""
-    # Create point transaction
-    transaction = PointTransaction(
-        user_id=user_id,
-        points=points,
-        action_type=action_type,
-        related_entity_type=related_entity_type,
-        related_entity_id=related_entity_id,
-        related_user_id=related_user_id,
-        description=description
-    )
-    
-    transaction_dict = transaction.model_dump()
-    transaction_dict['created_at'] = transaction_dict['created_at'].isoformat()
-    await db.point_transactions.insert_one(transaction_dict)
-    
-    # Update user's total points
-    await db.users.update_one(
-        {"id": user_id},
-        {"$inc": {"total_points": points}}
-    )
-    
-    # Check and update level
-    await update_user_level(user_id)
+    await award_points_batch([{
+        "user_id": user_id,
+        "points": points,
+        "action_type": action_type,
+        "related_entity_type": related_entity_type,
+        "related_entity_id": related_entity_id,
+        "related_user_id": related_user_id,
+        "description": description
+    }])
 
 
 async def track_activity_streak(user_id: str):
@@ -1215,11 +2519,7 @@ async def track_activity_streak(user_id: str):
             
             # Award bonus points if milestone reached
             if bonus_points > 0:
-                await db.users.update_one(
-                    {"id": user_id},
-                    {"$inc": {"total_points": bonus_points}}
-                )
-                await update_user_level(user_id)
+                await adjust_total_points(user_id, bonus_points)
             
             # Send email for milestone
             if send_milestone_email and email_template_type:
@@ -1276,33 +2576,6 @@ async def track_activity_streak(user_id: str):
             }
         )
 
-
-async def update_user_level(user_id: str):
-    """Update user's level based on their total points"""
-    user = await db.users.find_one({"id": user_id})
-    if not user:
-        return
-    
-    total_points = user.get('total_points', 0)
-    
-    # Get all levels sorted by points_required descending
-    levels = await db.levels.find({}, {"_id": 0}).sort("points_required", -1).to_list(100)
-    
-    # Find the highest level the user qualifies for
-    new_level = 1
-    for level in levels:
-        if total_points >= level['points_required']:
-            new_level = level['level_number']
-            break
-    
-    # Update user's level if it changed
-    current_level = user.get('current_level', 1)
-    if new_level != current_level:
-        await db.users.update_one(
-            {"id": user_id},
-            {"$set": {"current_level": new_level}}
-        )
-
 async def get_user_leaderboard_stats(user_id: str):
     """Get user's leaderboard statistics including next level info"""
     user = await db.users.find_one({"id": user_id}, {"_id": 0})
@@ -1312,11 +2585,13 @@ async def get_user_leaderboard_stats(user_id: str):
     total_points = user.get('total_points', 0)
     current_level = user.get('current_level', 1)
     
+    levels = await get_level_table()
+    
     # Get current level details
-    current_level_obj = await db.levels.find_one({"level_number": current_level}, {"_id": 0})
+    current_level_obj = levels.get(current_level)
     
     # Get next level
-    next_level_obj = await db.levels.find_one({"level_number": current_level + 1}, {"_id": 0})
+    next_level_obj = levels.get(current_level + 1)
     
     points_to_next_level = None
     next_level_points = None
@@ -1335,6 +2610,538 @@ async def get_user_leaderboard_stats(user_id: str):
     }
 
 
+# ==================== LEADERBOARD MATERIALIZATION ====================
+
+# Top-N per time filter is precomputed into db.leaderboards by a background loop;
+# week/month sum per-user daily buckets (db.point_buckets) instead of raw transactions.
+# Every user's week/month total from the same refresh is kept in db.leaderboard_totals so
+# the rank of a user outside the top-N is an indexed count, not a per-request $group.
+# Only the job leader writes boards and totals (see get_materialized_leaderboard).
+LEADERBOARD_TOTALS_BATCH_SIZE = 1000
+LEADERBOARD_SIZE = int(os.environ.get('LEADERBOARD_SIZE', '100'))
+LEADERBOARD_REFRESH_SECONDS = int(os.environ.get('LEADERBOARD_REFRESH_SECONDS', '60'))
+LEADERBOARD_WINDOW_DAYS = {"week": 7, "month": 30}
+LEADERBOARD_USER_PROJECTION = {"_id": 0, "id": 1, "name": 1, "picture": 1, "total_points": 1, "current_level": 1, "archived": 1}
+
+def points_bucket_day(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).date().isoformat()
+
+def leaderboard_window_start(time_filter: str) -> Optional[str]:
+    """First day bucket in the window (today counts as day one), or None for all-time"""
+    days = LEADERBOARD_WINDOW_DAYS.get(time_filter)
+    if days is None:
+        return None
+    return (datetime.now(timezone.utc).date() - timedelta(days=days - 1)).isoformat()
+
+def leaderboard_entry(user_doc: dict, points: float) -> dict:
+    return {
+        "user_id": user_doc['id'],
+        "name": user_doc['name'],
+        "picture": user_doc.get('picture'),
+        "points": points,
+        "level": user_doc.get('current_level', 1)
+    }
+
+async def aggregate_window_totals(start_day: str) -> List[dict]:
+    """Every user's points since start_day, highest first: [{"_id": user_id, "points": n}]"""
+    return await db.point_buckets.aggregate([
+        {"$match": {"day": {"$gte": start_day}}},
+        {"$group": {"_id": "$user_id", "points": {"$sum": "$points"}}},
+        {"$match": {"points": {"$gt": 0}}},
+        {"$sort": {"points": -1, "_id": 1}}
+    ]).to_list(None)
+
+async def store_window_totals(time_filter: str, totals: List[dict]) -> dict:
+    """Bring the stored per-user totals for a week/month window in line with this refresh, writing only changes"""
+    stored = {
+        row['user_id']: row['points']
+        async for row in db.leaderboard_totals.find({"window": time_filter}, {"_id": 0, "user_id": 1, "points": 1})
+    }
+    batch = []
+    for total in totals:
+        if stored.pop(total['_id'], None) == total['points']:
+            continue
+        batch.append(UpdateOne(
+            {"window": time_filter, "user_id": total['_id']},
+            {"$set": {"points": total['points']}},
+            upsert=True
+        ))
+    for start in range(0, len(batch), LEADERBOARD_TOTALS_BATCH_SIZE):
+        await db.leaderboard_totals.bulk_write(batch[start:start + LEADERBOARD_TOTALS_BATCH_SIZE], ordered=False)
+    # Whatever is left had all its points age out of the window
+    stale = list(stored)
+    for start in range(0, len(stale), LEADERBOARD_TOTALS_BATCH_SIZE):
+        await db.leaderboard_totals.delete_many(
+            {"window": time_filter, "user_id": {"$in": stale[start:start + LEADERBOARD_TOTALS_BATCH_SIZE]}}
+        )
+    return {"written": len(batch), "removed": len(stale)}
+
+async def compute_leaderboard(time_filter: str, totals: Optional[List[dict]] = None) -> List[dict]:
+    """Top LEADERBOARD_SIZE non-archived users with points in the window"""
+    start_day = leaderboard_window_start(time_filter)
+    entries = []
+    
+    if start_day is None:
+        users = await db.users.find(
+            {"archived": False, "total_points": {"$gt": 0}},
+            LEADERBOARD_USER_PROJECTION
+        ).sort("total_points", -1).limit(LEADERBOARD_SIZE).to_list(LEADERBOARD_SIZE)
+        entries = [leaderboard_entry(u, u.get('total_points', 0)) for u in users]
+    else:
+        if totals is None:
+            totals = await aggregate_window_totals(start_day)
+        
+        # Hydrate in chunks, skipping archived users, until the board is full
+        chunk_size = LEADERBOARD_SIZE * 2
+        for start in range(0, len(totals), chunk_size):
+            chunk = totals[start:start + chunk_size]
+            users = await db.users.find(
+                {"id": {"$in": [t['_id'] for t in chunk]}, "archived": False},
+                LEADERBOARD_USER_PROJECTION
+            ).to_list(len(chunk))
+            users_by_id = {u['id']: u for u in users}
+            for total in chunk:
+                user_doc = users_by_id.get(total['_id'])
+                if user_doc:
+                    entries.append(leaderboard_entry(user_doc, total['points']))
+            if len(entries) >= LEADERBOARD_SIZE:
+                break
+        entries = entries[:LEADERBOARD_SIZE]
+    
+    for idx, entry in enumerate(entries):
+        entry['rank'] = idx + 1
+    return entries
+
+async def hydrate_rank_entries(ranked: List[tuple]) -> List[dict]:
+    """Turn rank index rows [(rank, user_id, points)] into leaderboard entries"""
+    users = await db.users.find(
+        {"id": {"$in": [uid for _, uid, _ in ranked]}},
+        LEADERBOARD_USER_PROJECTION
+    ).to_list(len(ranked))
+    users_by_id = {u['id']: u for u in users}
+    entries = []
+    for rank, uid, points in ranked:
+        if uid in users_by_id:
+            entries.append({**leaderboard_entry(users_by_id[uid], points), "rank": rank})
+    return entries
+
+# The leader's job and a cold-path request on the same worker must not refresh at once
+leaderboard_refresh_lock = asyncio.Lock()
+
+async def refresh_leaderboard(time_filter: str) -> dict:
+    """Recompute one leaderboard and store it with its freshness timestamp"""
+    async with leaderboard_refresh_lock:
+        computed_at = datetime.now(timezone.utc).isoformat()
+        start_day = leaderboard_window_start(time_filter)
+        totals = None
+        if start_day is not None:
+            totals = await aggregate_window_totals(start_day)
+            await store_window_totals(time_filter, totals)
+        board = {
+            "id": time_filter,
+            "entries": await compute_leaderboard(time_filter, totals),
+            "computed_at": computed_at
+        }
+        await db.leaderboards.replace_one({"id": time_filter}, board, upsert=True)
+        return board
+
+async def get_materialized_leaderboard(time_filter: str) -> dict:
+    board = await db.leaderboards.find_one({"id": time_filter}, {"_id": 0})
+    if not board:
+        # First request before the refresher has run. Only the job leader stores a board;
+        # elsewhere it is computed for this response alone and the leader's job fills it in
+        if job_scheduler.is_leader:
+            board = await refresh_leaderboard(time_filter)
+        else:
+            board = {
+                "id": time_filter,
+                "entries": await compute_leaderboard(time_filter),
+                "computed_at": datetime.now(timezone.utc).isoformat()
+            }
+    return board
+
+async def get_leaderboard_rank(user_id: str, time_filter: str) -> Optional[int]:
+    """
+    Rank of a user outside the materialized top-N. All-time counts users directly; week/month
+    count the stored window totals, so they are as fresh as the board itself.
+    """
+    if time_filter not in LEADERBOARD_WINDOW_DAYS:
+        user_doc = await db.users.find_one({"id": user_id}, {"_id": 0, "total_points": 1, "archived": 1})
+        if not user_doc or user_doc.get('archived') or user_doc.get('total_points', 0) <= 0:
+            return None
+        ahead = await db.users.count_documents({"archived": False, "total_points": {"$gt": user_doc['total_points']}})
+        return ahead + 1
+    
+    mine = await db.leaderboard_totals.find_one({"window": time_filter, "user_id": user_id}, {"_id": 0, "points": 1})
+    if not mine:
+        return None
+    # Archived users are not excluded here; they cannot earn points so rarely appear in a window
+    ahead = await db.leaderboard_totals.count_documents({"window": time_filter, "points": {"$gt": mine['points']}})
+    return ahead + 1
+
+
+# ==================== LEVEL RECALCULATION ====================
+
+level_recalculation_task: Optional[asyncio.Task] = None
+
+def level_bands(table: LevelTable) -> List[dict]:
+    """
+    Partition total_points into contiguous [min, max) ranges, one per level, matching
+    LevelTable.level_for(). Points below the lowest threshold are level 1.
+    """
+    bounds = [None] + table.thresholds + [None]
+    levels = [1] + [l['level_number'] for l in table.levels]
+    bands = []
+    for i, level_number in enumerate(levels):
+        low, high = bounds[i], bounds[i + 1]
+        if low is not None and high is not None and low >= high:
+            continue  # Shadowed by a later level with the same threshold
+        bands.append({"level": level_number, "min": low, "max": high})
+    return bands
+
+def level_band_query(band: dict) -> dict:
+    points_range = {}
+    if band['min'] is not None:
+        points_range["$gte"] = band['min']
+    if band['max'] is not None:
+        points_range["$lt"] = band['max']
+    query = {"total_points": points_range} if points_range else {}
+    
+    # Users without total_points have 0 points
+    if (band['min'] is None or band['min'] <= 0) and (band['max'] is None or band['max'] > 0):
+        query = {"$or": [query, {"total_points": None}]}
+    
+    query["current_level"] = {"$ne": band['level']}
+    return query
+
+async def run_level_recalculation(job_id: str):
+    """One update_many per level band, with progress written to the job document"""
+    try:
+        invalidate_level_table()
+        bands = level_bands(await get_level_table())
+        await db.background_jobs.update_one(
+            {"id": job_id},
+            {"$set": {"status": "running", "bands_total": len(bands)}}
+        )
+        
+        users_updated = 0
+        for done, band in enumerate(bands, start=1):
+            result = await db.users.update_many(level_band_query(band), {"$set": {"current_level": band['level']}})
+            users_updated += result.modified_count
+            await db.background_jobs.update_one(
+                {"id": job_id},
+                {"$set": {"bands_done": done, "users_updated": users_updated}}
+            )
+        
+        # Cached principals carry current_level
+        if users_updated:
+            principal_cache.clear()
+        
+        await db.background_jobs.update_one(
+            {"id": job_id},
+            {"$set": {"status": "completed", "finished_at": datetime.now(timezone.utc).isoformat()}}
+        )
+        logger.info(f"Level recalculation {job_id} completed: {users_updated} users updated")
+    except asyncio.CancelledError:
+        await db.background_jobs.update_one(
+            {"id": job_id},
+            {"$set": {"status": "superseded", "finished_at": datetime.now(timezone.utc).isoformat()}}
+        )
+        raise
+    except Exception as e:
+        logger.error(f"Level recalculation {job_id} failed: {e}")
+        await db.background_jobs.update_one(
+            {"id": job_id},
+            {"$set": {"status": "failed", "error": str(e), "finished_at": datetime.now(timezone.utc).isoformat()}}
+        )
+
+async def start_level_recalculation(trigger: str) -> str:
+    """Queue a background recalculation of every user's level; a newer job supersedes a running one"""
+    global level_recalculation_task
+    if level_recalculation_task and not level_recalculation_task.done():
+        level_recalculation_task.cancel()
+    
+    job_id = str(uuid.uuid4())
+    await db.background_jobs.insert_one({
+        "id": job_id,
+        "type": "level_recalculation",
+        "trigger": trigger,
+        "status": "queued",
+        "bands_total": None,
+        "bands_done": 0,
+        "users_updated": 0,
+        "error": None,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "finished_at": None
+    })
+    level_recalculation_task = run_in_background(run_level_recalculation(job_id))
+    return job_id
+
+
+# ==================== JOB SCHEDULER ====================
+
+# Periodic maintenance runs in-process on asyncio. Each job has an interval or cron trigger with
+# jitter. Leader-only jobs run on whichever worker holds the MongoDB lease in job_locks, so under
+# several uvicorn workers each runs once per tick; per-worker jobs (in-memory indexes) run everywhere.
+JOB_LEADER_LOCK_ID = "job_scheduler_leader"
+JOB_LEADER_LEASE_SECONDS = int(os.environ.get('JOB_LEADER_LEASE_SECONDS', '60'))
+SESSION_CLEANUP_CRON = os.environ.get('SESSION_CLEANUP_CRON', '*/15 * * * *')
+SUBSCRIPTION_EXPIRY_SECONDS = int(os.environ.get('SUBSCRIPTION_EXPIRY_SECONDS', '300'))
+COMMUNITY_COUNT_RECONCILE_CRON = os.environ.get('COMMUNITY_COUNT_RECONCILE_CRON', '0 3 * * *')
+NOTIFICATION_COUNTER_RECONCILE_CRON = os.environ.get('NOTIFICATION_COUNTER_RECONCILE_CRON', '30 3 * * *')
+
+class IntervalTrigger:
+    """Fire every `seconds` (plus up to `jitter_seconds`), optionally once right after startup"""
+    def __init__(self, seconds: float, jitter_seconds: float = 0, run_at_start: bool = False):
+        self.seconds = seconds
+        self.jitter_seconds = jitter_seconds
+        self.run_at_start = run_at_start
+
+    def next_run(self, now: datetime, first: bool) -> datetime:
+        delay = 0 if first and self.run_at_start else self.seconds
+        return now + timedelta(seconds=delay + random.uniform(0, self.jitter_seconds))
+
+    def describe(self) -> str:
+        return f"every {self.seconds}s"
+
+class CronTrigger:
+    """Five-field cron expression (minute hour day-of-month month day-of-week) in UTC"""
+    FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression: str, jitter_seconds: float = 0):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.jitter_seconds = jitter_seconds
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse_field(field, low, high) for field, (low, high) in zip(fields, self.FIELD_RANGES)
+        )
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> set:
+        values = set()
+        for part in field.split(','):
+            spec, has_step, step = part.partition('/')
+            if spec == '*':
+                start, end = low, high
+            elif '-' in spec:
+                start, end = (int(v) for v in spec.split('-', 1))
+            else:
+                start = int(spec)
+                end = high if has_step else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"Cron field {field!r} out of range {low}-{high}")
+            values.update(range(start, end + 1, int(step) if has_step else 1))
+        if high == 7:
+            # Day of week: 0 and 7 are both Sunday
+            values = {v % 7 for v in values}
+        return values
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day_ok = dt.day in self.days
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        if self.any_day and self.any_weekday:
+            return True
+        if self.any_day:
+            return weekday_ok
+        if self.any_weekday:
+            return day_ok
+        return day_ok or weekday_ok
+
+    def next_fire(self, after: datetime) -> datetime:
+        """First matching minute strictly after `after`"""
+        dt = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt
+        raise ValueError(f"Cron expression never fires: {self.expression!r}")
+
+    def next_run(self, now: datetime, first: bool) -> datetime:
+        return self.next_fire(now) + timedelta(seconds=random.uniform(0, self.jitter_seconds))
+
+    def describe(self) -> str:
+        return f"cron {self.expression}"
+
+class ScheduledJob:
+    def __init__(self, name: str, func, trigger, leader_only: bool = True):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.leader_only = leader_only
+        self.stats = {
+            "runs": 0,
+            "failures": 0,
+            "skipped_not_leader": 0,
+            "last_started_at": None,
+            "last_finished_at": None,
+            "last_duration_ms": None,
+            "max_duration_ms": None,
+            "total_duration_ms": 0.0,
+            "last_result": None,
+            "last_error": None,
+            "next_run_at": None,
+        }
+
+    def snapshot(self) -> dict:
+        completed = self.stats['runs'] + self.stats['failures']
+        return {
+            "name": self.name,
+            "trigger": self.trigger.describe(),
+            "leader_only": self.leader_only,
+            **self.stats,
+            "avg_duration_ms": round(self.stats['total_duration_ms'] / completed, 2) if completed else None,
+        }
+
+class JobScheduler:
+    """Runs registered jobs on their triggers; leader-only jobs need the job_locks lease"""
+    def __init__(self):
+        self.jobs: Dict[str, ScheduledJob] = {}
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.leader_until: Optional[datetime] = None
+
+    def add_job(self, name: str, func, trigger, leader_only: bool = True):
+        self.jobs[name] = ScheduledJob(name, func, trigger, leader_only)
+
+    @property
+    def is_leader(self) -> bool:
+        return self.leader_until is not None and self.leader_until > datetime.now(timezone.utc)
+
+    async def renew_leadership(self):
+        """Take or extend the leader lease; another worker's unexpired lease makes the upsert collide"""
+        was_leader = self.is_leader
+        now = datetime.now(timezone.utc)
+        lease_until = now + timedelta(seconds=JOB_LEADER_LEASE_SECONDS)
+        try:
+            await db.job_locks.find_one_and_update(
+                {
+                    "id": JOB_LEADER_LOCK_ID,
+                    "$or": [{"owner": self.worker_id}, {"lease_expires_at": {"$lte": now.isoformat()}}]
+                },
+                {"$set": {
+                    "owner": self.worker_id,
+                    "lease_expires_at": lease_until.isoformat(),
+                    "renewed_at": now.isoformat()
+                }},
+                upsert=True
+            )
+            self.leader_until = lease_until
+        except DuplicateKeyError:
+            self.leader_until = None
+        if self.is_leader != was_leader:
+            logger.info(f"⏱️ Job scheduler: worker {self.worker_id} {'is now' if self.is_leader else 'is no longer'} leader")
+
+    async def leadership_loop(self):
+        while True:
+            try:
+                await self.renew_leadership()
+            except Exception as e:
+                logger.error(f"Job scheduler lease renewal failed: {e}")
+            await asyncio.sleep(JOB_LEADER_LEASE_SECONDS / 3)
+
+    async def run_job(self, job: ScheduledJob):
+        if job.leader_only and not self.is_leader:
+            job.stats['skipped_not_leader'] += 1
+            return
+        job.stats['last_started_at'] = datetime.now(timezone.utc).isoformat()
+        started = time.perf_counter()
+        try:
+            job.stats['last_result'] = await job.func()
+            job.stats['last_error'] = None
+            job.stats['runs'] += 1
+        except Exception as e:
+            job.stats['failures'] += 1
+            job.stats['last_error'] = str(e)
+            logger.error(f"Job {job.name} failed: {e}")
+        finally:
+            duration_ms = round((time.perf_counter() - started) * 1000, 2)
+            job.stats['last_duration_ms'] = duration_ms
+            job.stats['max_duration_ms'] = max(job.stats['max_duration_ms'] or 0, duration_ms)
+            job.stats['total_duration_ms'] += duration_ms
+            job.stats['last_finished_at'] = datetime.now(timezone.utc).isoformat()
+
+    async def job_loop(self, job: ScheduledJob):
+        first = True
+        while True:
+            now = datetime.now(timezone.utc)
+            next_run = job.trigger.next_run(now, first)
+            first = False
+            job.stats['next_run_at'] = next_run.isoformat()
+            await asyncio.sleep(max(0.0, (next_run - now).total_seconds()))
+            await self.run_job(job)
+
+    async def run(self):
+        # The lease relies on the unique id index; make sure it exists before the first upsert
+        await db.job_locks.create_indexes(INDEX_CATALOG["job_locks"])
+        await self.renew_leadership()
+        run_in_background(self.leadership_loop())
+        for job in self.jobs.values():
+            run_in_background(self.job_loop(job))
+        logger.info(f"Job scheduler started: {len(self.jobs)} jobs, worker {self.worker_id}")
+
+job_scheduler = JobScheduler()
+
+async def cleanup_expired_sessions() -> dict:
+    """Delete sessions past expires_at"""
+    result = await db.user_sessions.delete_many({"expires_at": {"$lt": datetime.now(timezone.utc).isoformat()}})
+    return {"deleted": result.deleted_count}
+
+async def expire_subscriptions() -> dict:
+    """Move active subscriptions past ends_at to expired"""
+    now = datetime.now(timezone.utc).isoformat()
+    result = await db.subscriptions.update_many(
+        {"status": "active", "ends_at": {"$lte": now}},
+        {"$set": {"status": "expired", "expired_at": now}}
+    )
+    return {"expired": result.modified_count}
+
+async def sweep_expired_blocks() -> dict:
+    """Reload timed blocks (including other workers') and lift any that are due"""
+    await block_expiry_scheduler.rebuild()
+    return {"unblocked": await block_expiry_scheduler.unblock_due(), "pending": len(block_expiry_scheduler.heap)}
+
+async def refresh_leaderboards() -> dict:
+    """Recompute the materialized week/month/all-time leaderboards"""
+    failed = []
+    for time_filter in ("week", "month", "all"):
+        try:
+            await refresh_leaderboard(time_filter)
+        except Exception as e:
+            logger.error(f"Leaderboard refresh failed for {time_filter}: {e}")
+            failed.append(time_filter)
+    if failed:
+        raise RuntimeError(f"Leaderboard refresh failed for {', '.join(failed)}")
+    return {"refreshed": ["week", "month", "all"]}
+
+async def resync_rank_index() -> dict:
+    """Rebuild this worker's in-memory rank index"""
+    await seed_rank_index()
+    return {"ranked_users": len(rank_index)}
+
+async def reconcile_community_member_count_job() -> dict:
+    return {"members": await reconcile_community_member_count()}
+
+job_scheduler.add_job("expired_sessions", cleanup_expired_sessions, CronTrigger(SESSION_CLEANUP_CRON, jitter_seconds=30))
+job_scheduler.add_job("subscription_expiry", expire_subscriptions, IntervalTrigger(SUBSCRIPTION_EXPIRY_SECONDS, jitter_seconds=15, run_at_start=True))
+job_scheduler.add_job("block_expiry_sweep", sweep_expired_blocks, IntervalTrigger(BLOCK_EXPIRY_RESYNC_SECONDS, jitter_seconds=10, run_at_start=True))
+job_scheduler.add_job("leaderboards", refresh_leaderboards, IntervalTrigger(LEADERBOARD_REFRESH_SECONDS, jitter_seconds=5, run_at_start=True))
+job_scheduler.add_job("rank_index_resync", resync_rank_index, IntervalTrigger(RANK_INDEX_RESYNC_SECONDS, jitter_seconds=10, run_at_start=True), leader_only=False)
+job_scheduler.add_job("community_member_count", reconcile_community_member_count_job, CronTrigger(COMMUNITY_COUNT_RECONCILE_CRON, jitter_seconds=60))
+job_scheduler.add_job("notification_counters", reconcile_unread_notifications, CronTrigger(NOTIFICATION_COUNTER_RECONCILE_CRON, jitter_seconds=60))
+job_scheduler.add_job("websocket_heartbeat", ws_manager.heartbeat, IntervalTrigger(WS_PING_INTERVAL_SECONDS), leader_only=False)
+
+
 # ==================== AUTH ENDPOINTS ====================
 
 @api_router.post("/auth/register")
@@ -1398,7 +3205,7 @@ async def register(user_data: UserCreate, response: Response, invite_token: Opti
     is_founding = user_count < 100
     
     # Hash password
-    password_hash = bcrypt.hashpw(user_data.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    password_hash = await hash_password(user_data.password)
     
     # Create user
     user = User(
@@ -1414,6 +3221,7 @@ async def register(user_data: UserCreate, response: Response, invite_token: Opti
     user_dict = user.model_dump()
     user_dict['created_at'] = user_dict['created_at'].isoformat()
     await db.users.insert_one(user_dict)
+    await adjust_community_member_count(1)
     
     # Auto-join user to auto-join spaces
     auto_join_spaces = await db.spaces.find({"auto_join": True}, {"_id": 0, "id": 1}).to_list(100)
@@ -1510,7 +3318,7 @@ async def login(credentials: UserLogin, response: Response):
     if not user_doc.get('password_hash'):
         raise HTTPException(status_code=401, detail="Password login not available for this account")
     
-    if not bcrypt.checkpw(credentials.password.encode('utf-8'), user_doc['password_hash'].encode('utf-8')):
+    if not await verify_password(credentials.password, user_doc['password_hash']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Create session
@@ -1627,6 +3435,7 @@ async def google_login(request: Request, response: Response):
             user_dict = user.model_dump()
             user_dict['created_at'] = user_dict['created_at'].isoformat()
             await db.users.insert_one(user_dict)
+            await adjust_community_member_count(1)
             
             # Auto-join auto_join spaces
             auto_join_spaces = await db.spaces.find({"auto_join": True}, {"_id": 0}).to_list(100)
@@ -1639,6 +3448,7 @@ async def google_login(request: Request, response: Response):
                 membership_dict = membership.model_dump()
                 membership_dict['joined_at'] = membership_dict['joined_at'].isoformat()
                 await db.space_memberships.insert_one(membership_dict)
+                invalidate_membership_map(user_id)
                 
                 # Award 1 point for joining a space
                 await award_points(
@@ -1767,6 +3577,7 @@ async def process_session(request: Request, response: Response, x_session_id: st
         user_dict = user.model_dump()
         user_dict['created_at'] = user_dict['created_at'].isoformat()
         await db.users.insert_one(user_dict)
+        await adjust_community_member_count(1)
         user_id = user.id
     else:
         user_id = user_doc['id']
@@ -1800,7 +3611,9 @@ async def process_session(request: Request, response: Response, x_session_id: st
 @api_router.get("/auth/me")
 async def get_me(user: User = Depends(require_auth)):
     """Get current user"""
-    return user
+    # The cached principal may lag on points/level, so return the stored document
+    user_doc = await db.users.find_one({"id": user.id}, {"_id": 0})
+    return User(**user_doc) if user_doc else user
 
 
 @api_router.put("/users/profile-picture")
@@ -1825,6 +3638,7 @@ async def update_profile_picture(request: Request, user: User = Depends(require_
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
+    invalidate_user_principal(user.id)
     return {"message": "Profile picture updated successfully", "picture": picture_data}
 
 @api_router.delete("/users/profile-picture")
@@ -1838,6 +3652,7 @@ async def remove_profile_picture(user: User = Depends(require_auth)):
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
+    invalidate_user_principal(user.id)
     return {"message": "Profile picture removed successfully"}
 
 
@@ -1847,6 +3662,7 @@ async def logout(request: Request, response: Response):
     session_token = request.cookies.get("session_token")
     if session_token:
         await db.user_sessions.delete_one({"session_token": session_token})
+        invalidate_session_principal(session_token)
         response.delete_cookie(key="session_token", path="/")
     return {"message": "Logged out"}
 
@@ -1898,7 +3714,7 @@ async def admin_create_user(user_data: AdminUserCreate, user: User = Depends(req
     
     # Generate random password
     random_password = str(uuid.uuid4())[:12]
-    password_hash = bcrypt.hashpw(random_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    password_hash = await hash_password(random_password)
     
     # Create user
     new_user = User(
@@ -1913,6 +3729,7 @@ async def admin_create_user(user_data: AdminUserCreate, user: User = Depends(req
     user_dict = new_user.model_dump()
     user_dict['created_at'] = user_dict['created_at'].isoformat()
     await db.users.insert_one(user_dict)
+    await adjust_community_member_count(1)
     
     return {
         "user": {
@@ -2031,10 +3848,7 @@ async def create_payment_order(request: Request, tier_id: str, currency: str, us
             # If final amount is 0 (fully covered by credits), skip payment
             if final_amount <= 0:
                 # Deduct points and activate subscription immediately
-                await db.users.update_one(
-                    {"id": user.id},
-                    {"$inc": {"total_points": -points_to_deduct}}
-                )
+                await adjust_total_points(user.id, -points_to_deduct)
                 
                 # Create subscription record
                 subscription = Subscription(
@@ -2102,10 +3916,7 @@ async def create_payment_order(request: Request, tier_id: str, currency: str, us
             # If final amount is 0 (fully covered by credits), skip payment
             if final_amount <= 0:
                 # Deduct points and activate subscription immediately
-                await db.users.update_one(
-                    {"id": user.id},
-                    {"$inc": {"total_points": -points_to_deduct}}
-                )
+                await adjust_total_points(user.id, -points_to_deduct)
                 
                 # Create subscription record
                 subscription = Subscription(
@@ -2236,10 +4047,7 @@ async def verify_razorpay_payment(request: Request, user: User = Depends(require
         # Deduct points if credits were applied
         points_to_deduct = transaction['metadata'].get('points_to_deduct', 0)
         if points_to_deduct > 0:
-            await db.users.update_one(
-                {"id": user.id},
-                {"$inc": {"total_points": -points_to_deduct}}
-            )
+            await adjust_total_points(user.id, -points_to_deduct)
         
         # Create subscription
         tier_id = transaction['metadata'].get('tier_id')
@@ -2269,6 +4077,7 @@ async def verify_razorpay_payment(request: Request, user: User = Depends(require
                 
                 # Update user membership
                 await db.users.update_one({"id": user.id}, {"$set": {"membership_tier": "paid"}})
+                invalidate_user_principal(user.id)
         
         return {"status": "success", "message": "Payment verified successfully"}
         
@@ -2300,10 +4109,7 @@ async def check_payment_status(session_id: str, user: User = Depends(require_aut
             # Deduct points if credits were applied
             points_to_deduct = transaction['metadata'].get('points_to_deduct', 0)
             if points_to_deduct > 0:
-                await db.users.update_one(
-                    {"id": user.id},
-                    {"$inc": {"total_points": -points_to_deduct}}
-                )
+                await adjust_total_points(user.id, -points_to_deduct)
             
             # Create subscription
             tier_id = transaction['metadata'].get('tier_id')
@@ -2333,6 +4139,7 @@ async def check_payment_status(session_id: str, user: User = Depends(require_aut
                     
                     # Update user membership
                     await db.users.update_one({"id": user.id}, {"$set": {"membership_tier": "paid"}})
+                    invalidate_user_principal(user.id)
         
         return status
     except Exception as e:
@@ -2393,21 +4200,39 @@ async def get_spaces(space_group_id: Optional[str] = None, user: User = Depends(
     """Get all spaces or by group - filtered by visibility and user membership"""
     query = {"space_group_id": space_group_id} if space_group_id else {}
     spaces = await db.spaces.find(query, {"_id": 0}).sort("order", 1).to_list(100)
+    space_ids = [space['id'] for space in spaces]
+    is_admin = user.role == 'admin'
     
-    # Get total community member count for auto-join spaces
-    total_members = await db.users.count_documents({"archived": {"$ne": True}})
+    # Caller's memberships for every listed space in one query
+    memberships = {
+        m['space_id']: m
+        async for m in db.space_memberships.find(
+            {"user_id": user.id, "space_id": {"$in": space_ids}},
+            {"_id": 0, "space_id": 1, "status": 1, "role": 1}
+        )
+    }
+    
+    # Pending join requests only matter for spaces the caller is not a member of
+    non_member_ids = [sid for sid in space_ids if sid not in memberships] if not is_admin else []
+    pending_requests = {}
+    if non_member_ids:
+        pending_requests = {
+            pending['space_id']: pending
+            async for pending in db.join_requests.find(
+                {"user_id": user.id, "space_id": {"$in": non_member_ids}, "status": "pending"},
+                {"_id": 0, "id": 1, "space_id": 1}
+            )
+        }
+    
+    # Total community member count for auto-join spaces, from the maintained counter
+    total_members = None
+    if any(space.get('auto_join') for space in spaces):
+        total_members = await get_community_member_count()
     
     # Filter based on visibility and enrich with membership info
     visible_spaces = []
     for space in spaces:
-        # Check if user is admin
-        is_admin = user.role == 'admin'
-        
-        # Get user membership
-        membership = await db.space_memberships.find_one({
-            "space_id": space['id'],
-            "user_id": user.id
-        }, {"_id": 0})
+        membership = memberships.get(space['id'])
         
         # Admins are always considered members
         is_member = is_admin or bool(membership)
@@ -2424,11 +4249,7 @@ async def get_spaces(space_group_id: Optional[str] = None, user: User = Depends(
         
         # Check for pending join requests
         if not is_member:
-            pending_request = await db.join_requests.find_one({
-                "user_id": user.id,
-                "space_id": space['id'],
-                "status": "pending"
-            }, {"_id": 0})
+            pending_request = pending_requests.get(space['id'])
             space['has_pending_request'] = bool(pending_request)
             space['pending_request_id'] = pending_request.get('id') if pending_request else None
         else:
@@ -2475,6 +4296,7 @@ async def join_space(space_id: str, user: User = Depends(require_auth)):
     membership_dict = membership.model_dump()
     membership_dict['joined_at'] = membership_dict['joined_at'].isoformat()
     await db.space_memberships.insert_one(membership_dict)
+    invalidate_membership_map(user.id)
     
     # If it's a join request (private space), notify admins and managers
     if status == "pending":
@@ -2537,6 +4359,7 @@ async def leave_space(space_id: str, user: User = Depends(require_auth)):
         "user_id": user.id,
         "status": "member"
     })
+    invalidate_membership_map(user.id)
     
     if result.deleted_count > 0:
         await db.spaces.update_one({"id": space_id}, {"$inc": {"member_count": -1}})
@@ -2579,28 +4402,140 @@ async def configure_space(space_id: str, request: Request, user: User = Depends(
     
     return {"message": "Space configured successfully"}
 
+# ==================== REACTIONS ====================
+
+# One document per (target, user, emoji) in db.reactions; per-emoji totals are kept
+# on the post/comment as reaction_counts so feeds never load who-reacted lists
+REACTION_TARGETS = {"post": "posts", "comment": "comments"}
+
+def validate_reaction_emoji(emoji: str) -> None:
+    # The emoji becomes a field name under reaction_counts
+    if not emoji or len(emoji) > 32 or '.' in emoji or emoji.startswith('$'):
+        raise HTTPException(status_code=400, detail="Invalid emoji")
+
+async def toggle_reaction(target_type: str, target_id: str, emoji: str, user_id: str) -> bool:
+    """Add the user's reaction, or remove it if present. Returns True if it was added."""
+    key = {"target_type": target_type, "target_id": target_id, "user_id": user_id, "emoji": emoji}
+    # Two attempts cover a concurrent toggle deleting the reaction between our insert and delete
+    for _ in range(2):
+        try:
+            await db.reactions.insert_one({**key, "created_at": datetime.now(timezone.utc).isoformat()})
+            added = True
+        except DuplicateKeyError:
+            result = await db.reactions.delete_one(key)
+            if result.deleted_count == 0:
+                continue
+            added = False
+        await db[REACTION_TARGETS[target_type]].update_one(
+            {"id": target_id},
+            {"$inc": {f"reaction_counts.{emoji}": 1 if added else -1}}
+        )
+        return added
+    raise HTTPException(status_code=409, detail="Reaction changed concurrently, please retry")
+
+async def get_reaction_summary(target_type: str, target_id: str, user_id: str) -> dict:
+    """Current counts for one target plus the caller's own reactions"""
+    doc = await db[REACTION_TARGETS[target_type]].find_one({"id": target_id}, {"_id": 0, "reaction_counts": 1})
+    mine = await db.reactions.find(
+        {"user_id": user_id, "target_type": target_type, "target_id": target_id},
+        {"_id": 0, "emoji": 1}
+    ).to_list(None)
+    my_reactions = [r['emoji'] for r in mine]
+    return {
+        "reaction_counts": (doc or {}).get('reaction_counts', {}),
+        "reacted_by_me": bool(my_reactions),
+        "my_reactions": my_reactions
+    }
+
+async def attach_reaction_state(rows: List[dict], target_type: str, user_id: Optional[str]) -> List[dict]:
+    """Set reacted_by_me / my_reactions on a page of posts or comments with one query"""
+    mine: Dict[str, List[str]] = {}
+    if user_id and rows:
+        reactions = await db.reactions.find(
+            {"user_id": user_id, "target_type": target_type, "target_id": {"$in": [row['id'] for row in rows]}},
+            {"_id": 0, "target_id": 1, "emoji": 1}
+        ).to_list(None)
+        for reaction in reactions:
+            mine.setdefault(reaction['target_id'], []).append(reaction['emoji'])
+    for row in rows:
+        row.setdefault('reaction_counts', {})
+        row['my_reactions'] = mine.get(row['id'], [])
+        row['reacted_by_me'] = bool(row['my_reactions'])
+    return rows
+
+MAX_FEED_PAGE_SIZE = 100
+
+def encode_feed_cursor(post: dict) -> str:
+    """Opaque cursor for the position just after `post` in (created_at, id) descending order"""
+    raw = json.dumps([post['created_at'], post['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_feed_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, post_id = json.loads(raw)
+        if not isinstance(created_at, str) or not isinstance(post_id, str):
+            raise ValueError
+        return created_at, post_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @api_router.get("/spaces/{space_id}/posts")
-async def get_space_posts(space_id: str, skip: int = 0, limit: int = 20):
-    """Get posts in a space, with pinned posts shown first"""
-    # Get all posts for this space
-    all_posts = await db.posts.find({"space_id": space_id}, {"_id": 0}).sort("created_at", -1).to_list(None)
+async def get_space_posts(space_id: str, skip: int = 0, limit: int = 20, user: Optional[User] = Depends(get_current_user)):
+    """Get posts in a space, with pinned posts shown first (offset paging; prefer /feed)"""
+    limit = max(1, min(limit, MAX_FEED_PAGE_SIZE))
+    posts = await db.posts.find(
+        {"space_id": space_id},
+        {"_id": 0}
+    ).sort([("is_pinned", -1), ("created_at", -1), ("id", -1)]).skip(skip).limit(limit).to_list(limit)
     
-    # Separate pinned and regular posts
-    pinned_posts = [p for p in all_posts if p.get('is_pinned', False)]
-    regular_posts = [p for p in all_posts if not p.get('is_pinned', False)]
+    # Enrich with author info
+    await attach_users(posts, 'author_id', 'author')
+    await attach_reaction_state(posts, "post", user.id if user else None)
+    
+    return posts
+
+@api_router.get("/spaces/{space_id}/feed")
+async def get_space_feed(space_id: str, cursor: Optional[str] = None, limit: int = 20, user: Optional[User] = Depends(get_current_user)):
+    """
+    Keyset-paginated space feed, newest first.
     
-    # Combine: pinned first, then regular posts
-    posts = pinned_posts + regular_posts
+    Pinned posts are returned separately on the first page only. Pass the returned
+    next_cursor to fetch the following page; it is null once the feed is exhausted.
+    """
+    limit = max(1, min(limit, MAX_FEED_PAGE_SIZE))
+    # Equality on is_pinned (not $ne) keeps the index walk in (created_at, id) order, so
+    # there is no in-memory SORT; backfill_post_pinned.py sets the field on legacy posts
+    query = {"space_id": space_id, "is_pinned": False}
+    
+    pinned = []
+    if cursor:
+        created_at, post_id = decode_feed_cursor(cursor)
+        query["created_at"] = {"$lte": created_at}
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": post_id}}
+        ]
+    else:
+        pinned = await db.posts.find(
+            {"space_id": space_id, "is_pinned": True},
+            {"_id": 0}
+        ).sort([("created_at", -1), ("id", -1)]).to_list(None)
     
-    # Apply pagination
-    posts = posts[skip:skip+limit]
+    # One extra document tells us whether another page exists
+    posts = await db.posts.find(query, {"_id": 0}).sort([("created_at", -1), ("id", -1)]).limit(limit + 1).to_list(limit + 1)
+    has_more = len(posts) > limit
+    posts = posts[:limit]
     
     # Enrich with author info
-    for post in posts:
-        author = await db.users.find_one({"id": post['author_id']}, {"_id": 0, "name": 1, "picture": 1, "badges": 1})
-        post['author'] = author
+    await attach_users(pinned + posts, 'author_id', 'author')
+    await attach_reaction_state(pinned + posts, "post", user.id if user else None)
     
-    return posts
+    return {
+        "pinned": pinned,
+        "posts": posts,
+        "next_cursor": encode_feed_cursor(posts[-1]) if has_more else None
+    }
 
 @api_router.post("/posts")
 async def create_post(request: Request, user: User = Depends(require_auth)):
@@ -2613,17 +4548,16 @@ async def create_post(request: Request, user: User = Depends(require_auth)):
         raise HTTPException(status_code=404, detail="Space not found")
     
     # Check if user is blocked from this space (handles both hard and soft blocks)
-    block_status = await get_effective_block_status(user.id, data['space_id'])
-    if block_status['is_blocked']:
-        if block_status['block_type'] == 'soft':
+    permissions = await resolve_space_permissions(user, data['space_id'])
+    if permissions.is_blocked:
+        if permissions.block_type == 'soft':
             raise HTTPException(status_code=403, detail="You are temporarily blocked from posting in this space")
         else:
             raise HTTPException(status_code=403, detail="You are blocked from posting in this space")
     
     # Check if user is a member - required for ALL spaces (public, private, secret)
     # Public spaces allow viewing without membership, but posting requires membership
-    is_member = await is_space_member(user, data['space_id'])
-    if not is_member:
+    if not permissions.is_member:
         if space.get('visibility') == 'public':
             raise HTTPException(status_code=403, detail="Please join this space to create posts")
         else:
@@ -2631,8 +4565,7 @@ async def create_post(request: Request, user: User = Depends(require_auth)):
     
     # If space doesn't allow member posts, only admins/managers can post
     if not space.get('allow_member_posts', True):
-        is_authorized = await is_space_manager_or_admin(user, data['space_id'])
-        if not is_authorized:
+        if not permissions.is_manager:
             raise HTTPException(status_code=403, detail="Only admins and managers can create posts in this space")
     
     post = Post(
@@ -2671,35 +4604,26 @@ async def react_to_post(post_id: str, emoji: str, user: User = Depends(require_a
         raise HTTPException(status_code=404, detail="Post not found")
     
     # Check if user is blocked from this space (handles both hard and soft blocks)
-    block_status = await get_effective_block_status(user.id, post['space_id'])
-    if block_status['is_blocked']:
-        if block_status['block_type'] == 'soft':
+    permissions = await resolve_space_permissions(user, post['space_id'])
+    if permissions.is_blocked:
+        if permissions.block_type == 'soft':
             raise HTTPException(status_code=403, detail="You are temporarily blocked from reacting in this space")
         else:
             raise HTTPException(status_code=403, detail="You are blocked from reacting in this space")
     
     # Check if user is a member - required for ALL spaces
-    space = await db.spaces.find_one({"id": post['space_id']}, {"_id": 0})
-    is_member = await is_space_member(user, post['space_id'])
-    if not is_member:
+    if not permissions.is_member:
+        # The space is only needed to word the rejection
+        space = await db.spaces.find_one({"id": post['space_id']}, {"_id": 0, "visibility": 1})
         if space and space.get('visibility') == 'public':
             raise HTTPException(status_code=403, detail="Please join this space to react to posts")
         else:
             raise HTTPException(status_code=403, detail="You must be a member to react in this space")
     
-    reactions = post.get('reactions', {})
-    if emoji not in reactions:
-        reactions[emoji] = []
+    validate_reaction_emoji(emoji)
     
-    # Check if this is adding or removing a reaction
-    is_adding = user.id not in reactions[emoji]
-    
-    if user.id in reactions[emoji]:
-        reactions[emoji].remove(user.id)
-    else:
-        reactions[emoji].append(user.id)
-    
-    await db.posts.update_one({"id": post_id}, {"$set": {"reactions": reactions}})
+    # Atomically toggle: adds the reaction, or removes it if the user already reacted
+    is_adding = await toggle_reaction("post", post_id, emoji, user.id)
     
     # Award or deduct points based on action
     if is_adding:
@@ -2707,28 +4631,30 @@ async def react_to_post(post_id: str, emoji: str, user: User = Depends(require_a
         await track_activity_streak(user.id)
         
         # Award 1 point to the person liking
-        await award_points(
-            user_id=user.id,
-            points=1,
-            action_type="like",
-            related_entity_type="post",
-            related_entity_id=post_id,
-            related_user_id=post['author_id'],
-            description="Liked a post"
-        )
+        awards = [{
+            "user_id": user.id,
+            "points": 1,
+            "action_type": "like",
+            "related_entity_type": "post",
+            "related_entity_id": post_id,
+            "related_user_id": post['author_id'],
+            "description": "Liked a post"
+        }]
         
         # Award 1 point to the post author (if not self-like)
         if user.id != post['author_id']:
-            await award_points(
-                user_id=post['author_id'],
-                points=1,
-                action_type="receive_like",
-                related_entity_type="post",
-                related_entity_id=post_id,
-                related_user_id=user.id,
-                description="Received a like on post"
-            )
-            
+            awards.append({
+                "user_id": post['author_id'],
+                "points": 1,
+                "action_type": "receive_like",
+                "related_entity_type": "post",
+                "related_entity_id": post_id,
+                "related_user_id": user.id,
+                "description": "Received a like on post"
+            })
+        await award_points_batch(awards)
+        
+        if user.id != post['author_id']:
             # Create notification for post author
             await create_notification(
                 user_id=post['author_id'],
@@ -2744,19 +4670,13 @@ async def react_to_post(post_id: str, emoji: str, user: User = Depends(require_a
     else:
         # Removing reaction - deduct points
         # Deduct 1 point from the person who is unreacting
-        await db.users.update_one(
-            {"id": user.id},
-            {"$inc": {"total_points": -1}}
-        )
+        await adjust_total_points(user.id, -1)
         
         # Deduct 1 point from post author (if not self-like)
         if user.id != post['author_id']:
-            await db.users.update_one(
-                {"id": post['author_id']},
-                {"$inc": {"total_points": -1}}
-            )
+            await adjust_total_points(post['author_id'], -1)
     
-    return {"reactions": reactions}
+    return await get_reaction_summary("post", post_id, user.id)
 
 
 
@@ -2844,7 +4764,11 @@ async def delete_post(space_id: str, post_id: str, user: User = Depends(require_
     if not (is_author or is_admin or is_manager):
         raise HTTPException(status_code=403, detail="Only the post author, admins, or space managers can delete this post")
     
-    # Delete all comments associated with this post
+    # Delete reactions on the post and its comments, then the comments themselves
+    comment_ids = await db.comments.distinct("id", {"post_id": post_id})
+    await db.reactions.delete_many({"target_type": "post", "target_id": post_id})
+    if comment_ids:
+        await db.reactions.delete_many({"target_type": "comment", "target_id": {"$in": comment_ids}})
     comments_result = await db.comments.delete_many({"post_id": post_id})
     
     # If this post is pinned, unpin it from the space
@@ -2876,17 +4800,17 @@ async def add_comment(post_id: str, request: Request, user: User = Depends(requi
         raise HTTPException(status_code=404, detail="Post not found")
     
     # Check if user is blocked from this space (handles both hard and soft blocks)
-    block_status = await get_effective_block_status(user.id, post['space_id'])
-    if block_status['is_blocked']:
-        if block_status['block_type'] == 'soft':
+    permissions = await resolve_space_permissions(user, post['space_id'])
+    if permissions.is_blocked:
+        if permissions.block_type == 'soft':
             raise HTTPException(status_code=403, detail="You are temporarily blocked from commenting in this space")
         else:
             raise HTTPException(status_code=403, detail="You are blocked from commenting in this space")
     
     # Check if user is a member - required for ALL spaces
-    space = await db.spaces.find_one({"id": post['space_id']}, {"_id": 0})
-    is_member = await is_space_member(user, post['space_id'])
-    if not is_member:
+    if not permissions.is_member:
+        # The space is only needed to word the rejection
+        space = await db.spaces.find_one({"id": post['space_id']}, {"_id": 0, "visibility": 1})
         if space and space.get('visibility') == 'public':
             raise HTTPException(status_code=403, detail="Please join this space to comment")
         else:
@@ -2908,28 +4832,30 @@ async def add_comment(post_id: str, request: Request, user: User = Depends(requi
     
     # Award points for commenting (2 points to commenter)
     await track_activity_streak(user.id)
-    await award_points(
-        user_id=user.id,
-        points=2,
-        action_type="comment",
-        related_entity_type="post",
-        related_entity_id=post_id,
-        related_user_id=post['author_id'],
-        description="Commented on a post"
-    )
+    awards = [{
+        "user_id": user.id,
+        "points": 2,
+        "action_type": "comment",
+        "related_entity_type": "post",
+        "related_entity_id": post_id,
+        "related_user_id": post['author_id'],
+        "description": "Commented on a post"
+    }]
     
     # Award 2 points to the post author (if not self-comment)
     if user.id != post['author_id']:
-        await award_points(
-            user_id=post['author_id'],
-            points=2,
-            action_type="receive_comment",
-            related_entity_type="post",
-            related_entity_id=post_id,
-            related_user_id=user.id,
-            description="Received a comment on post"
-        )
-        
+        awards.append({
+            "user_id": post['author_id'],
+            "points": 2,
+            "action_type": "receive_comment",
+            "related_entity_type": "post",
+            "related_entity_id": post_id,
+            "related_user_id": user.id,
+            "description": "Received a comment on post"
+        })
+    await award_points_batch(awards)
+    
+    if user.id != post['author_id']:
         # Notify post author
         await create_notification(
             user_id=post['author_id'],
@@ -2962,14 +4888,13 @@ async def add_comment(post_id: str, request: Request, user: User = Depends(requi
     return comment
 
 @api_router.get("/posts/{post_id}/comments")
-async def get_comments(post_id: str):
+async def get_comments(post_id: str, user: Optional[User] = Depends(get_current_user)):
     """Get comments for a post"""
     comments = await db.comments.find({"post_id": post_id}, {"_id": 0}).sort("created_at", 1).to_list(100)
     
     # Enrich with author info
-    for comment in comments:
-        author = await db.users.find_one({"id": comment['author_id']}, {"_id": 0, "name": 1, "picture": 1})
-        comment['author'] = author
+    await attach_users(comments, 'author_id', 'author')
+    await attach_reaction_state(comments, "comment", user.id if user else None)
     
     return comments
 
@@ -2987,35 +4912,26 @@ async def react_to_comment(comment_id: str, emoji: str, user: User = Depends(req
         raise HTTPException(status_code=404, detail="Post not found")
     
     # Check if user is blocked from this space
-    block_status = await get_effective_block_status(user.id, post['space_id'])
-    if block_status['is_blocked']:
-        if block_status['block_type'] == 'soft':
+    permissions = await resolve_space_permissions(user, post['space_id'])
+    if permissions.is_blocked:
+        if permissions.block_type == 'soft':
             raise HTTPException(status_code=403, detail="You are temporarily blocked from reacting in this space")
         else:
             raise HTTPException(status_code=403, detail="You are blocked from reacting in this space")
     
     # Check if user is a member
-    space = await db.spaces.find_one({"id": post['space_id']}, {"_id": 0})
-    is_member = await is_space_member(user, post['space_id'])
-    if not is_member:
+    if not permissions.is_member:
+        # The space is only needed to word the rejection
+        space = await db.spaces.find_one({"id": post['space_id']}, {"_id": 0, "visibility": 1})
         if space and space.get('visibility') == 'public':
             raise HTTPException(status_code=403, detail="Please join this space to react to comments")
         else:
             raise HTTPException(status_code=403, detail="You must be a member to react in this space")
     
-    reactions = comment.get('reactions', {})
-    if emoji not in reactions:
-        reactions[emoji] = []
-    
-    # Check if this is adding or removing a reaction
-    is_adding = user.id not in reactions[emoji]
+    validate_reaction_emoji(emoji)
     
-    if user.id in reactions[emoji]:
-        reactions[emoji].remove(user.id)
-    else:
-        reactions[emoji].append(user.id)
-    
-    await db.comments.update_one({"id": comment_id}, {"$set": {"reactions": reactions}})
+    # Atomically toggle: adds the reaction, or removes it if the user already reacted
+    is_adding = await toggle_reaction("comment", comment_id, emoji, user.id)
     
     # Award or deduct points based on action
     if is_adding:
@@ -3023,47 +4939,73 @@ async def react_to_comment(comment_id: str, emoji: str, user: User = Depends(req
         await track_activity_streak(user.id)
         
         # Award 0.5 points to the person reacting
-        await award_points(
-            user_id=user.id,
-            points=0.5,
-            action_type="like_comment",
-            related_entity_type="comment",
-            related_entity_id=comment_id,
-            related_user_id=comment['author_id'],
-            description="Reacted to a comment"
-        )
+        awards = [{
+            "user_id": user.id,
+            "points": 0.5,
+            "action_type": "like_comment",
+            "related_entity_type": "comment",
+            "related_entity_id": comment_id,
+            "related_user_id": comment['author_id'],
+            "description": "Reacted to a comment"
+        }]
         
         # Award 0.5 points to the comment author (if not self-reaction)
         if user.id != comment['author_id']:
-            await award_points(
-                user_id=comment['author_id'],
-                points=0.5,
-                action_type="receive_like_comment",
-                related_entity_type="comment",
-                related_entity_id=comment_id,
-                related_user_id=user.id,
-                description="Received a reaction on comment"
-            )
+            awards.append({
+                "user_id": comment['author_id'],
+                "points": 0.5,
+                "action_type": "receive_like_comment",
+                "related_entity_type": "comment",
+                "related_entity_id": comment_id,
+                "related_user_id": user.id,
+                "description": "Received a reaction on comment"
+            })
+        await award_points_batch(awards)
     else:
         # Removing reaction - deduct points
         # Deduct 0.5 points from the person who is unreacting
-        await db.users.update_one(
-            {"id": user.id},
-            {"$inc": {"total_points": -0.5}}
-        )
+        await adjust_total_points(user.id, -0.5)
         
         # Deduct 0.5 points from comment author (if not self-reaction)
         if user.id != comment['author_id']:
-            await db.users.update_one(
-                {"id": comment['author_id']},
-                {"$inc": {"total_points": -0.5}}
-            )
+            await adjust_total_points(comment['author_id'], -0.5)
     
-    return {"reactions": reactions}
+    return await get_reaction_summary("comment", comment_id, user.id)
 
 
 # ==================== LEARNING SPACE ENDPOINTS ====================
 
+# Course outline cache: space_id -> (outline_version, sections, lessons). The outline is the
+# space's sections plus lesson metadata without content; lesson bodies load through get_lesson.
+# Section/lesson writes bump spaces.outline_version, so other workers notice the change on
+# their next read and rebuild.
+OUTLINE_CACHE_TTL_SECONDS = int(os.environ.get('OUTLINE_CACHE_TTL_SECONDS', '600'))
+OUTLINE_CACHE_MAX_SIZE = int(os.environ.get('OUTLINE_CACHE_MAX_SIZE', '500'))
+outline_cache = TTLCache(maxsize=OUTLINE_CACHE_MAX_SIZE, ttl=OUTLINE_CACHE_TTL_SECONDS)
+
+OUTLINE_SECTION_PROJECTION = {"_id": 0, "id": 1, "space_id": 1, "name": 1, "description": 1, "order": 1, "created_at": 1}
+OUTLINE_LESSON_PROJECTION = {"_id": 0, "content": 0}
+
+async def invalidate_course_outline(space_id: str):
+    """Bump the space's outline version after any section or lesson write"""
+    outline_cache.pop(space_id, None)
+    await db.spaces.update_one({"id": space_id}, {"$inc": {"outline_version": 1}})
+
+async def get_course_outline(space_id: str, version: int) -> tuple:
+    """(sections, lessons) for a space, rebuilt only when its outline_version moves"""
+    cached = outline_cache.get(space_id)
+    if cached and cached[0] == version:
+        return cached[1], cached[2]
+
+    sections = await db.sections.find({"space_id": space_id}, OUTLINE_SECTION_PROJECTION).sort("order", 1).to_list(length=None)
+    lessons = await db.lessons.find({"space_id": space_id}, OUTLINE_LESSON_PROJECTION).sort("order", 1).to_list(length=None)
+    section_names = {s['id']: s['name'] for s in sections}
+    for lesson in lessons:
+        if lesson.get('section_id') in section_names:
+            lesson['section_name'] = section_names[lesson['section_id']]
+    outline_cache[space_id] = (version, sections, lessons)
+    return sections, lessons
+
 @api_router.post("/spaces/{space_id}/sections")
 async def create_section(
     space_id: str,
@@ -3090,6 +5032,7 @@ async def create_section(
     )
     
     await db.sections.insert_one(section.model_dump())
+    await invalidate_course_outline(space_id)
     return section
 
 @api_router.get("/spaces/{space_id}/sections")
@@ -3130,6 +5073,7 @@ async def update_section(
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Section not found")
     
+    await invalidate_course_outline(space_id)
     return {"message": "Section updated successfully"}
 
 @api_router.delete("/spaces/{space_id}/sections/{section_id}")
@@ -3151,6 +5095,8 @@ async def delete_section(
     # Delete section
     result = await db.sections.delete_one({"id": section_id, "space_id": space_id})
     
+    await invalidate_course_outline(space_id)
+    
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Section not found")
     
@@ -3188,6 +5134,7 @@ async def create_lesson(
     )
     
     await db.lessons.insert_one(lesson.model_dump())
+    await invalidate_course_outline(space_id)
     return lesson
 
 @api_router.get("/spaces/{space_id}/lessons")
@@ -3195,49 +5142,49 @@ async def get_space_lessons(
     space_id: str,
     user: User = Depends(require_auth)
 ):
-    """Get all lessons for a learning space, grouped by sections"""
+    """Get the course outline for a learning space (lessons grouped by section, without content)"""
     # Verify space exists
-    space = await db.spaces.find_one({"id": space_id})
+    space = await db.spaces.find_one({"id": space_id}, {"_id": 0, "id": 1, "outline_version": 1})
     if not space:
         raise HTTPException(status_code=404, detail="Space not found")
     
-    # Get all sections for this space
-    sections_cursor = db.sections.find({"space_id": space_id}).sort("order", 1)
-    sections_list = await sections_cursor.to_list(length=None)
-    
-    # Get all lessons for this space, sorted by order
-    lessons_cursor = db.lessons.find({"space_id": space_id}).sort("order", 1)
-    lessons = await lessons_cursor.to_list(length=None)
-    
-    # Get user's progress for all lessons
-    progress_cursor = db.lesson_progress.find({"user_id": user.id})
-    progress_map = {p['lesson_id']: p async for p in progress_cursor}
+    version = space.get('outline_version', 0)
+    sections_list, outline_lessons = await get_course_outline(space_id, version)
+    
+    # Get user's progress for this space's lessons only
+    progress_map = {}
+    if outline_lessons:
+        progress_map = {
+            p['lesson_id']: p
+            async for p in db.lesson_progress.find(
+                {"user_id": user.id, "lesson_id": {"$in": [l['id'] for l in outline_lessons]}},
+                {"_id": 0, "lesson_id": 1, "completed": 1, "watch_percentage": 1}
+            )
+        }
     
-    # Attach progress to each lesson
-    for lesson in lessons:
-        lesson['_id'] = str(lesson['_id'])
-        progress = progress_map.get(lesson['id'], {})
-        lesson['completed'] = progress.get('completed', False)
-        lesson['watch_percentage'] = progress.get('watch_percentage', 0.0)
-        
-        # Attach section info if lesson has section_id
-        if lesson.get('section_id'):
-            section_info = next((s for s in sections_list if s['id'] == lesson['section_id']), None)
-            if section_info:
-                lesson['section_name'] = section_info['name']
+    # Attach progress to per-request copies so the cached outline stays shared
+    lessons = []
+    for lesson in outline_lessons:
+        progress = lesson_progress_buffer.overlay(user.id, lesson['id'], progress_map.get(lesson['id'], {}))
+        lessons.append({
+            **lesson,
+            'completed': progress.get('completed', False),
+            'watch_percentage': progress.get('watch_percentage', 0.0)
+        })
     
     # Group lessons by section
-    sections_dict = {}
+    lessons_by_section = {}
+    for lesson in lessons:
+        lessons_by_section.setdefault(lesson.get('section_id'), []).append(lesson)
     
     # Add defined sections with their metadata
+    sections_dict = {}
     for section in sections_list:
-        section['_id'] = str(section['_id'])
-        section_lessons = [l for l in lessons if l.get('section_id') == section['id']]
         sections_dict[section['name']] = {
             'section_id': section['id'],
             'section_description': section.get('description'),
             'section_order': section.get('order', 0),
-            'lessons': section_lessons
+            'lessons': lessons_by_section.get(section['id'], [])
         }
     
     # Add uncategorized lessons
@@ -3250,7 +5197,7 @@ async def get_space_lessons(
             'lessons': uncategorized
         }
     
-    return {"sections": sections_dict, "lessons": lessons, "sections_list": sections_list}
+    return {"sections": sections_dict, "lessons": lessons, "sections_list": sections_list, "outline_version": version}
 
 @api_router.get("/lessons/{lesson_id}")
 async def get_lesson(
@@ -3268,12 +5215,12 @@ async def get_lesson(
     progress = await db.lesson_progress.find_one({"user_id": user.id, "lesson_id": lesson_id})
     if progress:
         progress['_id'] = str(progress['_id'])
-        lesson['progress'] = progress
     else:
-        lesson['progress'] = {
+        progress = {
             "completed": False,
             "watch_percentage": 0.0
         }
+    lesson['progress'] = lesson_progress_buffer.overlay(user.id, lesson_id, progress)
     
     return lesson
 
@@ -3301,6 +5248,7 @@ async def update_lesson(
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Lesson not found")
     
+    await invalidate_course_outline(space_id)
     return {"message": "Lesson updated successfully"}
 
 @api_router.delete("/spaces/{space_id}/lessons/{lesson_id}")
@@ -3315,68 +5263,351 @@ async def delete_lesson(
         raise HTTPException(status_code=403, detail="Only admins and space managers can delete lessons")
     
     # Delete lesson and related data
-    await db.lessons.delete_one({"id": lesson_id, "space_id": space_id})
-    await db.lesson_progress.delete_many({"lesson_id": lesson_id})
+    result = await db.lessons.delete_one({"id": lesson_id, "space_id": space_id})
+    lesson_space_cache.pop(lesson_id, None)
+    if result.deleted_count:
+        await record_lesson_deleted(space_id, lesson_id)
+    await lesson_progress_buffer.discard_lesson(lesson_id)
     await db.lesson_notes.delete_many({"lesson_id": lesson_id})
+    # Reactions on the lesson's comments go with them (their counts live on the comments)
+    comment_ids = await db.comments.distinct("id", {"lesson_id": lesson_id})
+    if comment_ids:
+        await db.reactions.delete_many({"target_type": "comment", "target_id": {"$in": comment_ids}})
     await db.comments.delete_many({"lesson_id": lesson_id})
+    await invalidate_course_outline(space_id)
     
     return {"message": "Lesson deleted successfully"}
 
+# ==================== LESSON PROGRESS BUFFER ====================
+
+# Video players post progress heartbeats every few seconds. Heartbeats are coalesced in memory
+# (latest watch_percentage per user/lesson) and flushed as one bulk_write of upserts every
+# LESSON_PROGRESS_FLUSH_SECONDS; completions are written through immediately and are sticky
+# (a later heartbeat below 80% does not revert them).
+LESSON_PROGRESS_FLUSH_SECONDS = float(os.environ.get('LESSON_PROGRESS_FLUSH_SECONDS', '3'))
+LESSON_PROGRESS_BUFFER_MAX = int(os.environ.get('LESSON_PROGRESS_BUFFER_MAX', '5000'))
+# While flushes fail or lag, heartbeats for keys not already buffered are shed past this many
+LESSON_PROGRESS_BUFFER_HARD_MAX = int(os.environ.get('LESSON_PROGRESS_BUFFER_HARD_MAX', str(LESSON_PROGRESS_BUFFER_MAX * 2)))
+MAX_PROGRESS_BATCH_SIZE = 100
+
+def valid_watch_percentage(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+# lesson_id -> space_id, so heartbeats do not look the lesson up every time
+lesson_space_cache = TTLCache(maxsize=10000, ttl=600)
+
+async def get_lesson_spaces(lesson_ids: List[str]) -> Dict[str, str]:
+    """Map lesson ids to their space ids; unknown lessons are left out"""
+    found = {lesson_id: lesson_space_cache[lesson_id] for lesson_id in lesson_ids if lesson_id in lesson_space_cache}
+    missing = [lesson_id for lesson_id in set(lesson_ids) if lesson_id not in found]
+    if missing:
+        async for lesson in db.lessons.find({"id": {"$in": missing}}, {"_id": 0, "id": 1, "space_id": 1}):
+            lesson_space_cache[lesson['id']] = lesson['space_id']
+            found[lesson['id']] = lesson['space_id']
+    return found
+
+def lesson_progress_upsert(user_id: str, lesson_id: str, fields: dict) -> UpdateOne:
+    """Upsert a lesson_progress row, filling LessonProgress defaults on insert"""
+    on_insert = {"id": str(uuid.uuid4()), "created_at": fields['last_watched_at']}
+    for field, default in (("completed", False), ("completed_at", None)):
+        if field not in fields:
+            on_insert[field] = default
+    return UpdateOne(
+        {"user_id": user_id, "lesson_id": lesson_id},
+        {"$set": fields, "$setOnInsert": on_insert},
+        upsert=True
+    )
+
+class LessonProgressBuffer:
+    """Coalesces progress heartbeats per (user_id, lesson_id) until the next flush"""
+    def __init__(self):
+        self.pending: Dict[tuple, dict] = {}
+        # Keys this worker has written as completed, so repeat "completed" heartbeats can be buffered
+        self.known_completed = TTLCache(maxsize=50000, ttl=3600)
+        self.flush_lock = asyncio.Lock()
+        # The one early flush scheduled when the buffer fills, so a full buffer does not spawn a task per heartbeat
+        self.early_flush: Optional[asyncio.Task] = None
+        self.stats = {
+            "heartbeats": 0,
+            "coalesced": 0,
+            "shed": 0,
+            "deleted_lesson_rows": 0,
+            "immediate_writes": 0,
+            "flushes": 0,
+            "flushed_rows": 0,
+            "flush_failures": 0,
+            "last_flush_ms": None
+        }
+
+    async def record(self, user_id: str, lesson_id: str, watch_percentage: float, completed: Optional[bool]) -> bool:
+        """Record a heartbeat and return whether the lesson is now completed"""
+        key = (user_id, lesson_id)
+        is_completed = bool(completed) or watch_percentage >= 80  # Auto-complete at 80%
+        now = datetime.now(timezone.utc)
+        fields = {"watch_percentage": watch_percentage, "last_watched_at": now}
+        self.stats['heartbeats'] += 1
+
+        if is_completed and key not in self.known_completed:
+            # Completion: write through, ordered after any in-flight flush of this key
+            async with self.flush_lock:
+                self.pending.pop(key, None)
+                flipped = await self.mark_completed(user_id, lesson_id, fields, now)
+            self.known_completed[key] = True
+            self.stats['immediate_writes'] += 1
+            if flipped:
+                await record_lesson_completed(user_id, lesson_id)
+                return True
+
+        if key in self.pending:
+            self.stats['coalesced'] += 1
+        elif len(self.pending) >= LESSON_PROGRESS_BUFFER_HARD_MAX:
+            # Flushes are failing or behind; the player sends a newer heartbeat shortly anyway
+            self.stats['shed'] += 1
+            return is_completed
+        self.pending[key] = fields
+        if len(self.pending) >= LESSON_PROGRESS_BUFFER_MAX and (self.early_flush is None or self.early_flush.done()):
+            self.early_flush = run_in_background(self.flush_early())
+        return is_completed
+
+    async def flush_early(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Lesson progress flush failed: {e}")
+
+    async def mark_completed(self, user_id: str, lesson_id: str, fields: dict, now: datetime) -> bool:
+        """Flip the user's row to completed; True only for the write that did the flip"""
+        incomplete = {"user_id": user_id, "lesson_id": lesson_id, "completed": {"$ne": True}}
+        completion = {"$set": {**fields, "completed": True, "completed_at": now}}
+        result = await db.lesson_progress.update_one(incomplete, completion)
+        if result.modified_count:
+            return True
+        if await db.lesson_progress.find_one({"user_id": user_id, "lesson_id": lesson_id}, {"_id": 1}):
+            return False  # Already completed
+        try:
+            await db.lesson_progress.insert_one({
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "lesson_id": lesson_id,
+                **fields,
+                "completed": True,
+                "completed_at": now,
+                "created_at": now
+            })
+            return True
+        except DuplicateKeyError:
+            # Another worker created the row in between (user_lesson_unique); flip it if it is not yet
+            result = await db.lesson_progress.update_one(incomplete, completion)
+            return result.modified_count == 1
+
+    def overlay(self, user_id: str, lesson_id: str, progress: dict) -> dict:
+        """Apply this worker's not-yet-flushed heartbeat on top of a stored progress row"""
+        fields = self.pending.get((user_id, lesson_id))
+        if fields:
+            progress = {**progress, **fields}
+        return progress
+
+    async def discard_lesson(self, lesson_id: str):
+        """
+        Drop buffered heartbeats and stored progress for a deleted lesson (call after the lesson
+        itself is deleted). Holding the flush lock keeps this worker's in-flight flush from
+        writing rows after the delete; other workers' flushes skip lessons that no longer exist.
+        """
+        async with self.flush_lock:
+            for key in [key for key in self.pending if key[1] == lesson_id]:
+                del self.pending[key]
+            for key in [key for key in self.known_completed if key[1] == lesson_id]:
+                self.known_completed.pop(key, None)
+            await db.lesson_progress.delete_many({"lesson_id": lesson_id})
+
+    async def flush(self) -> int:
+        """Write every buffered heartbeat in one bulk_write"""
+        async with self.flush_lock:
+            if not self.pending:
+                return 0
+            batch, self.pending = self.pending, {}
+            started = time.perf_counter()
+            try:
+                # Heartbeats for lessons deleted (on any worker) since they were buffered are dropped
+                lesson_ids = list({lesson_id for _, lesson_id in batch})
+                existing = set(await db.lessons.distinct("id", {"id": {"$in": lesson_ids}}))
+                batch = {key: fields for key, fields in batch.items() if key[1] in existing}
+                if batch:
+                    await db.lesson_progress.bulk_write(
+                        [lesson_progress_upsert(user_id, lesson_id, fields) for (user_id, lesson_id), fields in batch.items()],
+                        ordered=False
+                    )
+                    # A lesson deleted between the check and the write: remove the rows just upserted
+                    gone = existing - set(await db.lessons.distinct("id", {"id": {"$in": list(existing)}}))
+                    if gone:
+                        result = await db.lesson_progress.delete_many({"lesson_id": {"$in": list(gone)}})
+                        self.stats['deleted_lesson_rows'] += result.deleted_count
+            except Exception:
+                self.stats['flush_failures'] += 1
+                # Re-queue anything a newer heartbeat has not already replaced, up to the hard cap
+                for key, fields in batch.items():
+                    if key in self.pending or len(self.pending) < LESSON_PROGRESS_BUFFER_HARD_MAX:
+                        self.pending.setdefault(key, fields)
+                    else:
+                        self.stats['shed'] += 1
+                raise
+            self.stats['flushes'] += 1
+            self.stats['flushed_rows'] += len(batch)
+            self.stats['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            return len(batch)
+
+lesson_progress_buffer = LessonProgressBuffer()
+job_scheduler.add_job("lesson_progress_flush", lesson_progress_buffer.flush, IntervalTrigger(LESSON_PROGRESS_FLUSH_SECONDS), leader_only=False)
+
 @api_router.post("/lessons/{lesson_id}/progress")
 async def update_lesson_progress(
     lesson_id: str,
     progress_data: dict,
     user: User = Depends(require_auth)
 ):
-    """Update user's progress for a lesson"""
-    # Check if lesson exists
-    lesson = await db.lessons.find_one({"id": lesson_id})
-    if not lesson:
-        raise HTTPException(status_code=404, detail="Lesson not found")
-    
-    # Get or create progress record
-    progress = await db.lesson_progress.find_one({"user_id": user.id, "lesson_id": lesson_id})
-    
-    completed = progress_data.get('completed', False)
-    watch_percentage = progress_data.get('watch_percentage', 0.0)
-    
-    # Auto-complete if watch percentage >= 80%
-    if watch_percentage >= 80 and not completed:
-        completed = True
-    
-    now = datetime.now(timezone.utc)
+    """Update user's progress for a lesson"""
+    # Check if lesson exists
+    if lesson_id not in await get_lesson_spaces([lesson_id]):
+        raise HTTPException(status_code=404, detail="Lesson not found")
+    if not valid_watch_percentage(progress_data.get('watch_percentage', 0.0)):
+        raise HTTPException(status_code=400, detail="watch_percentage must be a number")
+    
+    completed = await lesson_progress_buffer.record(
+        user.id,
+        lesson_id,
+        progress_data.get('watch_percentage', 0.0),
+        progress_data.get('completed')
+    )
     
-    if progress:
-        # Update existing progress
-        update_data = {
-            "watch_percentage": watch_percentage,
-            "last_watched_at": now
-        }
-        if completed and not progress.get('completed'):
-            update_data['completed'] = True
-            update_data['completed_at'] = now
-        elif 'completed' in progress_data:
-            update_data['completed'] = completed
-            if completed:
-                update_data['completed_at'] = now
-        
-        await db.lesson_progress.update_one(
-            {"user_id": user.id, "lesson_id": lesson_id},
-            {"$set": update_data}
-        )
-    else:
-        # Create new progress record
-        new_progress = LessonProgress(
-            user_id=user.id,
-            lesson_id=lesson_id,
-            completed=completed,
-            watch_percentage=watch_percentage,
-            last_watched_at=now,
-            completed_at=now if completed else None
+    return {"message": "Progress updated successfully", "completed": completed}
+
+@api_router.post("/lessons/progress/batch")
+async def update_lesson_progress_batch(request: Request, user: User = Depends(require_auth)):
+    """Sync progress for several lessons in one call: {"items": [{lesson_id, watch_percentage, completed?}]}"""
+    data = await request.json()
+    items = data.get('items') or []
+    if len(items) > MAX_PROGRESS_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PROGRESS_BATCH_SIZE} items per batch")
+    if any(not isinstance(item, dict) or not item.get('lesson_id') for item in items):
+        raise HTTPException(status_code=400, detail="Every item needs a lesson_id")
+    if any(not valid_watch_percentage(item.get('watch_percentage', 0.0)) for item in items):
+        raise HTTPException(status_code=400, detail="Every item's watch_percentage must be a number")
+    
+    known_lessons = await get_lesson_spaces([item['lesson_id'] for item in items])
+    
+    results = []
+    for item in items:
+        if item['lesson_id'] not in known_lessons:
+            results.append({"lesson_id": item['lesson_id'], "error": "Lesson not found"})
+            continue
+        completed = await lesson_progress_buffer.record(
+            user.id,
+            item['lesson_id'],
+            item.get('watch_percentage', 0.0),
+            item.get('completed')
         )
-        await db.lesson_progress.insert_one(new_progress.model_dump())
+        results.append({"lesson_id": item['lesson_id'], "completed": completed})
     
-    return {"message": "Progress updated successfully", "completed": completed}
+    return {"results": results, "updated": sum(1 for r in results if 'error' not in r)}
+
+# ==================== SPACE PROGRESS SUMMARIES ====================
+
+# One space_progress row per (user, space) with completed_lesson_ids and total_lessons. Rows are
+# seeded from lesson_progress the first time they are needed, then kept current: completions
+# $addToSet their lesson id and lesson deletes $pull it. Keeping ids rather than a counter
+# makes a completion racing a seed idempotent. total_lessons is stamped with the course
+# outline_version it was counted at, and a read that finds the outline has moved on recounts
+# it, so a lesson created while a seed was counting cannot leave the total stale.
+
+def space_progress_summary(space_progress: Optional[dict]) -> dict:
+    total = (space_progress or {}).get('total_lessons', 0)
+    completed = min(len((space_progress or {}).get('completed_lesson_ids', [])), total)
+    return {
+        "total_lessons": total,
+        "completed_lessons": completed,
+        "progress_percentage": round((completed / total) * 100, 1) if total else 0
+    }
+
+def space_progress_needs_seed(space_progress: Optional[dict]) -> bool:
+    """Missing, or written before summaries kept completed_lesson_ids"""
+    return space_progress is None or 'completed_lesson_ids' not in space_progress
+
+async def get_outline_version(space_id: str) -> int:
+    space = await db.spaces.find_one({"id": space_id}, {"_id": 0, "outline_version": 1})
+    return (space or {}).get('outline_version', 0)
+
+async def recount_space_progress(space_progress: dict, outline_version: int) -> dict:
+    """Recount total_lessons for a summary counted at an older outline_version"""
+    if space_progress.get('outline_version') == outline_version:
+        return space_progress
+    total_lessons = await db.lessons.count_documents({"space_id": space_progress['space_id']})
+    # Conditional on the version we read, so a concurrent recount or re-seed is not clobbered;
+    # a lesson written after the count bumps outline_version again and is recounted next read
+    await db.space_progress.update_one(
+        {
+            "user_id": space_progress['user_id'],
+            "space_id": space_progress['space_id'],
+            "outline_version": space_progress.get('outline_version')
+        },
+        {"$set": {"total_lessons": total_lessons, "outline_version": outline_version}}
+    )
+    return {**space_progress, "total_lessons": total_lessons, "outline_version": outline_version}
+
+async def seed_space_progress(user_id: str, space_id: str) -> dict:
+    """Compute a user's summary for a space from lesson_progress and store it if missing"""
+    # Read before counting: a lesson added mid-seed leaves the stamp behind the space's version
+    outline_version = await get_outline_version(space_id)
+    lesson_ids = [lesson['id'] async for lesson in db.lessons.find({"space_id": space_id}, {"_id": 0, "id": 1})]
+    completed_lesson_ids = []
+    if lesson_ids:
+        completed_lesson_ids = await db.lesson_progress.distinct("lesson_id", {
+            "user_id": user_id,
+            "completed": True,
+            "lesson_id": {"$in": lesson_ids}
+        })
+    now = datetime.now(timezone.utc).isoformat()
+    space_progress = {
+        "user_id": user_id,
+        "space_id": space_id,
+        "completed_lesson_ids": completed_lesson_ids,
+        "total_lessons": len(lesson_ids),
+        "outline_version": outline_version,
+        "updated_at": now
+    }
+    try:
+        # Only a missing or old-format row is written; a seeded row is left to the live updates
+        await db.space_progress.update_one(
+            {"user_id": user_id, "space_id": space_id, "completed_lesson_ids": {"$exists": False}},
+            {"$set": space_progress, "$unset": {"completed_lessons": ""}, "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        pass  # Seeded concurrently; completions are sets, so either seed is safe to keep
+    return space_progress
+
+async def record_lesson_completed(user_id: str, lesson_id: str):
+    """Count a lesson that just flipped to completed in the user's space summary"""
+    space_id = (await get_lesson_spaces([lesson_id])).get(lesson_id)
+    if not space_id:
+        return
+    summary = {"user_id": user_id, "space_id": space_id, "completed_lesson_ids": {"$exists": True}}
+    completion = {
+        "$addToSet": {"completed_lesson_ids": lesson_id},
+        "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
+    }
+    result = await db.space_progress.update_one(summary, completion)
+    if result.matched_count == 0:
+        # First completion in this space. A seed racing this one may have counted before the
+        # flip landed, so add the lesson again after seeding; $addToSet never counts it twice.
+        await seed_space_progress(user_id, space_id)
+        await db.space_progress.update_one(summary, completion)
+
+async def record_lesson_deleted(space_id: str, lesson_id: str):
+    """Remove a deleted lesson from every summary in its space"""
+    await db.space_progress.update_many(
+        {"space_id": space_id},
+        {"$pull": {"completed_lesson_ids": lesson_id}}
+    )
 
 @api_router.get("/spaces/{space_id}/my-progress")
 async def get_my_progress(
@@ -3384,32 +5615,39 @@ async def get_my_progress(
     user: User = Depends(require_auth)
 ):
     """Get user's overall progress in a learning space"""
-    # Get all lessons in this space
-    total_lessons = await db.lessons.count_documents({"space_id": space_id})
-    
-    if total_lessons == 0:
-        return {
-            "total_lessons": 0,
-            "completed_lessons": 0,
-            "progress_percentage": 0
-        }
-    
-    # Get user's completed lessons
-    completed_count = await db.lesson_progress.count_documents({
-        "user_id": user.id,
-        "completed": True,
-        "lesson_id": {"$in": [
-            lesson['id'] async for lesson in db.lessons.find({"space_id": space_id}, {"id": 1})
-        ]}
-    })
-    
-    progress_percentage = round((completed_count / total_lessons) * 100, 1)
-    
-    return {
-        "total_lessons": total_lessons,
-        "completed_lessons": completed_count,
-        "progress_percentage": progress_percentage
+    space_progress = await db.space_progress.find_one({"user_id": user.id, "space_id": space_id}, {"_id": 0})
+    if space_progress_needs_seed(space_progress):
+        space_progress = await seed_space_progress(user.id, space_id)
+    else:
+        space_progress = await recount_space_progress(space_progress, await get_outline_version(space_id))
+    return space_progress_summary(space_progress)
+
+@api_router.get("/me/learning-progress")
+async def get_my_learning_progress(user: User = Depends(require_auth)):
+    """Progress across every learning space the user belongs to or has progress in"""
+    memberships = await get_membership_map(user.id)
+    summaries = {
+        sp['space_id']: sp
+        async for sp in db.space_progress.find({"user_id": user.id}, {"_id": 0})
     }
+    space_ids = list({
+        space_id for space_id, membership in memberships.items() if membership.get('status') == 'member'
+    } | set(summaries))
+    spaces = await db.spaces.find(
+        {"id": {"$in": space_ids}, "space_type": "learning"},
+        {"_id": 0, "id": 1, "name": 1, "order": 1, "outline_version": 1}
+    ).sort("order", 1).to_list(None)
+    
+    results = []
+    for space in spaces:
+        space_progress = summaries.get(space['id'])
+        if space_progress_needs_seed(space_progress):
+            space_progress = await seed_space_progress(user.id, space['id'])
+        else:
+            space_progress = await recount_space_progress(space_progress, space.get('outline_version', 0))
+        results.append({"space_id": space['id'], "space_name": space.get('name'), **space_progress_summary(space_progress)})
+    
+    return results
 
 @api_router.get("/lessons/{lesson_id}/notes")
 async def get_lesson_notes(
@@ -3494,24 +5732,24 @@ async def get_lesson_comments(
     comments_cursor = db.comments.find({"lesson_id": lesson_id, "parent_comment_id": None})
     comments = await comments_cursor.to_list(length=None)
     
+    # Get replies for all of them at once
+    replies = []
+    if comments:
+        replies = await db.comments.find(
+            {"parent_comment_id": {"$in": [c['id'] for c in comments]}}
+        ).to_list(length=None)
+    
     # Enrich with author details
-    for comment in comments:
+    for comment in comments + replies:
         comment['_id'] = str(comment['_id'])
-        author = await db.users.find_one({"id": comment['author_id']}, {"password_hash": 0})
-        if author:
-            author['_id'] = str(author['_id'])
-            comment['author'] = author
-        
-        # Get replies
-        replies_cursor = db.comments.find({"parent_comment_id": comment['id']})
-        replies = await replies_cursor.to_list(length=None)
-        for reply in replies:
-            reply['_id'] = str(reply['_id'])
-            reply_author = await db.users.find_one({"id": reply['author_id']}, {"password_hash": 0})
-            if reply_author:
-                reply_author['_id'] = str(reply_author['_id'])
-                reply['author'] = reply_author
-        comment['replies'] = replies
+    await attach_users(comments + replies, 'author_id', 'author')
+    await attach_reaction_state(comments + replies, "comment", user.id)
+    
+    replies_by_parent = {}
+    for reply in replies:
+        replies_by_parent.setdefault(reply['parent_comment_id'], []).append(reply)
+    for comment in comments:
+        comment['replies'] = replies_by_parent.get(comment['id'], [])
     
     return comments
 
@@ -3688,6 +5926,7 @@ async def update_profile(request: Request, user: User = Depends(require_auth)):
         was_incomplete = not current_user.get('picture')
         
         await db.users.update_one({"id": user.id}, {"$set": update_fields})
+        invalidate_user_principal(user.id)
         
         # Check if profile is now complete (after update) - has picture
         updated_user = await db.users.find_one({"id": user.id}, {"_id": 0})
@@ -3725,13 +5964,17 @@ async def archive_member(user_id: str, user: User = Depends(require_auth)):
         raise HTTPException(status_code=404, detail="Member not found")
     
     # Set archived flag and prevent login
-    await db.users.update_one(
-        {"id": user_id},
+    result = await db.users.update_one(
+        {"id": user_id, "archived": {"$ne": True}},
         {"$set": {"archived": True, "archived_at": datetime.now(timezone.utc).isoformat()}}
     )
+    if result.modified_count:
+        await adjust_community_member_count(-1)
     
     # Delete all active sessions
     await db.user_sessions.delete_many({"user_id": user_id})
+    invalidate_user_principal(user_id)
+    rank_index.remove(user_id)
     
     return {"message": f"Member {member.get('name')} archived successfully"}
 
@@ -3745,10 +5988,14 @@ async def unarchive_member(user_id: str, user: User = Depends(require_auth)):
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
     
-    await db.users.update_one(
-        {"id": user_id},
+    result = await db.users.update_one(
+        {"id": user_id, "archived": True},
         {"$set": {"archived": False}, "$unset": {"archived_at": ""}}
     )
+    if result.modified_count:
+        await adjust_community_member_count(1)
+    invalidate_user_principal(user_id)
+    rank_index.set(user_id, member.get('total_points', 0))
     
     return {"message": f"Member {member.get('name')} restored successfully"}
 
@@ -3766,8 +6013,12 @@ async def delete_member(user_id: str, user: User = Depends(require_auth)):
         raise HTTPException(status_code=404, detail="Member not found")
     
     # Delete user and all related data
-    await db.users.delete_one({"id": user_id})
+    result = await db.users.delete_one({"id": user_id})
+    if result.deleted_count and not member.get('archived'):
+        await adjust_community_member_count(-1)
     await db.user_sessions.delete_many({"user_id": user_id})
+    invalidate_user_principal(user_id)
+    rank_index.remove(user_id)
     
     return {"message": f"Member {member.get('name')} permanently deleted"}
 
@@ -3803,6 +6054,7 @@ async def cleanup_all_users(request: Request):
                     "sessions": 0,
                     "posts": 0,
                     "comments": 0,
+                    "reactions": 0,
                     "memberships": 0,
                     "messages": 0,
                     "notifications": 0,
@@ -3819,14 +6071,26 @@ async def cleanup_all_users(request: Request):
         result_sessions = await db.user_sessions.delete_many({})
         result_posts = await db.posts.delete_many({})
         result_comments = await db.comments.delete_many({})
+        result_reactions = await db.reactions.delete_many({})
         result_memberships = await db.space_memberships.delete_many({})
+        membership_cache.clear()
+        principal_cache.clear()
         result_messages = await db.direct_messages.delete_many({})
+        await db.conversations.delete_many({"type": "direct"})
         result_notifications = await db.notifications.delete_many({})
+        await db.notification_counters.delete_many({})
         result_transactions = await db.point_transactions.delete_many({})
+        await db.point_buckets.delete_many({})
+        await db.leaderboards.delete_many({})
+        await db.leaderboard_totals.delete_many({})
+        await db.space_progress.delete_many({})
+        await seed_rank_index()
+        await reconcile_community_member_count()
         result_join_requests = await db.join_requests.delete_many({})
         result_invites = await db.invite_tokens.delete_many({})
         result_groups = await db.groups.delete_many({})
         result_group_messages = await db.group_messages.delete_many({})
+        await db.conversations.update_many({"type": "group"}, {"$set": {"last_message": None, "message_count": 0, "read_cursors": {}}})
         result_prefs = await db.user_messaging_preferences.delete_many({})
         
         # Reset space member counts to 0
@@ -3837,6 +6101,7 @@ async def cleanup_all_users(request: Request):
             "sessions": result_sessions.deleted_count,
             "posts": result_posts.deleted_count,
             "comments": result_comments.deleted_count,
+            "reactions": result_reactions.deleted_count,
             "memberships": result_memberships.deleted_count,
             "messages": result_messages.deleted_count,
             "notifications": result_notifications.deleted_count,
@@ -3905,6 +6170,7 @@ async def promote_user_to_admin(request: Request):
             {"email": email},
             {"$set": {"role": "admin"}}
         )
+        invalidate_user_principal(user['id'])
         
         logger.info(f"🔑 User {email} promoted to admin")
         
@@ -3952,6 +6218,7 @@ async def send_dm(request: Request, user: User = Depends(require_auth)):
     
     dm_dict = dm.model_dump()
     dm_dict['created_at'] = dm_dict['created_at'].isoformat()
+    dm.seq = dm_dict['seq'] = await record_direct_message(dm_dict)
     await db.direct_messages.insert_one(dm_dict)
     
     # Create notification
@@ -3965,6 +6232,7 @@ async def send_dm(request: Request, user: User = Depends(require_auth)):
     notif_dict = notification.model_dump()
     notif_dict['created_at'] = notif_dict['created_at'].isoformat()
     await db.notifications.insert_one(notif_dict)
+    await publish_notification(notif_dict)
     
     return dm
 
@@ -3979,9 +6247,7 @@ async def get_feature_requests(sort: str = "votes"):
     requests = await db.feature_requests.find({}, {"_id": 0}).sort(sort_field, -1).to_list(100)
     
     # Enrich with author info
-    for req in requests:
-        author = await db.users.find_one({"id": req['author_id']}, {"_id": 0, "name": 1, "picture": 1})
-        req['author'] = author
+    await attach_users(requests, 'author_id', 'author')
     
     return requests
 
@@ -4137,6 +6403,8 @@ async def delete_space(space_id: str, user: User = Depends(require_auth)):
     
     # Delete space memberships
     await db.space_memberships.delete_many({"space_id": space_id})
+    invalidate_space_membership_maps(space_id)
+    await db.space_progress.delete_many({"space_id": space_id})
     
     # Delete space
     result = await db.spaces.delete_one({"id": space_id})
@@ -4163,6 +6431,124 @@ async def get_analytics(user: User = Depends(require_auth)):
         "total_events": total_events
     }
 
+@api_router.get("/admin/indexes")
+async def get_index_status(user: User = Depends(require_auth)):
+    """Report declared indexes that are missing, still building, or unused (admin only)"""
+    if user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    collections = await get_index_report()
+
+    return {
+        "collections": collections,
+        "missing_count": sum(len(c['missing']) for c in collections.values()),
+        "building_count": sum(len(c['building']) for c in collections.values()),
+        "unused_count": sum(len(c['unused']) for c in collections.values())
+    }
+
+@api_router.get("/admin/metrics")
+async def get_runtime_metrics(user: User = Depends(require_auth)):
+    """In-process runtime counters for this worker (admin only)"""
+    if user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    lookups = principal_cache_stats['hits'] + principal_cache_stats['misses']
+    membership_lookups = membership_cache_stats['hits'] + membership_cache_stats['misses']
+    return {
+        "auth_cache": {
+            **principal_cache_stats,
+            "hit_rate": round(principal_cache_stats['hits'] / lookups, 4) if lookups else None,
+            "size": len(principal_cache),
+            "max_size": principal_cache.maxsize,
+            "ttl_seconds": principal_cache.ttl
+        },
+        "membership_cache": {
+            **membership_cache_stats,
+            "hit_rate": round(membership_cache_stats['hits'] / membership_lookups, 4) if membership_lookups else None,
+            "size": len(membership_cache),
+            "max_size": membership_cache.maxsize,
+            "ttl_seconds": membership_cache.ttl
+        },
+        "password_hashing": {
+            **password_hash_stats,
+            "queue_depth": max(0, password_hash_stats['pending'] - PASSWORD_HASH_WORKERS),
+            "workers": PASSWORD_HASH_WORKERS,
+            "timeout_seconds": PASSWORD_HASH_TIMEOUT_SECONDS
+        },
+        "email_outbox": {
+            **email_outbox_stats,
+            "transport": email_transport.name,
+            "workers": EMAIL_OUTBOX_WORKERS,
+            "claimed_not_sent": email_outbox_queue.qsize() if email_outbox_queue else 0,
+            "rate_limit_per_second": EMAIL_RATE_LIMIT_PER_SECOND
+        },
+        "block_expiry": {
+            **block_expiry_scheduler.stats,
+            "pending": len(block_expiry_scheduler.heap),
+            "next_expiry_at": block_expiry_scheduler.heap[0][0].isoformat() if block_expiry_scheduler.heap else None
+        },
+        "lesson_progress_buffer": {
+            **lesson_progress_buffer.stats,
+            "pending": len(lesson_progress_buffer.pending),
+            "flush_interval_seconds": LESSON_PROGRESS_FLUSH_SECONDS
+        },
+        "websockets": ws_manager.metrics(),
+        "realtime_bus": ws_manager.bus.metrics()
+    }
+
+@api_router.get("/admin/jobs")
+async def get_scheduled_jobs(user: User = Depends(require_auth)):
+    """Scheduled jobs on this worker with run, duration and failure counters (admin only)"""
+    if user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    leader = await db.job_locks.find_one({"id": JOB_LEADER_LOCK_ID}, {"_id": 0})
+    return {
+        "worker_id": job_scheduler.worker_id,
+        "is_leader": job_scheduler.is_leader,
+        "leader": leader,
+        "jobs": [job.snapshot() for job in job_scheduler.jobs.values()]
+    }
+
+@api_router.get("/admin/email-outbox")
+async def get_email_outbox(status: str = "dead", limit: int = 50, user: User = Depends(require_auth)):
+    """Outbox counts by status plus the most recent messages in one status (admin only)"""
+    if user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    counts = await db.email_outbox.aggregate([
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ]).to_list(None)
+    messages = await db.email_outbox.find(
+        {"status": status},
+        {"_id": 0, "html_content": 0}
+    ).sort("created_at", -1).limit(min(limit, 200)).to_list(None)
+
+    return {
+        "counts": {c['_id']: c['count'] for c in counts},
+        "messages": messages
+    }
+
+@api_router.post("/admin/email-outbox/{outbox_id}/retry")
+async def retry_dead_email(outbox_id: str, user: User = Depends(require_auth)):
+    """Move a dead-lettered email back to pending with a fresh attempt budget (admin only)"""
+    if user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    result = await db.email_outbox.update_one(
+        {"id": outbox_id, "status": "dead"},
+        {"$set": {
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": datetime.now(timezone.utc).isoformat()
+        }}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Dead-lettered email not found")
+
+    email_outbox_wakeup.set()
+    return {"message": "Email requeued"}
+
 # Join Request Management
 @api_router.post("/spaces/{space_id}/join-request")
 async def create_join_request(space_id: str, request: Request, user: User = Depends(require_auth)):
@@ -4265,6 +6651,7 @@ async def approve_join_request(request_id: str, user: User = Depends(require_aut
     membership_dict = membership.model_dump()
     membership_dict['joined_at'] = membership_dict['joined_at'].isoformat()
     await db.space_memberships.insert_one(membership_dict)
+    invalidate_membership_map(join_request['user_id'])
     
     # Update space member count
     await db.spaces.update_one(
@@ -4520,6 +6907,7 @@ async def join_via_invite(invite_code: str, user: User = Depends(require_auth)):
     membership_dict = membership.model_dump()
     membership_dict['joined_at'] = membership_dict['joined_at'].isoformat()
     await db.space_memberships.insert_one(membership_dict)
+    invalidate_membership_map(user.id)
     
     # Increment member count and invite uses
     await db.spaces.update_one({"id": space_id}, {"$inc": {"member_count": 1}})
@@ -4550,12 +6938,7 @@ async def get_space_members_detailed(space_id: str, user: User = Depends(require
     }, {"_id": 0}).to_list(1000)
     
     # Enrich with user data
-    for membership in memberships:
-        user_data = await db.users.find_one(
-            {"id": membership['user_id']}, 
-            {"_id": 0, "id": 1, "name": 1, "email": 1, "picture": 1, "role": 1, "badges": 1}
-        )
-        membership['user'] = user_data
+    await attach_users(memberships, 'user_id', 'user', projection="admin")
     
     return {"members": memberships, "count": len(memberships)}
 
@@ -4580,6 +6963,7 @@ async def remove_space_member(space_id: str, user_id: str, user: User = Depends(
         "space_id": space_id,
         "user_id": user_id
     })
+    invalidate_membership_map(user_id)
     
     if result.deleted_count > 0:
         await db.spaces.update_one({"id": space_id}, {"$inc": {"member_count": -1}})
@@ -4615,6 +6999,10 @@ async def block_space_member(space_id: str, user_id: str, request: Request, user
             block_expires_at = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid expires_at format: {str(e)}")
+        # Stored in UTC so expiry strings sort chronologically
+        if block_expires_at.tzinfo is None:
+            block_expires_at = block_expires_at.replace(tzinfo=timezone.utc)
+        block_expires_at = block_expires_at.astimezone(timezone.utc)
     
     result = await db.space_memberships.update_one(
         {
@@ -4631,10 +7019,14 @@ async def block_space_member(space_id: str, user_id: str, request: Request, user
             }
         }
     )
+    invalidate_membership_map(user_id)
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Member not found")
     
+    if block_expires_at:
+        block_expiry_scheduler.schedule(user_id, space_id, block_expires_at.isoformat())
+    
     block_msg = f"Member {block_type}-blocked successfully"
     if block_expires_at:
         block_msg += f" until {block_expires_at.strftime('%Y-%m-%d %H:%M:%S %Z')}"
@@ -4671,6 +7063,8 @@ async def create_level(request: Request, user: User = Depends(require_auth)):
     level_dict = level.model_dump()
     level_dict['created_at'] = level_dict['created_at'].isoformat()
     await db.levels.insert_one(level_dict)
+    invalidate_level_table()
+    await start_level_recalculation(trigger="create_level")
     
     return level
 
@@ -4695,13 +7089,14 @@ async def update_level(level_id: str, request: Request, user: User = Depends(req
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Level not found")
+    invalidate_level_table()
     
-    # Recalculate all users' levels after updating level points
-    users = await db.users.find({}, {"_id": 0, "id": 1}).to_list(10000)
-    for u in users:
-        await update_user_level(u['id'])
+    # Recalculate all users' levels in the background after updating level points
+    job_id = None
+    if 'points_required' in update_fields:
+        job_id = await start_level_recalculation(trigger="update_level")
     
-    return {"message": "Level updated successfully"}
+    return {"message": "Level updated successfully", "recalculation_job_id": job_id}
 
 @api_router.delete("/admin/levels/{level_id}")
 async def delete_level(level_id: str, user: User = Depends(require_auth)):
@@ -4713,72 +7108,62 @@ async def delete_level(level_id: str, user: User = Depends(require_auth)):
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Level not found")
+    invalidate_level_table()
+    job_id = await start_level_recalculation(trigger="delete_level")
     
-    return {"message": "Level deleted successfully"}
+    return {"message": "Level deleted successfully", "recalculation_job_id": job_id}
 
 @api_router.get("/leaderboard")
 async def get_leaderboard(time_filter: str = "all", user: User = Depends(require_auth)):
     """
     Get leaderboard with time filter
-    time_filter: 'week' (7 days), 'month' (30 days), or 'all'
+    time_filter: 'week' (last 7 days), 'month' (last 30 days), or 'all'
+    Served from the materialized board; computed_at says how fresh it is.
     """
-    # Calculate date threshold
-    now = datetime.now(timezone.utc)
-    date_threshold = None
-    
-    if time_filter == "week":
-        date_threshold = now - timedelta(days=7)
-    elif time_filter == "month":
-        date_threshold = now - timedelta(days=30)
-    
-    # Get all users
-    all_users = await db.users.find(
-        {"archived": False},
-        {"_id": 0, "id": 1, "name": 1, "picture": 1, "total_points": 1, "current_level": 1}
-    ).to_list(10000)
-    
-    # Calculate points for the time period
-    leaderboard_data = []
-    for u in all_users:
-        if time_filter == "all":
-            # Use total_points directly
-            points = u.get('total_points', 0)
-        else:
-            # Calculate points from transactions in the time period
-            query = {"user_id": u['id']}
-            if date_threshold:
-                query["created_at"] = {"$gte": date_threshold.isoformat()}
-            
-            transactions = await db.point_transactions.find(query, {"_id": 0, "points": 1}).to_list(10000)
-            points = sum(t['points'] for t in transactions)
-        
-        if points > 0:  # Only include users with points
-            leaderboard_data.append({
-                "user_id": u['id'],
-                "name": u['name'],
-                "picture": u.get('picture'),
-                "points": points,
-                "level": u.get('current_level', 1)
-            })
-    
-    # Sort by points descending
-    leaderboard_data.sort(key=lambda x: x['points'], reverse=True)
-    
-    # Add rank
-    for idx, entry in enumerate(leaderboard_data):
-        entry['rank'] = idx + 1
+    if time_filter not in LEADERBOARD_WINDOW_DAYS:
+        time_filter = "all"
     
     # Get current user's stats
     current_user_stats = await get_user_leaderboard_stats(user.id)
     
-    # Find current user's position in this filtered leaderboard
-    current_user_entry = next((entry for entry in leaderboard_data if entry['user_id'] == user.id), None)
+    if time_filter == "all" and rank_index.ready:
+        # All-time is served live from the in-process rank index
+        board = {
+            "entries": await hydrate_rank_entries(rank_index.top(LEADERBOARD_SIZE)),
+            "computed_at": datetime.now(timezone.utc).isoformat()
+        }
+        current_user_rank = rank_index.rank(user.id)
+    else:
+        board = await get_materialized_leaderboard(time_filter)
+        
+        # Find current user's position: from the board if listed, otherwise counted
+        current_user_entry = next((entry for entry in board['entries'] if entry['user_id'] == user.id), None)
+        if current_user_entry:
+            current_user_rank = current_user_entry['rank']
+        else:
+            current_user_rank = await get_leaderboard_rank(user.id, time_filter)
     
     return {
-        "leaderboard": leaderboard_data[:100],  # Top 100
+        "leaderboard": board['entries'],
         "current_user": current_user_stats,
-        "current_user_rank": current_user_entry['rank'] if current_user_entry else None,
-        "time_filter": time_filter
+        "current_user_rank": current_user_rank,
+        "time_filter": time_filter,
+        "computed_at": board['computed_at']
+    }
+
+@api_router.get("/leaderboard/around-me")
+async def get_leaderboard_around_me(radius: int = 5, user: User = Depends(require_auth)):
+    """All-time leaderboard window of `radius` users either side of the caller"""
+    if not rank_index.ready:
+        raise HTTPException(status_code=503, detail="Leaderboard is warming up. Please try again shortly.")
+    
+    radius = max(1, min(radius, 50))
+    rank = rank_index.rank(user.id)
+    return {
+        "rank": rank,
+        "points": rank_index.points.get(user.id, 0),
+        "total_ranked": len(rank_index),
+        "entries": await hydrate_rank_entries(rank_index.around(user.id, radius)) if rank else []
     }
 
 @api_router.get("/users/{user_id}/points-history")
@@ -4824,8 +7209,21 @@ async def seed_default_levels(user: User = Depends(require_auth)):
         level_dict = level.model_dump()
         level_dict['created_at'] = level_dict['created_at'].isoformat()
         await db.levels.insert_one(level_dict)
+    invalidate_level_table()
+    job_id = await start_level_recalculation(trigger="seed_levels")
+    
+    return {"message": "Default 10 levels created successfully", "count": len(default_levels), "recalculation_job_id": job_id}
+
+@api_router.get("/admin/levels/recalculations/{job_id}")
+async def get_level_recalculation(job_id: str, user: User = Depends(require_auth)):
+    """Progress of a level recalculation job (admin only)"""
+    if user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
     
-    return {"message": "Default 10 levels created successfully", "count": len(default_levels)}
+    job = await db.background_jobs.find_one({"id": job_id, "type": "level_recalculation"}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @api_router.put("/spaces/{space_id}/members/{user_id}/unblock")
 async def unblock_space_member(space_id: str, user_id: str, user: User = Depends(require_auth)):
@@ -4851,6 +7249,7 @@ async def unblock_space_member(space_id: str, user_id: str, user: User = Depends
             }
         }
     )
+    invalidate_membership_map(user_id)
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Blocked member not found")
@@ -4882,6 +7281,7 @@ async def promote_to_manager(space_id: str, user_id: str, user: User = Depends(r
             "$set": {"role": "manager"}
         }
     )
+    invalidate_membership_map(user_id)
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Member not found")
@@ -4913,6 +7313,7 @@ async def demote_from_manager(space_id: str, user_id: str, user: User = Depends(
             "$set": {"role": "member"}
         }
     )
+    invalidate_membership_map(user_id)
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Manager not found")
@@ -4950,6 +7351,7 @@ async def promote_user_to_admin(user_id: str, user: User = Depends(require_auth)
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
+    invalidate_user_principal(user_id)
     return {"message": "User promoted to admin successfully"}
 
 @api_router.put("/users/{user_id}/demote-from-admin")
@@ -4984,6 +7386,7 @@ async def demote_user_from_admin(user_id: str, user: User = Depends(require_auth
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
+    invalidate_user_principal(user_id)
     return {"message": "Admin demoted to learner successfully"}
 
 @api_router.get("/users/all")
@@ -5023,48 +7426,16 @@ async def get_user_managed_spaces(user_id: str, user: User = Depends(require_aut
 
 @api_router.post("/admin/process-expired-blocks")
 async def process_expired_blocks(user: User = Depends(require_auth)):
-    """Process all expired blocks and auto-unblock them (admin only)"""
+    """Rebuild the block expiry schedule and unblock everything already due (admin only)"""
     if user.role != 'admin':
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    # Find all blocked memberships with expiry dates
-    blocked_memberships = await db.space_memberships.find({
-        "status": "blocked",
-        "block_expires_at": {"$ne": None}
-    }, {"_id": 0}).to_list(1000)
-    
-    unblocked_count = 0
-    now = datetime.now(timezone.utc)
-    
-    for membership in blocked_memberships:
-        block_expires_at = membership.get('block_expires_at')
-        if block_expires_at:
-            try:
-                expiry_datetime = datetime.fromisoformat(block_expires_at.replace('Z', '+00:00'))
-                
-                # If block has expired, auto-unblock
-                if now >= expiry_datetime:
-                    await db.space_memberships.update_one(
-                        {
-                            "user_id": membership['user_id'],
-                            "space_id": membership['space_id']
-                        },
-                        {
-                            "$set": {
-                                "status": "member",
-                                "blocked_at": None,
-                                "blocked_by": None,
-                                "block_type": "hard",
-                                "block_expires_at": None
-                            }
-                        }
-                    )
-                    unblocked_count += 1
-            except Exception as e:
-                logger.error(f"Error processing expired block: {e}")
+    await block_expiry_scheduler.rebuild()
+    tracked = len(block_expiry_scheduler.heap)
+    unblocked_count = await block_expiry_scheduler.unblock_due()
     
     return {
-        "message": f"Processed {len(blocked_memberships)} blocked memberships",
+        "message": f"Processed {tracked} blocked memberships",
         "unblocked_count": unblocked_count
     }
 
@@ -5094,6 +7465,7 @@ async def set_user_team_member_status(user_id: str, request: Request, user: User
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
+    invalidate_user_principal(user_id)
     action = "granted" if is_team_member else "removed"
     return {"message": f"Team member badge {action} successfully"}
 
@@ -5208,12 +7580,14 @@ async def delete_subscription_tier(tier_id: str, user: User = Depends(require_au
 @api_router.delete("/notifications/{notification_id}")
 async def delete_notification(notification_id: str, user: User = Depends(require_auth)):
     """Delete a notification"""
-    result = await db.notifications.delete_one({
+    deleted = await db.notifications.find_one_and_delete({
         "id": notification_id,
         "user_id": user.id  # Only allow users to delete their own notifications
-    })
-    if result.deleted_count == 0:
+    }, projection={"_id": 0, "is_read": 1})
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Notification not found")
+    if not deleted.get('is_read'):
+        await publish_unread_notifications(user.id, await adjust_unread_notifications(user.id, -1))
     return {"status": "success", "message": "Notification deleted"}
 
 
@@ -5324,17 +7698,8 @@ async def get_user_onboarding_progress(user: User = Depends(require_auth)):
     has_commented = bool(first_comment)
     
     # Check if user has reacted to any post
-    # Look for any post where the user's ID appears in the reactions
-    has_reacted = False
-    posts_with_reactions = await db.posts.find({"reactions": {"$exists": True}}).to_list(1000)
-    for post in posts_with_reactions:
-        reactions = post.get('reactions', {})
-        for emoji, user_ids in reactions.items():
-            if user.id in user_ids:
-                has_reacted = True
-                break
-        if has_reacted:
-            break
+    first_reaction = await db.reactions.find_one({"user_id": user.id, "target_type": "post"})
+    has_reacted = bool(first_reaction)
     
     steps = [
         {
@@ -5471,21 +7836,42 @@ async def can_send_message(sender: User, receiver_id: str) -> tuple[bool, str]:
 # WebSocket endpoint for real-time messaging
 @app.websocket("/ws/messages/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
-    """WebSocket endpoint for real-time messaging"""
-    await ws_manager.connect(user_id, websocket)
+    """
+    WebSocket endpoint for real-time messaging.
+    
+    Authenticated with the session cookie. Clients that cannot send one send
+    {"type": "auth", "token": "<session token>"} as the first frame after the socket opens
+    (never in the URL, which ends up in access logs). The session must belong to user_id.
+    """
+    session_token = websocket.cookies.get("session_token")
+    if not session_token:
+        await websocket.accept()
+        try:
+            frame = await asyncio.wait_for(websocket.receive_json(), WS_AUTH_TIMEOUT_SECONDS)
+            if isinstance(frame, dict) and frame.get('type') == 'auth' and isinstance(frame.get('token'), str):
+                session_token = frame.get('token')
+        except WebSocketDisconnect:
+            return
+        except Exception:
+            pass  # Timed out or not JSON; rejected below
+    user = await resolve_session_user(session_token)
+    if not user or user.id != user_id:
+        ws_manager.stats['auth_failures'] += 1
+        await websocket.close(code=1008)
+        return
+    
+    connection = await ws_manager.connect(user_id, websocket)
     try:
         while True:
-            # Keep connection alive and receive messages
-            data = await websocket.receive_json()
-            # Messages are sent via HTTP POST endpoints
-            # This just keeps the connection alive
-            logger.info(f"Received websocket data from {user_id}: {data}")
+            # Messages are sent via HTTP POST endpoints; inbound frames are pongs and
+            # keep-alives, and any of them marks the connection as alive
+            await websocket.receive_text()
+            connection.last_seen = time.monotonic()
     except WebSocketDisconnect:
-        ws_manager.disconnect(user_id)
-        logger.info(f"User {user_id} disconnected from websocket")
+        ws_manager.disconnect(connection)
     except Exception as e:
         logger.error(f"WebSocket error for user {user_id}: {e}")
-        ws_manager.disconnect(user_id)
+        ws_manager.disconnect(connection)
 
 # Get messaging settings (platform-level)
 @api_router.get("/admin/messaging-settings")
@@ -5592,6 +7978,7 @@ async def update_email_preferences(request: Request, user: User = Depends(requir
         {"id": user.id},
         {"$set": {"email_notifications_enabled": bool(email_notifications_enabled)}}
     )
+    invalidate_user_principal(user.id)
     
     return {"status": "success", "email_notifications_enabled": email_notifications_enabled}
 
@@ -5602,121 +7989,239 @@ async def get_email_preferences(user: User = Depends(require_auth)):
     return {"email_notifications_enabled": user_data.get("email_notifications_enabled", True)}
 
 
+# ==================== CONVERSATIONS ====================
+
+# One document per DM pair or message group with the last message, last activity time,
+# a message counter and each member's read cursor, kept up to date on every send/read so
+# the inbox is a single indexed query instead of a scan over the whole message history.
+# Messages are stamped with their sequence number (seq) in the conversation, so a member's
+# unread count is message_count minus the seq their read cursor points at. Sending only
+# moves the sender's cursor when they were already caught up, so messages they send while
+# behind count as unread for them until they read the thread.
+MAX_CONVERSATION_PAGE_SIZE = 100
+
+def direct_conversation_id(user_a: str, user_b: str) -> str:
+    """Stable conversation id for a DM pair, independent of who sent first"""
+    return "dm:" + ":".join(sorted([user_a, user_b]))
+
+def group_conversation_id(group_id: str) -> str:
+    return f"group:{group_id}"
+
+def conversation_unread_count(conversation: dict, user_id: str) -> int:
+    read_seq = conversation.get('read_cursors', {}).get(user_id, {}).get('seq', 0)
+    return max(0, conversation.get('message_count', 0) - read_seq)
+
+async def mark_conversation_read(conversation_id: str, user_id: str, seq: int, read_at: str) -> Optional[dict]:
+    """Move a member's read cursor forward (never back) and return everyone's cursors"""
+    return await db.conversations.find_one_and_update(
+        {"id": conversation_id},
+        {"$max": {f"read_cursors.{user_id}.seq": seq, f"read_cursors.{user_id}.last_read_at": read_at}},
+        projection={"_id": 0, "read_cursors": 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def append_conversation_message(conversation_id: str, last_message: dict, sender_id: str, on_insert: dict) -> int:
+    """
+    Make a message the conversation's last message and return its seq. A sender who had read
+    everything before it is moved past their own message; a sender with unread incoming
+    messages keeps their cursor, so replying does not mark those messages read.
+    """
+    conversation = await db.conversations.find_one_and_update(
+        {"id": conversation_id},
+        {
+            "$set": {"last_message": last_message, "last_activity_at": last_message['created_at']},
+            "$inc": {"message_count": 1},
+            "$setOnInsert": {**on_insert, "created_at": last_message['created_at']}
+        },
+        projection={"_id": 0, "message_count": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    seq = conversation['message_count']
+    cursor = f"read_cursors.{sender_id}"
+    caught_up = {f"{cursor}.seq": seq - 1}
+    if seq == 1:
+        caught_up = {"$or": [caught_up, {f"{cursor}.seq": {"$exists": False}}]}
+    await db.conversations.update_one(
+        {"id": conversation_id, **caught_up},
+        {"$max": {f"{cursor}.seq": seq, f"{cursor}.last_read_at": last_message['created_at']}}
+    )
+    return seq
+
+async def record_direct_message(msg_dict: dict) -> int:
+    """Make a DM the conversation's last message, returning the seq to store it with"""
+    return await append_conversation_message(
+        direct_conversation_id(msg_dict['sender_id'], msg_dict['receiver_id']),
+        {k: msg_dict[k] for k in ("id", "sender_id", "receiver_id", "content", "created_at")},
+        msg_dict['sender_id'],
+        {"type": "direct", "participant_ids": sorted([msg_dict['sender_id'], msg_dict['receiver_id']])}
+    )
+
+async def record_group_message(group: dict, msg_dict: dict, sender_name: str) -> int:
+    """Make a group message the group conversation's last message, returning the seq to store it with"""
+    return await append_conversation_message(
+        group_conversation_id(group['id']),
+        {
+            **{k: msg_dict[k] for k in ("id", "group_id", "sender_id", "content", "created_at")},
+            "sender_name": sender_name
+        },
+        msg_dict['sender_id'],
+        {"type": "group", "group_id": group['id'], "participant_ids": group['member_ids']}
+    )
+
+async def create_group_conversation(group_dict: dict):
+    """Empty group conversations still show up in members' inboxes, ordered by creation time"""
+    await db.conversations.update_one(
+        {"id": group_conversation_id(group_dict['id'])},
+        {
+            "$set": {"participant_ids": group_dict['member_ids']},
+            "$setOnInsert": {
+                "type": "group",
+                "group_id": group_dict['id'],
+                "last_message": None,
+                "last_activity_at": group_dict['created_at'],
+                "message_count": 0,
+                "created_at": group_dict['created_at']
+            }
+        },
+        upsert=True
+    )
+
+MAX_MESSAGE_PAGE_SIZE = 100
+
+async def fetch_message_page(collection, query: dict, response: Response, before: Optional[str], after: Optional[str], limit: int) -> List[dict]:
+    """
+    One page of a message thread in chronological order, keyset-paginated on (created_at, id).
+    
+    Without a cursor this is the newest `limit` messages; `before` pages back through older
+    history and `after` fetches what arrived since. X-After-Cursor is set on every non-empty
+    page so a client can poll for newer messages from it; X-Before-Cursor is set when older
+    history exists.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Pass either before or after, not both")
+    limit = max(1, min(limit, MAX_MESSAGE_PAGE_SIZE))
+    if before or after:
+        created_at, message_id = decode_feed_cursor(before or after)
+        op = "$lt" if before else "$gt"
+        query = {"$and": [query, {"$or": [
+            {"created_at": {op: created_at}},
+            {"created_at": created_at, "id": {op: message_id}}
+        ]}]}
+    
+    # Newest first unless reading forward; one extra document tells us whether more exist
+    direction = 1 if after else -1
+    messages = await collection.find(query, {"_id": 0}).sort(
+        [("created_at", direction), ("id", direction)]
+    ).limit(limit + 1).to_list(limit + 1)
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if not after:
+        messages.reverse()
+    
+    for msg in messages:
+        if 'created_at' in msg and isinstance(msg['created_at'], datetime):
+            msg['created_at'] = msg['created_at'].isoformat()
+    
+    if messages:
+        response.headers['X-After-Cursor'] = encode_feed_cursor(messages[-1])
+        # Reading forward, the cursor message itself is older history
+        if after or has_more:
+            response.headers['X-Before-Cursor'] = encode_feed_cursor(messages[0])
+    return messages
+
 # Get conversations list
 @api_router.get("/messages/conversations")
-async def get_conversations(user: User = Depends(require_auth)):
-    """Get list of conversations for current user"""
-    # Get direct messages
-    direct_messages = await db.direct_messages.find({
-        "$or": [
-            {"sender_id": user.id},
-            {"receiver_id": user.id}
+async def get_conversations(response: Response, cursor: Optional[str] = None, limit: int = 50, user: User = Depends(require_auth)):
+    """
+    Get the current user's conversations, most recently active first.
+    
+    Returns one page; when more exist, X-Next-Cursor holds the cursor for the next page.
+    """
+    limit = max(1, min(limit, MAX_CONVERSATION_PAGE_SIZE))
+    query = {"participant_ids": user.id}
+    if cursor:
+        last_activity_at, conversation_id = decode_feed_cursor(cursor)
+        query["$or"] = [
+            {"last_activity_at": {"$lt": last_activity_at}},
+            {"last_activity_at": last_activity_at, "id": {"$lt": conversation_id}}
         ]
-    }, {"_id": 0}).sort("created_at", -1).to_list(1000)
     
-    # Get unique conversation partners
-    conversation_users = set()
-    for msg in direct_messages:
-        if msg['sender_id'] != user.id:
-            conversation_users.add(msg['sender_id'])
-        if msg['receiver_id'] != user.id:
-            conversation_users.add(msg['receiver_id'])
+    # One extra document tells us whether another page exists
+    docs = await db.conversations.find(query, {"_id": 0}).sort(
+        [("last_activity_at", -1), ("id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers['X-Next-Cursor'] = encode_feed_cursor({"created_at": docs[-1]['last_activity_at'], "id": docs[-1]['id']})
+    
+    # Partners and groups for the whole page in one batch each
+    partner_ids = [next((p for p in doc['participant_ids'] if p != user.id), None) for doc in docs if doc['type'] == 'direct']
+    partners = await get_user_loader().load_many(partner_ids)
+    group_ids = [doc['group_id'] for doc in docs if doc['type'] == 'group']
+    groups = {}
+    if group_ids:
+        group_docs = await db.message_groups.find({"id": {"$in": group_ids}}, {"_id": 0}).to_list(len(group_ids))
+        groups = {group['id']: group for group in group_docs}
     
-    # Get user details for conversations
     conversations = []
-    for user_id in conversation_users:
-        user_data = await db.users.find_one(
-            {"id": user_id},
-            {"_id": 0, "id": 1, "name": 1, "picture": 1, "role": 1}
-        )
-        if user_data:
-            # Get last message
-            last_msg_cursor = db.direct_messages.find(
-                {
-                    "$or": [
-                        {"sender_id": user.id, "receiver_id": user_id},
-                        {"sender_id": user_id, "receiver_id": user.id}
-                    ]
-                },
-                {"_id": 0}
-            ).sort("created_at", -1).limit(1)
-            last_msg_list = await last_msg_cursor.to_list(1)
-            last_msg = last_msg_list[0] if last_msg_list else None
-            
-            # Count unread messages
-            unread_count = await db.direct_messages.count_documents({
-                "sender_id": user_id,
-                "receiver_id": user.id,
-                "is_read": False
-            })
-            
+    for doc in docs:
+        if doc['type'] == 'direct':
+            partner_id = next((p for p in doc['participant_ids'] if p != user.id), None)
+            user_data = partners.get(partner_id)
+            if not user_data:
+                continue
             conversations.append({
                 "type": "direct",
                 "user": user_data,
-                "last_message": last_msg,
-                "unread_count": unread_count
+                "last_message": doc.get('last_message'),
+                "unread_count": conversation_unread_count(doc, user.id),
+                "last_activity_at": doc['last_activity_at']
+            })
+        else:
+            group = groups.get(doc['group_id'])
+            if not group:
+                continue
+            conversations.append({
+                "type": "group",
+                "group": group,
+                "last_message": doc.get('last_message'),
+                "unread_count": conversation_unread_count(doc, user.id),
+                "last_activity_at": doc['last_activity_at']
             })
-    
-    # Get group conversations
-    groups = await db.message_groups.find(
-        {"member_ids": user.id},
-        {"_id": 0}
-    ).to_list(100)
-    
-    for group in groups:
-        # Get last message in group
-        last_msg_cursor = db.group_messages.find(
-            {"group_id": group['id']},
-            {"_id": 0}
-        ).sort("created_at", -1).limit(1)
-        last_msg_list = await last_msg_cursor.to_list(1)
-        last_msg = last_msg_list[0] if last_msg_list else None
-        
-        # Get sender info if last message exists
-        if last_msg:
-            sender = await db.users.find_one(
-                {"id": last_msg['sender_id']},
-                {"_id": 0, "name": 1}
-            )
-            if sender:
-                last_msg['sender_name'] = sender['name']
-        
-        conversations.append({
-            "type": "group",
-            "group": group,
-            "last_message": last_msg,
-            "unread_count": 0  # TODO: Implement group unread tracking
-        })
-    
-    # Sort conversations by last message time
-    conversations.sort(
-        key=lambda x: x['last_message']['created_at'] if x['last_message'] else datetime.min.replace(tzinfo=timezone.utc),
-        reverse=True
-    )
     
     return conversations
 
 # Get messages in a conversation
 @api_router.get("/messages/direct/{other_user_id}")
-async def get_direct_messages(other_user_id: str, user: User = Depends(require_auth), limit: int = 50):
-    """Get direct messages with another user"""
-    messages = await db.direct_messages.find({
+async def get_direct_messages(
+    other_user_id: str,
+    response: Response,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = 50,
+    user: User = Depends(require_auth)
+):
+    """Get a page of direct messages with another user (newest page first, chronological order)"""
+    messages = await fetch_message_page(db.direct_messages, {
         "$or": [
             {"sender_id": user.id, "receiver_id": other_user_id},
             {"sender_id": other_user_id, "receiver_id": user.id}
         ]
-    }, {"_id": 0}).sort("created_at", 1).limit(limit).to_list(limit)
-    
-    # Mark messages as read
-    await db.direct_messages.update_many(
-        {"sender_id": other_user_id, "receiver_id": user.id, "is_read": False},
-        {"$set": {"is_read": True}}
-    )
-    
-    # Convert datetime to ISO string
-    for msg in messages:
-        if 'created_at' in msg and isinstance(msg['created_at'], datetime):
-            msg['created_at'] = msg['created_at'].isoformat()
+    }, response, before, after, limit)
+    
+    # Mark read up to the newest message this page showed; each message is read once the
+    # receiver's cursor has reached it
+    if messages:
+        conversation = await mark_conversation_read(
+            direct_conversation_id(user.id, other_user_id),
+            user.id,
+            max(msg.get('seq', 0) for msg in messages),
+            messages[-1]['created_at']
+        )
+        read_cursors = (conversation or {}).get('read_cursors', {})
+        for msg in messages:
+            msg['is_read'] = msg.get('seq', 0) <= read_cursors.get(msg['receiver_id'], {}).get('seq', 0)
     
     return messages
 
@@ -5749,6 +8254,7 @@ async def send_direct_message(receiver_id: str, request: Request, user: User = D
     
     msg_dict = message.model_dump()
     msg_dict['created_at'] = msg_dict['created_at'].isoformat()
+    message.seq = msg_dict['seq'] = await record_direct_message(msg_dict)
     await db.direct_messages.insert_one(msg_dict)
     
     # Send real-time notification to receiver via WebSocket
@@ -5820,6 +8326,7 @@ async def create_message_group(request: Request, user: User = Depends(require_au
     group_dict = group.model_dump()
     group_dict['created_at'] = group_dict['created_at'].isoformat()
     await db.message_groups.insert_one(group_dict)
+    await create_group_conversation(group_dict)
     
     # Notify all members
     for member_id in member_ids:
@@ -5840,8 +8347,15 @@ async def create_message_group(request: Request, user: User = Depends(require_au
 
 # Get group messages
 @api_router.get("/messages/groups/{group_id}")
-async def get_group_messages(group_id: str, user: User = Depends(require_auth), limit: int = 50):
-    """Get messages in a group"""
+async def get_group_messages(
+    group_id: str,
+    response: Response,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = 50,
+    user: User = Depends(require_auth)
+):
+    """Get a page of messages in a group (newest page first, chronological order)"""
     # Check if user is a member
     group = await db.message_groups.find_one({"id": group_id})
     if not group:
@@ -5850,24 +8364,22 @@ async def get_group_messages(group_id: str, user: User = Depends(require_auth),
     if user.id not in group['member_ids']:
         raise HTTPException(status_code=403, detail="You are not a member of this group")
     
-    messages = await db.group_messages.find(
-        {"group_id": group_id},
-        {"_id": 0}
-    ).sort("created_at", 1).limit(limit).to_list(limit)
+    messages = await fetch_message_page(db.group_messages, {"group_id": group_id}, response, before, after, limit)
+    if messages:
+        await mark_conversation_read(
+            group_conversation_id(group_id),
+            user.id,
+            max(msg.get('seq', 0) for msg in messages),
+            messages[-1]['created_at']
+        )
     
     # Enrich with sender info
+    senders = await get_user_loader().load_many([msg['sender_id'] for msg in messages])
     for msg in messages:
-        sender = await db.users.find_one(
-            {"id": msg['sender_id']},
-            {"_id": 0, "name": 1, "picture": 1}
-        )
+        sender = senders.get(msg['sender_id'])
         if sender:
             msg['sender_name'] = sender['name']
             msg['sender_picture'] = sender.get('picture')
-        
-        # Convert datetime
-        if 'created_at' in msg and isinstance(msg['created_at'], datetime):
-            msg['created_at'] = msg['created_at'].isoformat()
     
     return messages
 
@@ -5898,24 +8410,23 @@ async def send_group_message(group_id: str, request: Request, user: User = Depen
     
     msg_dict = message.model_dump()
     msg_dict['created_at'] = msg_dict['created_at'].isoformat()
+    message.seq = msg_dict['seq'] = await record_group_message(group, msg_dict, user.name)
     await db.group_messages.insert_one(msg_dict)
     
     # Send real-time notification to all group members via WebSocket
-    for member_id in group['member_ids']:
-        if member_id != user.id:
-            await ws_manager.send_personal_message(member_id, {
-                "type": "new_group_message",
-                "message": {
-                    "id": message.id,
-                    "group_id": group_id,
-                    "group_name": group['name'],
-                    "sender_id": user.id,
-                    "sender_name": user.name,
-                    "sender_picture": user.picture,
-                    "content": content,
-                    "created_at": msg_dict['created_at']
-                }
-            })
+    await ws_manager.broadcast_to_group([m for m in group['member_ids'] if m != user.id], {
+        "type": "new_group_message",
+        "message": {
+            "id": message.id,
+            "group_id": group_id,
+            "group_name": group['name'],
+            "sender_id": user.id,
+            "sender_name": user.name,
+            "sender_picture": user.picture,
+            "content": content,
+            "created_at": msg_dict['created_at']
+        }
+    })
     
     return message
 
@@ -5988,6 +8499,20 @@ async def add_group_member(group_id: str, member_id: str, user: User = Depends(r
             {"id": group_id},
             {"$push": {"member_ids": member_id}}
         )
+        # New members start caught up rather than with the whole history unread
+        conversation = await db.conversations.find_one_and_update(
+            {"id": group_conversation_id(group_id)},
+            {"$addToSet": {"participant_ids": member_id}},
+            projection={"_id": 0, "message_count": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if conversation:
+            await mark_conversation_read(
+                group_conversation_id(group_id),
+                member_id,
+                conversation.get('message_count', 0),
+                datetime.now(timezone.utc).isoformat()
+            )
         
         # Notify the new member
         await create_notification(
@@ -6025,6 +8550,10 @@ async def remove_group_member(group_id: str, member_id: str, user: User = Depend
         {"id": group_id},
         {"$pull": {"member_ids": member_id, "manager_ids": member_id}}
     )
+    await db.conversations.update_one(
+        {"id": group_conversation_id(group_id)},
+        {"$pull": {"participant_ids": member_id}, "$unset": {f"read_cursors.{member_id}": ""}}
+    )
     
     return {"status": "success", "message": "Member removed from group"}
 
@@ -6045,12 +8574,38 @@ async def get_notifications(user: User = Depends(require_auth), limit: int = 50)
 
 @api_router.get("/notifications/unread-count")
 async def get_unread_count(user: User = Depends(require_auth)):
-    """Get count of unread notifications"""
-    count = await db.notifications.count_documents({
-        "user_id": user.id,
-        "is_read": False
+    """Get count of unread notifications (connected clients get it pushed instead)"""
+    return {"count": await get_unread_notification_count(user.id)}
+
+@api_router.get("/notifications/stream")
+async def stream_notifications(request: Request, user: User = Depends(require_auth)):
+    """
+    Server-Sent Events stream of the user's real-time events for clients that can't keep a
+    WebSocket open: `notification` (with unread_count), `unread_notifications`, new messages
+    and pings. Starts with the current unread count.
+    """
+    connection = ws_manager.open_stream(user.id)
+    unread = await get_unread_notification_count(user.id)
+    
+    async def events():
+        try:
+            yield f"event: unread_notifications\ndata: {json.dumps({'type': 'unread_notifications', 'unread_count': unread})}\n\n"
+            while not connection.closed.is_set():
+                try:
+                    message, enqueued_at = await asyncio.wait_for(connection.queue.get(), timeout=WS_PING_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {message.get('type', 'message')}\ndata: {json.dumps(message)}\n\n"
+                ws_manager.record_sent(enqueued_at)
+                connection.last_seen = time.monotonic()
+        finally:
+            ws_manager.disconnect(connection)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
     })
-    return {"count": count}
 
 @api_router.put("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: str, user: User = Depends(require_auth)):
@@ -6061,20 +8616,36 @@ async def mark_notification_read(notification_id: str, user: User = Depends(requ
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Notification not found")
+    if result.modified_count:
+        await publish_unread_notifications(user.id, await adjust_unread_notifications(user.id, -1))
     return {"status": "success"}
 
 @api_router.put("/notifications/mark-all-read")
 async def mark_all_notifications_read(user: User = Depends(require_auth)):
     """Mark all notifications as read"""
-    await db.notifications.update_many(
+    result = await db.notifications.update_many(
         {"user_id": user.id, "is_read": False},
         {"$set": {"is_read": True}}
     )
+    if result.modified_count:
+        await publish_unread_notifications(user.id, await adjust_unread_notifications(user.id, -result.modified_count))
     return {"status": "success"}
 
 
 app.include_router(api_router)
 
+@app.middleware("http")
+async def bind_request_context(request: Request, call_next):
+    """Give each request its own RequestContext and report its MongoDB command count"""
+    ctx = RequestContext()
+    token = request_context.set(ctx)
+    try:
+        response = await call_next(request)
+    finally:
+        request_context.reset(token)
+    response.headers['X-DB-Calls'] = str(ctx.db_calls)
+    return response
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -6082,8 +8653,35 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    # Pagination cursors travel in headers; browsers hide non-safelisted headers unless exposed
+    expose_headers=["X-Next-Cursor", "X-Before-Cursor", "X-After-Cursor"],
 )
 
+# Strong references to fire-and-forget tasks so they are not garbage collected mid-run
+background_tasks: set = set()
+
+def run_in_background(coro) -> asyncio.Task:
+    """Schedule a coroutine on the event loop without awaiting it"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+@app.on_event("startup")
+async def startup_background_tasks():
+    # Index builds run in the background so the worker starts serving immediately
+    run_in_background(ensure_indexes())
+    run_in_background(block_expiry_scheduler.run())
+    run_in_background(job_scheduler.run())
+    await start_email_outbox()
+    await ws_manager.bus.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    password_hash_executor.shutdown(wait=False, cancel_futures=True)
+    await ws_manager.bus.stop()
+    try:
+        await lesson_progress_buffer.flush()
+    except Exception as e:
+        logger.error(f"Lesson progress flush on shutdown failed: {e}")
     client.close()
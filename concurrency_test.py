@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+Concurrency and Counter Consistency Testing
+Tests that denormalized counters, cursors and buffered writes stay consistent under
+concurrent requests against a running backend
+"""
+
+import requests
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Configuration
+BACKEND_URL = "https://collab-hub-48.preview.emergentagent.com/api"
+ADMIN_EMAIL = "admin@test.com"
+ADMIN_PASSWORD = "admin123"
+CONCURRENT_REQUESTS = 8
+
+class ConcurrencyTester:
+    def __init__(self):
+        self.admin_session = requests.Session()
+        self.admin_id = None
+        self.test_space_id = None
+        self.test_post_id = None
+        self.learning_space_id = None
+        self.test_lesson_id = None
+        self.partners = []
+
+    def log(self, message, level="INFO"):
+        """Log test messages"""
+        print(f"[{level}] {message}")
+
+    def clone_session(self, session):
+        """A separate session carrying the same auth cookie, one per concurrent worker"""
+        clone = requests.Session()
+        clone.cookies.update(session.cookies)
+        return clone
+
+    def run_concurrently(self, session, method, url, count=CONCURRENT_REQUESTS, **kwargs):
+        """Fire `count` identical requests at once and return their responses"""
+        sessions = [self.clone_session(session) for _ in range(count)]
+        with ThreadPoolExecutor(max_workers=count) as pool:
+            return list(pool.map(lambda s: s.request(method, url, **kwargs), sessions))
+
+    def setup_admin_session(self):
+        """Setup admin session for testing"""
+        self.log("🔧 Setting up admin session...")
+
+        try:
+            login_data = {"email": ADMIN_EMAIL, "password": ADMIN_PASSWORD}
+            response = self.admin_session.post(f"{BACKEND_URL}/auth/login", json=login_data)
+            if response.status_code == 200:
+                self.admin_id = self.admin_session.get(f"{BACKEND_URL}/auth/me").json()['id']
+                self.log("✅ Admin login successful")
+                return True
+            else:
+                self.log(f"❌ Admin login failed: {response.status_code} - {response.text}", "ERROR")
+                return False
+        except Exception as e:
+            self.log(f"❌ Exception during admin login: {e}", "ERROR")
+            return False
+
+    def setup_test_post(self):
+        """Create a post in the first public space the admin can use"""
+        self.log("🔧 Creating test post...")
+
+        try:
+            spaces = self.admin_session.get(f"{BACKEND_URL}/spaces").json()
+            space = next((s for s in spaces if s.get('visibility') == 'public'), spaces[0] if spaces else None)
+            if not space:
+                self.log("❌ No spaces available", "ERROR")
+                return False
+            self.test_space_id = space['id']
+            self.admin_session.post(f"{BACKEND_URL}/spaces/{self.test_space_id}/join")
+
+            post_data = {"content": f"Concurrency test post {uuid.uuid4().hex[:8]}", "space_id": self.test_space_id}
+            response = self.admin_session.post(f"{BACKEND_URL}/posts", json=post_data)
+            if response.status_code == 200:
+                self.test_post_id = response.json()['id']
+                self.log(f"✅ Test post created (ID: {self.test_post_id})")
+                return True
+            self.log(f"❌ Failed to create test post: {response.status_code} - {response.text}", "ERROR")
+            return False
+        except Exception as e:
+            self.log(f"❌ Exception creating test post: {e}", "ERROR")
+            return False
+
+    def test_concurrent_reaction_toggles(self):
+        """Concurrent toggles of one reaction leave reaction_counts matching my_reactions"""
+        self.log("\n🧪 Test: Concurrent Reaction Toggles")
+
+        try:
+            url = f"{BACKEND_URL}/posts/{self.test_post_id}/react?emoji=👍"
+            responses = self.run_concurrently(self.admin_session, "POST", url)
+            statuses = sorted({r.status_code for r in responses})
+            if any(status not in (200, 409) for status in statuses):
+                self.log(f"❌ Unexpected statuses from concurrent toggles: {statuses}", "ERROR")
+                return False
+
+            posts = self.admin_session.get(f"{BACKEND_URL}/spaces/{self.test_space_id}/posts?limit=100").json()
+            post = next((p for p in posts if p['id'] == self.test_post_id), None)
+            if post is None:
+                self.log("❌ Test post not found in space posts", "ERROR")
+                return False
+            count = post.get('reaction_counts', {}).get('👍', 0)
+            expected = 1 if '👍' in post.get('my_reactions', []) else 0
+            if count == expected and post.get('reacted_by_me') == bool(expected):
+                self.log(f"✅ reaction_counts 👍 = {count} matches my_reactions after {len(responses)} concurrent toggles")
+                return True
+            self.log(f"❌ reaction_counts 👍 = {count} but my_reactions = {post.get('my_reactions')}", "ERROR")
+            return False
+        except Exception as e:
+            self.log(f"❌ Exception in concurrent reaction test: {e}", "ERROR")
+            return False
+
+    def test_concurrent_leaderboard_reads(self):
+        """Concurrent week/month leaderboard reads (including a cold one) agree on the caller's rank"""
+        self.log("\n🧪 Test: Concurrent Leaderboard Reads")
+
+        try:
+            for time_filter in ("week", "month"):
+                url = f"{BACKEND_URL}/leaderboard?time_filter={time_filter}"
+                responses = self.run_concurrently(self.admin_session, "GET", url)
+                if any(r.status_code != 200 for r in responses):
+                    self.log(f"❌ Leaderboard {time_filter} failed: {[r.status_code for r in responses]}", "ERROR")
+                    return False
+                ranks = {r.json()['current_user_rank'] for r in responses}
+                if len(ranks) != 1:
+                    self.log(f"❌ Leaderboard {time_filter} returned different ranks: {ranks}", "ERROR")
+                    return False
+                self.log(f"✅ {time_filter}: {len(responses)} concurrent reads agree on rank {ranks.pop()}")
+            return True
+        except Exception as e:
+            self.log(f"❌ Exception in leaderboard test: {e}", "ERROR")
+            return False
+
+    def setup_test_lesson(self):
+        """Create a lesson in the first learning space"""
+        self.log("🔧 Creating test lesson...")
+
+        try:
+            spaces = self.admin_session.get(f"{BACKEND_URL}/spaces").json()
+            space = next((s for s in spaces if s.get('space_type') == 'learning'), None)
+            if not space:
+                self.log("❌ No learning space available", "ERROR")
+                return False
+            self.learning_space_id = space['id']
+            self.admin_session.post(f"{BACKEND_URL}/spaces/{self.learning_space_id}/join")
+            response = self.admin_session.post(
+                f"{BACKEND_URL}/spaces/{self.learning_space_id}/lessons",
+                json={"title": f"Concurrency test lesson {uuid.uuid4().hex[:8]}"}
+            )
+            if response.status_code == 200:
+                lesson = response.json()
+                self.test_lesson_id = lesson.get('id') or lesson.get('lesson', {}).get('id')
+                self.log(f"✅ Test lesson created (ID: {self.test_lesson_id})")
+                return True
+            self.log(f"❌ Failed to create test lesson: {response.status_code} - {response.text}", "ERROR")
+            return False
+        except Exception as e:
+            self.log(f"❌ Exception creating test lesson: {e}", "ERROR")
+            return False
+
+    def get_my_progress(self):
+        return self.admin_session.get(f"{BACKEND_URL}/spaces/{self.learning_space_id}/my-progress").json()
+
+    def test_concurrent_lesson_completion(self):
+        """Concurrent completion heartbeats for one lesson count it once in the space summary"""
+        self.log("\n🧪 Test: Concurrent Lesson Completion")
+
+        try:
+            before = self.get_my_progress()
+            url = f"{BACKEND_URL}/lessons/{self.test_lesson_id}/progress"
+            responses = self.run_concurrently(self.admin_session, "POST", url, json={"watch_percentage": 95})
+            if any(r.status_code != 200 or not r.json().get('completed') for r in responses):
+                self.log(f"❌ Completion heartbeats failed: {[r.status_code for r in responses]}", "ERROR")
+                return False
+            after = self.get_my_progress()
+            gained = after['completed_lessons'] - before['completed_lessons']
+            if after['total_lessons'] == before['total_lessons'] and gained == 1:
+                self.log(f"✅ {len(responses)} concurrent completions counted once ({after['completed_lessons']}/{after['total_lessons']})")
+                return True
+            self.log(f"❌ Summary went from {before} to {after}", "ERROR")
+            return False
+        except Exception as e:
+            self.log(f"❌ Exception in lesson completion test: {e}", "ERROR")
+            return False
+
+    def test_progress_validation(self):
+        """Non-numeric watch_percentage is a 400, not a 500"""
+        self.log("\n🧪 Test: Progress Validation")
+
+        try:
+            single = self.admin_session.post(
+                f"{BACKEND_URL}/lessons/{self.test_lesson_id}/progress", json={"watch_percentage": "half"}
+            )
+            batch = self.admin_session.post(
+                f"{BACKEND_URL}/lessons/progress/batch",
+                json={"items": [{"lesson_id": self.test_lesson_id, "watch_percentage": None}]}
+            )
+            if single.status_code == 400 and batch.status_code == 400:
+                self.log("✅ Invalid watch_percentage rejected with 400")
+                return True
+            self.log(f"❌ Expected 400/400, got {single.status_code}/{batch.status_code}", "ERROR")
+            return False
+        except Exception as e:
+            self.log(f"❌ Exception in progress validation test: {e}", "ERROR")
+            return False
+
+    def test_lessons_added_during_reads(self):
+        """Lessons created while progress is being read all show up in total_lessons"""
+        self.log("\n🧪 Test: Lessons Added During Progress Reads")
+
+        try:
+            before = self.get_my_progress()
+            progress_url = f"{BACKEND_URL}/spaces/{self.learning_space_id}/my-progress"
+            lessons_url = f"{BACKEND_URL}/spaces/{self.learning_space_id}/lessons"
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                reads = pool.submit(self.run_concurrently, self.admin_session, "GET", progress_url)
+                creates = pool.submit(
+                    self.run_concurrently, self.admin_session, "POST", lessons_url,
+                    json={"title": f"Concurrency extra lesson {uuid.uuid4().hex[:8]}"}
+                )
+                created = creates.result()
+                reads.result()
+            if any(r.status_code != 200 for r in created):
+                self.log(f"❌ Lesson creation failed: {[r.status_code for r in created]}", "ERROR")
+                return False
+            after = self.get_my_progress()
+
+            for response in created:
+                lesson = response.json()
+                lesson_id = lesson.get('id') or lesson.get('lesson', {}).get('id')
+                self.admin_session.delete(f"{lessons_url}/{lesson_id}")
+            restored = self.get_my_progress()
+
+            if after['total_lessons'] == before['total_lessons'] + len(created) and restored == before:
+                self.log(f"✅ total_lessons went {before['total_lessons']} -> {after['total_lessons']} -> {restored['total_lessons']}")
+                return True
+            self.log(f"❌ Summary went from {before} to {after}, then {restored} after cleanup", "ERROR")
+            return False
+        except Exception as e:
+            self.log(f"❌ Exception in lessons added test: {e}", "ERROR")
+            return False
+
+    def cleanup_test_lesson(self):
+        """Delete the test lesson; its progress must go with it"""
+        self.log("\n🧹 Deleting test lesson")
+
+        try:
+            before = self.get_my_progress()
+            response = self.admin_session.delete(f"{BACKEND_URL}/spaces/{self.learning_space_id}/lessons/{self.test_lesson_id}")
+            if response.status_code != 200:
+                self.log(f"❌ Failed to delete test lesson: {response.status_code}", "ERROR")
+                return False
+            after = self.get_my_progress()
+            if after['total_lessons'] == before['total_lessons'] - 1 and after['completed_lessons'] == before['completed_lessons'] - 1:
+                self.log("✅ Lesson removed from the space summary")
+                return True
+            self.log(f"❌ Summary went from {before} to {after}", "ERROR")
+            return False
+        except Exception as e:
+            self.log(f"❌ Exception deleting test lesson: {e}", "ERROR")
+            return False
+
+    def setup_message_partners(self):
+        """Register users who accept messages from the admin"""
+        self.log("🔧 Registering message partners...")
+
+        try:
+            for i in range(3):
+                session = requests.Session()
+                user_data = {
+                    "email": f"concurrency_{uuid.uuid4().hex[:8]}@test.com",
+                    "password": "testpass123",
+                    "name": f"Concurrency Partner {i}"
+                }
+                response = session.post(f"{BACKEND_URL}/auth/register", json=user_data)
+                if response.status_code != 200:
+                    self.log(f"❌ Failed to register partner: {response.status_code} - {response.text}", "ERROR")
+                    return False
+                session.put(f"{BACKEND_URL}/me/messaging-preferences", json={"allow_messages": True})
+                self.partners.append((session.get(f"{BACKEND_URL}/auth/me").json()['id'], session))
+            self.admin_session.put(f"{BACKEND_URL}/me/messaging-preferences", json={"allow_messages": True})
+            self.log(f"✅ Registered {len(self.partners)} message partners")
+            return True
+        except Exception as e:
+            self.log(f"❌ Exception registering partners: {e}", "ERROR")
+            return False
+
+    def get_all_conversations(self, session, limit=1, headers=None):
+        """Follow X-Next-Cursor through every inbox page; returns (conversations, responses)"""
+        conversations, responses, cursor = [], [], None
+        while True:
+            params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+            response = session.get(f"{BACKEND_URL}/messages/conversations", params=params, headers=headers)
+            response.raise_for_status()
+            responses.append(response)
+            conversations.extend(response.json())
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                return conversations, responses
+
+    def test_concurrent_first_messages(self):
+        """Concurrent first messages to one user open a single conversation with every message unread"""
+        self.log("\n🧪 Test: Concurrent First Messages")
+
+        try:
+            partner_id, partner_session = self.partners[0]
+            url = f"{BACKEND_URL}/messages/direct/{partner_id}"
+            responses = self.run_concurrently(self.admin_session, "POST", url, json={"content": "Concurrent hello"})
+            if any(r.status_code != 200 for r in responses):
+                self.log(f"❌ Sends failed: {[r.status_code for r in responses]}", "ERROR")
+                return False
+
+            conversations, _ = self.get_all_conversations(self.admin_session, limit=50)
+            matching = [c for c in conversations if c.get('user', {}).get('id') == partner_id]
+            partner_view = [c for c in partner_session.get(f"{BACKEND_URL}/messages/conversations").json()
+                            if c.get('user', {}).get('id') == self.admin_id]
+            if len(matching) == 1 and len(partner_view) == 1 and partner_view[0]['unread_count'] == len(responses):
+                self.log(f"✅ One conversation, {partner_view[0]['unread_count']} unread after {len(responses)} concurrent sends")
+                return True
+            self.log(f"❌ Admin sees {len(matching)} conversations, partner sees {partner_view}", "ERROR")
+            return False
+        except Exception as e:
+            self.log(f"❌ Exception in concurrent first messages test: {e}", "ERROR")
+            return False
+
+    def test_conversation_pagination(self):
+        """Paging the inbox one conversation at a time visits each once, with the cursor header exposed to browsers"""
+        self.log("\n🧪 Test: Conversation Pagination")
+
+        try:
+            for partner_id, _ in self.partners[1:]:
+                self.admin_session.post(f"{BACKEND_URL}/messages/direct/{partner_id}", json={"content": "Paging hello"})
+
+            origin = {"Origin": "https://example.com"}
+            conversations, responses = self.get_all_conversations(self.admin_session, headers=origin)
+            exposed = responses[0].headers.get('Access-Control-Expose-Headers', '')
+            if 'X-Next-Cursor' not in exposed:
+                self.log(f"❌ X-Next-Cursor not exposed to browsers (Access-Control-Expose-Headers: {exposed!r})", "ERROR")
+                return False
+
+            keys = [c.get('user', {}).get('id') or c.get('group', {}).get('id') for c in conversations]
+            partner_ids = {partner_id for partner_id, _ in self.partners}
+            if len(keys) == len(set(keys)) and partner_ids <= set(keys):
+                self.log(f"✅ {len(responses)} pages returned {len(keys)} distinct conversations")
+                return True
+            self.log(f"❌ Pages returned {keys}", "ERROR")
+            return False
+        except Exception as e:
+            self.log(f"❌ Exception in conversation pagination test: {e}", "ERROR")
+            return False
+
+    def test_message_cursor_paging(self):
+        """Backward and forward message paging sees every message once, including ones sent concurrently"""
+        self.log("\n🧪 Test: Message Cursor Paging")
+
+        try:
+            partner_id, _ = self.partners[0]
+            url = f"{BACKEND_URL}/messages/direct/{partner_id}"
+            origin = {"Origin": "https://example.com"}
+
+            latest = self.admin_session.get(url, params={"limit": 3}, headers=origin)
+            exposed = latest.headers.get('Access-Control-Expose-Headers', '')
+            if 'X-Before-Cursor' not in exposed or 'X-After-Cursor' not in exposed:
+                self.log(f"❌ Message cursors not exposed to browsers (Access-Control-Expose-Headers: {exposed!r})", "ERROR")
+                return False
+            after_cursor = latest.headers.get('X-After-Cursor')
+            if not after_cursor:
+                self.log("❌ Newest page has no X-After-Cursor", "ERROR")
+                return False
+
+            history, page = list(latest.json()), latest
+            while page.headers.get('X-Before-Cursor'):
+                page = self.admin_session.get(url, params={"limit": 3, "before": page.headers['X-Before-Cursor']})
+                history = page.json() + history
+
+            sent = self.run_concurrently(self.admin_session, "POST", url, json={"content": "Concurrent poll"})
+            newer = []
+            while True:
+                page = self.admin_session.get(url, params={"limit": 3, "after": after_cursor})
+                if not page.json():
+                    break
+                if not page.headers.get('X-Before-Cursor'):
+                    self.log("❌ Forward page has no X-Before-Cursor", "ERROR")
+                    return False
+                newer.extend(page.json())
+                after_cursor = page.headers['X-After-Cursor']
+
+            ids = [m['id'] for m in history + newer]
+            if len(ids) == len(set(ids)) and len(newer) == len(sent):
+                self.log(f"✅ Paged back through {len(history)} messages and forward through {len(newer)} new ones")
+                return True
+            self.log(f"❌ {len(ids)} messages ({len(set(ids))} distinct), {len(newer)} new of {len(sent)} sent", "ERROR")
+            return False
+        except Exception as e:
+            self.log(f"❌ Exception in message cursor test: {e}", "ERROR")
+            return False
+
+    def run_all_tests(self):
+        """Run all concurrency tests"""
+        self.log("🚀 Starting Concurrency and Counter Consistency Testing")
+        self.log("=" * 60)
+
+        tests = [
+            ("Setup Admin Session", self.setup_admin_session),
+            ("Setup Test Post", self.setup_test_post),
+            ("Concurrent Reaction Toggles", self.test_concurrent_reaction_toggles),
+            ("Concurrent Leaderboard Reads", self.test_concurrent_leaderboard_reads),
+            ("Setup Test Lesson", self.setup_test_lesson),
+            ("Concurrent Lesson Completion", self.test_concurrent_lesson_completion),
+            ("Progress Validation", self.test_progress_validation),
+            ("Lessons Added During Progress Reads", self.test_lessons_added_during_reads),
+            ("Cleanup Test Lesson", self.cleanup_test_lesson),
+            ("Setup Message Partners", self.setup_message_partners),
+            ("Concurrent First Messages", self.test_concurrent_first_messages),
+            ("Conversation Pagination", self.test_conversation_pagination),
+            ("Message Cursor Paging", self.test_message_cursor_paging),
+        ]
+
+        passed = 0
+        failed = 0
+
+        for test_name, test_func in tests:
+            try:
+                if test_func():
+                    passed += 1
+                else:
+                    failed += 1
+                    self.log(f"❌ {test_name} FAILED", "ERROR")
+            except Exception as e:
+                failed += 1
+                self.log(f"❌ {test_name} FAILED with exception: {e}", "ERROR")
+
+        self.log("\n" + "=" * 60)
+        self.log("🏁 CONCURRENCY TEST SUMMARY")
+        self.log("=" * 60)
+        self.log(f"✅ Passed: {passed}")
+        self.log(f"❌ Failed: {failed}")
+        self.log(f"📊 Total: {passed + failed}")
+
+        if failed == 0:
+            self.log("🎉 ALL TESTS PASSED! Counters and cursors are consistent under concurrency.")
+            return True
+        else:
+            self.log(f"⚠️ {failed} test(s) failed. Please review the issues above.")
+            return False
+
+def main():
+    """Main function to run the tests"""
+    tester = ConcurrencyTester()
+    success = tester.run_all_tests()
+    sys.exit(0 if success else 1)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import { useState, useEffect, useRef } from 'react';
 import { Bell, X } from 'lucide-react';
 import { notificationsAPI } from '../lib/api';
+import { subscribeToNotifications } from '../lib/notificationStream';
 import { useNavigate } from 'react-router-dom';
 import { Button } from './ui/button';
 
@@ -78,9 +79,24 @@ export default function NotificationBell() {
 
   useEffect(() => {
     loadUnreadCount();
-    // Poll for new notifications every 30 seconds
-    const interval = setInterval(loadUnreadCount, 30000);
-    return () => clearInterval(interval);
+    // Unread count is pushed over one notification stream shared by all tabs; poll every
+    // 30 seconds only while that stream is down
+    let interval = null;
+    const startPolling = () => {
+      if (!interval) interval = setInterval(loadUnreadCount, 30000);
+    };
+    const stopPolling = () => {
+      clearInterval(interval);
+      interval = null;
+    };
+    const unsubscribe = subscribeToNotifications(
+      (event) => setUnreadCount(event.unread_count),
+      (connected) => (connected ? stopPolling() : startPolling())
+    );
+    return () => {
+      unsubscribe();
+      stopPolling();
+    };
   }, []);
 
   useEffect(() => {
@@ -78,6 +78,8 @@ export default function SpaceFeed({ spaceId, isQAMode = false }) {
   const { user } = useAuth();
   const navigate = useNavigate();
   const [posts, setPosts] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [postContent, setPostContent] = useState('');
   const [posting, setPosting] = useState(false);
@@ -177,8 +179,9 @@ export default function SpaceFeed({ spaceId, isQAMode = false }) {
     }
     
     try {
-      const { data } = await postsAPI.getSpacePosts(spaceId);
-      setPosts(data);
+      const { data } = await postsAPI.getSpaceFeed(spaceId);
+      setPosts([...data.pinned, ...data.posts]);
+      setNextCursor(data.next_cursor);
     } catch (error) {
       toast.error('Failed to load posts');
     } finally {
@@ -186,6 +189,21 @@ export default function SpaceFeed({ spaceId, isQAMode = false }) {
     }
   };
 
+  const loadMorePosts = async () => {
+    if (!nextCursor || loadingMore) return;
+
+    setLoadingMore(true);
+    try {
+      const { data } = await postsAPI.getSpaceFeed(spaceId, nextCursor);
+      setPosts(prevPosts => [...prevPosts, ...data.posts]);
+      setNextCursor(data.next_cursor);
+    } catch (error) {
+      toast.error('Failed to load more posts');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleCreatePost = async (e) => {
     e.preventDefault();
     if (!postContent.trim() || postContent === '<p></p>') return;
@@ -548,14 +566,13 @@ export default function SpaceFeed({ spaceId, isQAMode = false }) {
     }
   };
 
-  const getReactionCount = (reactions) => {
-    if (!reactions || typeof reactions !== 'object') return 0;
-    return Object.values(reactions).flat().length;
+  const getReactionCount = (post) => {
+    if (!post?.reaction_counts || typeof post.reaction_counts !== 'object') return 0;
+    return Object.values(post.reaction_counts).reduce((total, count) => total + count, 0);
   };
 
-  const hasUserReacted = (reactions) => {
-    if (!reactions || typeof reactions !== 'object') return false;
-    return Object.values(reactions).flat().includes(user?.id);
+  const hasUserReacted = (post) => {
+    return Boolean(post?.reacted_by_me);
   };
 
   if (loading) {
@@ -981,11 +998,11 @@ export default function SpaceFeed({ spaceId, isQAMode = false }) {
                       className="flex items-center gap-2 hover:text-red-500 transition-colors"
                     >
                       <Heart 
-                        className={`h-5 w-5 ${hasUserReacted(post.reactions) ? 'fill-red-500 text-red-500' : ''}`}
-                        style={{ color: hasUserReacted(post.reactions) ? '#EF4444' : '#9CA3AF' }} 
+                        className={`h-5 w-5 ${hasUserReacted(post) ? 'fill-red-500 text-red-500' : ''}`}
+                        style={{ color: hasUserReacted(post) ? '#EF4444' : '#9CA3AF' }} 
                       />
                       <span className="text-base" style={{ color: '#1F2937' }}>
-                        {getReactionCount(post.reactions)}
+                        {getReactionCount(post)}
                       </span>
                     </button>
 
@@ -1148,11 +1165,11 @@ export default function SpaceFeed({ spaceId, isQAMode = false }) {
                   className="flex items-center gap-2 px-3 py-2 rounded-lg hover:bg-gray-50 transition-colors"
                 >
                   <Heart
-                    className={`h-5 w-5 ${hasUserReacted(post.reactions) ? 'fill-red-500 text-red-500' : ''}`}
-                    style={{ color: hasUserReacted(post.reactions) ? '#EF4444' : '#8E8E8E' }}
+                    className={`h-5 w-5 ${hasUserReacted(post) ? 'fill-red-500 text-red-500' : ''}`}
+                    style={{ color: hasUserReacted(post) ? '#EF4444' : '#8E8E8E' }}
                   />
                   <span className="text-sm font-medium" style={{ color: '#3B3B3B' }}>
-                    {getReactionCount(post.reactions)}
+                    {getReactionCount(post)}
                   </span>
                 </button>
                 <button
@@ -1169,6 +1186,24 @@ export default function SpaceFeed({ spaceId, isQAMode = false }) {
             );
           })
         )}
+        {nextCursor && (
+          <div className="flex justify-center pt-2">
+            <Button
+              variant="outline"
+              onClick={loadMorePosts}
+              disabled={loadingMore}
+            >
+              {loadingMore ? (
+                <>
+                  <Loader2 className="h-4 w-4 mr-2 animate-spin" />
+                  Loading...
+                </>
+              ) : (
+                'Load more posts'
+              )}
+            </Button>
+          </div>
+        )}
         </div>
       )}
 
@@ -143,13 +143,13 @@ export const messagingAPI = {
   
   // Conversations
   getConversations: () => api.get('/messages/conversations'),
-  getDirectMessages: (userId) => api.get(`/messages/direct/${userId}`),
+  getDirectMessages: (userId, params) => api.get(`/messages/direct/${userId}`, { params }),
   sendDirectMessage: (userId, content) => api.post(`/messages/direct/${userId}`, { content }),
   
   // Groups
   getMyGroups: () => api.get('/messages/my-groups'),
   createGroup: (data) => api.post('/messages/groups', data),
-  getGroupMessages: (groupId) => api.get(`/messages/groups/${groupId}`),
+  getGroupMessages: (groupId, params) => api.get(`/messages/groups/${groupId}`, { params }),
   sendGroupMessage: (groupId, content) => api.post(`/messages/groups/${groupId}`, { content }),
   getGroupDetails: (groupId) => api.get(`/messages/groups/${groupId}/details`),
   addGroupMember: (groupId, memberId) => api.post(`/messages/groups/${groupId}/members/${memberId}`),
@@ -161,6 +161,7 @@ export const messagingAPI = {
 export const notificationsAPI = {
   getNotifications: (limit = 50) => api.get('/notifications', { params: { limit } }),
   getUnreadCount: () => api.get('/notifications/unread-count'),
+  getStreamUrl: () => `${API_URL}/notifications/stream`,
   markAsRead: (notificationId) => api.put(`/notifications/${notificationId}/read`),
   markAllAsRead: () => api.put('/notifications/mark-all-read'),
   deleteNotification: (notificationId) => api.delete(`/notifications/${notificationId}`),
@@ -207,6 +208,7 @@ export const usersAPI = {
 // Posts API
 export const postsAPI = {
   getSpacePosts: (spaceId, skip = 0, limit = 20) => api.get(`/spaces/${spaceId}/posts`, { params: { skip, limit } }),
+  getSpaceFeed: (spaceId, cursor = null, limit = 20) => api.get(`/spaces/${spaceId}/feed`, { params: { cursor, limit } }),
   createPost: (data) => api.post('/posts', data),
   reactToPost: (postId, emoji) => api.post(`/posts/${postId}/react`, null, { params: { emoji } }),
   getComments: (postId) => api.get(`/posts/${postId}/comments`),
@@ -239,7 +241,9 @@ export const learningAPI = {
   
   // Progress Tracking
   updateProgress: (lessonId, progressData) => api.post(`/lessons/${lessonId}/progress`, progressData),
+  updateProgressBatch: (items) => api.post('/lessons/progress/batch', { items }),
   getMyProgress: (spaceId) => api.get(`/spaces/${spaceId}/my-progress`),
+  getMyLearningProgress: () => api.get('/me/learning-progress'),
   
   // Notes
   getNotes: (lessonId) => api.get(`/lessons/${lessonId}/notes`),
@@ -0,0 +1,133 @@
+import { notificationsAPI } from './api';
+
+// One notification stream per browser instead of one EventSource per tab: an HTTP/1.1 host
+// only gets ~6 connections, and every tab may already hold a MessagesPage WebSocket.
+// Tabs elect a leader with the Web Locks API and share events over a BroadcastChannel. The
+// leader opens the SSE stream, but only while its own tab has no WebSocket open; when one is,
+// notifications arrive on the socket and are shared the same way. Browsers without
+// BroadcastChannel or Web Locks fall back to a stream per tab.
+
+const CHANNEL_NAME = 'notification-stream';
+const LOCK_NAME = 'notification-stream-leader';
+
+const listeners = new Set();
+const channel = typeof BroadcastChannel !== 'undefined' ? new BroadcastChannel(CHANNEL_NAME) : null;
+const canElect = channel && typeof navigator !== 'undefined' && navigator.locks;
+
+let isLeader = false;
+let electing = false;
+let socketOpen = false;
+let source = null;
+let sourceOpen = false;
+let connected = false;
+
+const notify = (event) => listeners.forEach((listener) => listener.onEvent(event));
+
+const setConnected = (value) => {
+  connected = value;
+  listeners.forEach((listener) => listener.onStatus(value));
+};
+
+const share = (message) => {
+  if (channel) channel.postMessage(message);
+};
+
+// Leader only: tell other tabs whether notifications are currently flowing
+const shareStatus = () => {
+  const value = socketOpen || sourceOpen;
+  setConnected(value);
+  share({ kind: 'status', connected: value });
+};
+
+const closeSource = () => {
+  if (source) {
+    source.close();
+    source = null;
+    sourceOpen = false;
+  }
+};
+
+const openSource = () => {
+  if (source) return;
+  source = new EventSource(notificationsAPI.getStreamUrl(), { withCredentials: true });
+  const forward = (event) => publishNotificationEvent(JSON.parse(event.data));
+  source.addEventListener('notification', forward);
+  source.addEventListener('unread_notifications', forward);
+  source.onopen = () => {
+    sourceOpen = true;
+    shareStatus();
+  };
+  source.onerror = () => {
+    sourceOpen = false;
+    shareStatus();
+  };
+};
+
+// Open SSE only in the leader, only while something listens, and only without a WebSocket
+const sync = () => {
+  if (isLeader && listeners.size > 0 && !socketOpen) {
+    openSource();
+  } else {
+    closeSource();
+  }
+  if (isLeader) shareStatus();
+};
+
+const elect = () => {
+  if (electing) return;
+  electing = true;
+  if (!canElect) {
+    isLeader = true;
+    sync();
+    return;
+  }
+  // The lock is held until this tab closes; the next tab waiting on it takes over
+  navigator.locks.request(LOCK_NAME, () => new Promise(() => {
+    isLeader = true;
+    sync();
+  }));
+};
+
+if (channel) {
+  channel.onmessage = ({ data }) => {
+    if (data.kind === 'event') {
+      notify(data.event);
+    } else if (data.kind === 'status') {
+      setConnected(data.connected);
+    } else if (data.kind === 'status_request' && isLeader) {
+      shareStatus();
+    }
+  };
+}
+
+/**
+ * Deliver a notification/unread_notifications event to every listener in every tab.
+ * Called by the SSE stream and by MessagesPage for frames on its WebSocket.
+ */
+export const publishNotificationEvent = (event) => {
+  notify(event);
+  share({ kind: 'event', event });
+};
+
+/** MessagesPage reports its WebSocket state so the leader can drop the SSE stream while it is open */
+export const setNotificationSocketOpen = (open) => {
+  socketOpen = open;
+  sync();
+};
+
+/**
+ * Listen for notification events. onStatus(connected) reports whether events are flowing
+ * so callers can fall back to polling. Returns an unsubscribe function.
+ */
+export const subscribeToNotifications = (onEvent, onStatus = () => {}) => {
+  const listener = { onEvent, onStatus };
+  listeners.add(listener);
+  onStatus(connected);
+  elect();
+  sync();
+  share({ kind: 'status_request' });
+  return () => {
+    listeners.delete(listener);
+    sync();
+  };
+};
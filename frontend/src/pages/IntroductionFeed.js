@@ -147,14 +147,13 @@ export default function IntroductionFeed() {
     }
   };
 
-  const getReactionCount = (reactions) => {
-    if (!reactions || typeof reactions !== 'object') return 0;
-    return Object.values(reactions).flat().length;
+  const getReactionCount = (post) => {
+    if (!post?.reaction_counts || typeof post.reaction_counts !== 'object') return 0;
+    return Object.values(post.reaction_counts).reduce((total, count) => total + count, 0);
   };
 
-  const hasUserReacted = (reactions) => {
-    if (!reactions || typeof reactions !== 'object') return false;
-    return Object.values(reactions).flat().includes(user?.id);
+  const hasUserReacted = (post) => {
+    return Boolean(post?.reacted_by_me);
   };
 
   if (loading) {
@@ -298,11 +297,11 @@ export default function IntroductionFeed() {
                   className="flex items-center gap-2 px-3 py-2 rounded-lg hover:bg-gray-50 transition-colors"
                 >
                   <Heart
-                    className={`h-5 w-5 ${hasUserReacted(post.reactions) ? 'fill-red-500 text-red-500' : ''}`}
-                    style={{ color: hasUserReacted(post.reactions) ? '#EF4444' : '#8E8E8E' }}
+                    className={`h-5 w-5 ${hasUserReacted(post) ? 'fill-red-500 text-red-500' : ''}`}
+                    style={{ color: hasUserReacted(post) ? '#EF4444' : '#8E8E8E' }}
                   />
                   <span className="text-sm font-medium" style={{ color: '#3B3B3B' }}>
-                    {getReactionCount(post.reactions)}
+                    {getReactionCount(post)}
                   </span>
                 </button>
                 <button
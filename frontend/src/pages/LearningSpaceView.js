@@ -110,6 +110,14 @@ export default function LearningSpaceView() {
   };
 
   const fetchLessonData = async (lessonId) => {
+    // Fetch lesson content (the outline only carries lesson metadata)
+    try {
+      const lessonResponse = await learningAPI.getLesson(lessonId);
+      setSelectedLesson(prev => (prev && prev.id === lessonId ? { ...prev, content: lessonResponse.data.content } : prev));
+    } catch (error) {
+      console.error('Error fetching lesson content:', error);
+    }
+
     // Fetch notes
     try {
       const notesResponse = await learningAPI.getNotes(lessonId);
@@ -332,14 +340,26 @@ export default function LearningSpaceView() {
     setShowLessonForm(true);
   };
 
-  const handleEditLesson = (lesson) => {
+  const handleEditLesson = async (lesson) => {
+    // Outline lessons have no content; load it before opening the editor
+    let content = lesson.content;
+    if (content === undefined) {
+      try {
+        const response = await learningAPI.getLesson(lesson.id);
+        content = response.data.content;
+      } catch (error) {
+        console.error('Error fetching lesson content:', error);
+        toast.error('Failed to load lesson content');
+        return;
+      }
+    }
     setEditingLesson(lesson);
     setLessonForm({
       section_id: lesson.section_id || '',
       title: lesson.title,
       description: lesson.description || '',
       video_url: lesson.video_url || '',
-      content: lesson.content || '',
+      content: content || '',
       order: lesson.order,
       duration: lesson.duration || null
     });
@@ -1,6 +1,7 @@
 import { useState, useEffect, useRef } from 'react';
 import { useAuth } from '../hooks/useAuth';
 import { messagingAPI, membersAPI } from '../lib/api';
+import { publishNotificationEvent, setNotificationSocketOpen } from '../lib/notificationStream';
 import Header from '../components/Header';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
@@ -51,8 +52,10 @@ export default function MessagesPage() {
     
     return () => {
       if (wsRef.current) {
+        wsRef.current.onclose = null;
         wsRef.current.close();
       }
+      setNotificationSocketOpen(false);
     };
   }, []);
 
@@ -78,12 +81,23 @@ export default function MessagesPage() {
     
     wsRef.current.onopen = () => {
       console.log('WebSocket connected');
+      // Notifications now arrive on this socket, so the shared SSE stream can close
+      setNotificationSocketOpen(true);
     };
     
     wsRef.current.onmessage = (event) => {
       const data = JSON.parse(event.data);
+      if (data.type === 'ping') {
+        wsRef.current.send(JSON.stringify({ type: 'pong' }));
+        return;
+      }
       console.log('WebSocket message received:', data);
       
+      if (data.type === 'notification' || data.type === 'unread_notifications') {
+        publishNotificationEvent(data);
+        return;
+      }
+      
       if (data.type === 'new_message' || data.type === 'new_group_message') {
         // If message is from current conversation, add it
         if (selectedConversation) {
@@ -112,6 +126,7 @@ export default function MessagesPage() {
     
     wsRef.current.onclose = () => {
       console.log('WebSocket disconnected, reconnecting in 3s...');
+      setNotificationSocketOpen(false);
       setTimeout(() => connectWebSocket(), 3000);
     };
   };
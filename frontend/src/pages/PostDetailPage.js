@@ -114,7 +114,7 @@ export default function PostDetailPage() {
   const handleReaction = async () => {
     if (!post) return;
     
-    const hasReacted = hasUserReacted(post.reactions);
+    const hasReacted = hasUserReacted(post);
     
     try {
       await postsAPI.reactToPost(postId, '❤️');
@@ -172,14 +172,13 @@ export default function PostDetailPage() {
     }
   };
 
-  const getReactionCount = (reactions) => {
-    if (!reactions || typeof reactions !== 'object') return 0;
-    return Object.values(reactions).flat().length;
+  const getReactionCount = (post) => {
+    if (!post?.reaction_counts || typeof post.reaction_counts !== 'object') return 0;
+    return Object.values(post.reaction_counts).reduce((total, count) => total + count, 0);
   };
 
-  const hasUserReacted = (reactions) => {
-    if (!reactions || typeof reactions !== 'object') return false;
-    return Object.values(reactions).flat().includes(user?.id);
+  const hasUserReacted = (post) => {
+    return Boolean(post?.reacted_by_me);
   };
 
   const getSpaceName = () => {
@@ -219,7 +218,7 @@ export default function PostDetailPage() {
     );
   }
 
-  const hasReacted = hasUserReacted(post.reactions);
+  const hasReacted = hasUserReacted(post);
 
   return (
     <div className="min-h-screen flex flex-col">
@@ -377,7 +376,7 @@ export default function PostDetailPage() {
               <Heart
                 className={`h-5 w-5 ${hasReacted ? 'fill-current' : ''}`}
               />
-              <span className="font-medium">{getReactionCount(post.reactions)}</span>
+              <span className="font-medium">{getReactionCount(post)}</span>
             </button>
             <div className="flex items-center gap-2" style={{ color: '#6B7280' }}>
               <MessageCircle className="h-5 w-5" />
@@ -136,6 +136,35 @@ class ReactionPointsTester:
             self.log(f"❌ Exception creating test post: {e}", "ERROR")
             return False
     
+    def check_reaction_state(self, state, emoji, expected_count, label):
+        """Assert reaction_counts / my_reactions / reacted_by_me on a post or comment payload"""
+        count = state.get('reaction_counts', {}).get(emoji, 0)
+        mine = emoji in state.get('my_reactions', [])
+        expected_mine = expected_count > 0
+        if count == expected_count and mine == expected_mine and state.get('reacted_by_me') == expected_mine:
+            self.log(f"✅ {label}: {emoji} count {count}, reacted_by_me {mine}")
+            return True
+        self.log(f"❌ {label}: expected {emoji} count {expected_count} / reacted_by_me {expected_mine}, got "
+                 f"count {count}, my_reactions {state.get('my_reactions')}, reacted_by_me {state.get('reacted_by_me')}", "ERROR")
+        return False
+    
+    def find_space_post(self):
+        """The test post as listed by GET /spaces/{space_id}/posts (with the caller's reaction state)"""
+        response = self.admin_session.get(f"{BACKEND_URL}/spaces/{self.test_space_id}/posts?limit=100")
+        if response.status_code != 200:
+            return None
+        return next((post for post in response.json() if post['id'] == self.test_post_id), None)
+    
+    def verify_post_reaction(self, react_response, emoji, expected_count):
+        """Check the toggle's response and the listed post agree on the reaction state"""
+        if not self.check_reaction_state(react_response.json(), emoji, expected_count, "React response"):
+            return False
+        post = self.find_space_post()
+        if post is None:
+            self.log("❌ Test post not found in space posts", "ERROR")
+            return False
+        return self.check_reaction_state(post, emoji, expected_count, "Space posts")
+    
     def react_to_post(self):
         """React to the test post and verify points increase"""
         self.log("\n🧪 Step 3: Reacting to Post (Add Reaction)")
@@ -151,14 +180,8 @@ class ReactionPointsTester:
                 self.log("✅ Reaction added successfully")
                 
                 # Verify reaction was added
-                post_response = self.admin_session.get(f"{BACKEND_URL}/posts/{self.test_post_id}")
-                if post_response.status_code == 200:
-                    post_data = post_response.json()
-                    reactions = post_data.get('reactions', {})
-                    if '👍' in reactions and len(reactions['👍']) > 0:
-                        self.log("✅ Reaction verified in post data")
-                    else:
-                        self.log("⚠️ Reaction not found in post data", "WARNING")
+                if not self.verify_post_reaction(response, '👍', 1):
+                    return False
                 
                 # Get points after reaction
                 me_response = self.admin_session.get(f"{BACKEND_URL}/auth/me")
@@ -199,14 +222,8 @@ class ReactionPointsTester:
                 self.log("✅ Reaction removed successfully")
                 
                 # Verify reaction was removed
-                post_response = self.admin_session.get(f"{BACKEND_URL}/posts/{self.test_post_id}")
-                if post_response.status_code == 200:
-                    post_data = post_response.json()
-                    reactions = post_data.get('reactions', {})
-                    if '👍' not in reactions or len(reactions.get('👍', [])) == 0:
-                        self.log("✅ Reaction removal verified in post data")
-                    else:
-                        self.log("⚠️ Reaction still found in post data", "WARNING")
+                if not self.verify_post_reaction(response, '👍', 0):
+                    return False
                 
                 # Get points after unreaction
                 me_response = self.admin_session.get(f"{BACKEND_URL}/auth/me")
@@ -325,6 +342,8 @@ class ReactionPointsTester:
                     react_response = self.admin_session.post(f"{BACKEND_URL}/comments/{self.test_comment_id}/react?emoji=❤️")
                     if react_response.status_code == 200:
                         self.log("✅ Comment reaction added successfully")
+                        if not self.check_reaction_state(react_response.json(), '❤️', 1, "Comment react response"):
+                            return False
                         
                         # Check points increased
                         me_response = self.admin_session.get(f"{BACKEND_URL}/auth/me")
@@ -343,6 +362,8 @@ class ReactionPointsTester:
                             unreact_response = self.admin_session.post(f"{BACKEND_URL}/comments/{self.test_comment_id}/react?emoji=❤️")
                             if unreact_response.status_code == 200:
                                 self.log("✅ Comment reaction removed successfully")
+                                if not self.check_reaction_state(unreact_response.json(), '❤️', 0, "Comment unreact response"):
+                                    return False
                                 
                                 # Check points decreased
                                 me_response = self.admin_session.get(f"{BACKEND_URL}/auth/me")